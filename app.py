@@ -2,26 +2,99 @@ import os
 import uuid
 import json
 import time
-import hashlib
-import secrets
-from flask import Flask, render_template, request, jsonify, url_for, send_from_directory, make_response, abort
+import re
+import mimetypes
+import threading
+from functools import partial
+from concurrent.futures import TimeoutError as FutureTimeoutError, wait as wait_futures
+from flask import Flask, Request, Response, g, render_template, request, jsonify, url_for, send_from_directory, make_response, abort, redirect, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_caching import Cache
-from flask_compress import Compress
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
-import logging
-from logging.handlers import RotatingFileHandler
 from config import config
+from storage import ContentStore
+from object_storage import MediaStorage, create_storage_backend
+from upload_ingest import UploadRejected, ingest_multipart, ingest_stream
+from upload_index import UploadIndex
+from upload_gc import UploadCollector, UsageRecorder
+from tierlist_store import create_tierlist_store
+from tierlist_history import PatchError, RevisionConflict, TierlistHistory, check_patch
+from tierlist_render import RENDER_FORMATS, TierlistRenderer
+from collab import OpRejected, create_collab_sessions, initial_state, normalize_op, tier_label
+from consensus import METHODS as CONSENSUS_METHODS, ConsensusIndex, ranking
+from resumable import UploadSessions, UploadSessionError
+from recognition import RecognitionCache, Recognizer
+from voice_commands import CommandParser
+from tierlist_import import TierlistFormatError, ImportTooLargeError, iter_tierlist_events
+import metrics
+from structured_logging import configure_logging, init_request_logging
+from ratelimit_storage import hybrid_storage_uri
+from assets import DIST_DIR, AssetManifest
+from thumbnails import DERIVATIVE_SIZES, DERIVATIVE_FORMATS, is_image_file, ensure_derivative, queue_derivatives
+from similarity import ImageHashIndex
+from audio import PREVIEW_MIMETYPE, is_audio_file, ensure_audio_derivative, queue_audio_derivatives, waveform_json
+
+class TierListRequest(Request):
+    """request class that lets streaming imports exceed MAX_CONTENT_LENGTH"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'import_tierlist':
+            #the import route enforces its own limit while parsing
+            return app.config['IMPORT_STREAM_MAX_BYTES'] + 64 * 1024
+        return super().max_content_length
 
 app = Flask(__name__)
+app.request_class = TierListRequest
 
 # Load configuration based on environment
 env = os.environ.get('FLASK_ENV', 'development')
 app.config.from_object(config[env])
 
+# Request metrics, registered before the other extensions so the timing
+# includes rate limiting and security headers
+slow_request_profiler = None
+if app.config['PROFILE_SLOW_REQUESTS_MS'] > 0:
+    slow_request_profiler = metrics.SlowRequestProfiler(
+        threshold=app.config['PROFILE_SLOW_REQUESTS_MS'] / 1000,
+        interval=app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000,
+        output_dir=app.config['PROFILE_OUTPUT_DIR']
+    )
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if slow_request_profiler:
+        slow_request_profiler.begin()
+
+@app.after_request
+def record_request_metrics(response):
+    """observe request latency (runs last of the after_request hooks)"""
+    started = g.get('request_started')
+    if started is not None:
+        duration = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        metrics.REQUEST_LATENCY.labels(
+            endpoint=endpoint, method=request.method, status=response.status_code
+        ).observe(duration)
+        if slow_request_profiler:
+            slow_request_profiler.end(duration, endpoint)
+    return response
+
+# Media storage: the upload folder, or a bucket browsers transfer media to and
+# from directly (the CSP below allows its origin)
+storage_backend = create_storage_backend(
+    app.config['MEDIA_STORAGE_URL'],
+    app.config['UPLOAD_FOLDER'],
+    app.config['SECRET_KEY'],
+    access_key=app.config.get('MEDIA_STORAGE_ACCESS_KEY'),
+    secret_key=app.config.get('MEDIA_STORAGE_SECRET_KEY')
+)
+
 # Security middleware setup
 if env == 'production':
     # Trust proxy headers in production
@@ -44,15 +117,16 @@ if env == 'production':
         ],
         'img-src': ["'self'", "data:", "blob:"],
         'media-src': ["'self'", "data:", "blob:"],
-        'connect-src': [
-            "'self'",
-            "https://ai.hackclub.com"  # Required for AI image recognition
-        ],
+        'connect-src': ["'self'"],  # AI calls are proxied by /recognize and /commands/parse
         'font-src': ["'self'", "data:"],
         'object-src': "'none'",
         'base-uri': "'self'",
         'form-action': "'self'"
     }
+    if storage_backend.origin:
+        #presigned uploads and redirected downloads go to the bucket
+        for directive in ('img-src', 'media-src', 'connect-src'):
+            csp[directive] = [*csp[directive], storage_backend.origin]
     
     # Initialize Talisman for security headers
     Talisman(app, 
@@ -64,94 +138,146 @@ if env == 'production':
     )
 
 # Rate limiting
+limiter_storage_uri = app.config.get('CACHE_REDIS_URL', 'memory://')
+limiter_storage_options = {}
+if app.config['RATELIMIT_HYBRID'] and hybrid_storage_uri(limiter_storage_uri) != limiter_storage_uri:
+    limiter_storage_uri = hybrid_storage_uri(limiter_storage_uri)
+    limiter_storage_options = {'sync_interval': app.config['RATELIMIT_SYNC_INTERVAL']}
 limiter = Limiter(
-    app,
-    key_func=get_remote_address,
+    get_remote_address,
+    app=app,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri=app.config.get('CACHE_REDIS_URL', 'memory://')
+    storage_uri=limiter_storage_uri,
+    storage_options=limiter_storage_options
 )
 
 # Initialize extensions
 cache = Cache(app)
-compress = Compress(app)
+asset_manifest = AssetManifest(app.static_folder)
+app.jinja_env.globals['asset_url'] = asset_manifest.url
+metrics.instrument_cache(cache)
+metrics.instrument_limiter(limiter)
+content_store = ContentStore(app.config['UPLOAD_FOLDER'])
+media_storage = MediaStorage(content_store, storage_backend)
+#direct (presigned) uploads: a bucket takes large files in one PUT, the local
+#backend still receives them as one app request
+if storage_backend.remote:
+    DIRECT_UPLOAD_MAX_BYTES = max(app.config['MAX_CONTENT_LENGTH'], app.config['RESUMABLE_MAX_BYTES'])
+else:
+    DIRECT_UPLOAD_MAX_BYTES = app.config['MAX_CONTENT_LENGTH']
+if app.config['DIRECT_UPLOADS']:
+    direct_uploads_enabled = app.config['DIRECT_UPLOADS'] == 'true'
+else:
+    direct_uploads_enabled = storage_backend.remote
+#largest file the browser sends straight to storage (0: always use /upload)
+app.jinja_env.globals['direct_upload_max'] = DIRECT_UPLOAD_MAX_BYTES if direct_uploads_enabled else 0
+upload_index = UploadIndex(
+    app.config['UPLOAD_FOLDER'],
+    redis_url=app.config.get('UPLOAD_INDEX_REDIS_URL'),
+    refresh_interval=app.config['UPLOAD_INDEX_REFRESH_INTERVAL']
+)
+upload_index.build()
+tierlist_store = create_tierlist_store(app.config['TIERLIST_STORE_URL'])
+tierlist_history = TierlistHistory(
+    tierlist_store,
+    snapshot_interval=app.config['TIERLIST_SNAPSHOT_INTERVAL'],
+    cache_size=app.config['TIERLIST_HEAD_CACHE_SIZE'],
+    max_tiers=app.config['MAX_IMPORT_TIERS'],
+    max_ops=app.config['TIERLIST_PATCH_MAX_OPS']
+)
+recognizer = Recognizer(
+    RecognitionCache(
+        app.config['RECOGNITION_CACHE_PATH'],
+        ttl=app.config['RECOGNITION_CACHE_TTL'],
+        max_entries=app.config['RECOGNITION_CACHE_MAX_ENTRIES']
+    ),
+    api_url=app.config['RECOGNITION_API_URL'],
+    model=app.config.get('RECOGNITION_MODEL'),
+    timeout=app.config['RECOGNITION_TIMEOUT'],
+    concurrency=app.config['RECOGNITION_CONCURRENCY']
+)
+command_parser = CommandParser(
+    api_url=app.config['COMMAND_PARSE_API_URL'],
+    model=app.config.get('COMMAND_PARSE_MODEL'),
+    timeout=app.config['COMMAND_PARSE_TIMEOUT'],
+    cache_size=app.config['COMMAND_PARSE_CACHE_SIZE'],
+    concurrency=app.config['COMMAND_PARSE_CONCURRENCY'],
+    batch_timeout=app.config['COMMAND_PARSE_BATCH_SECONDS']
+)
+upload_collector = UploadCollector(
+    content_store, tierlist_store, upload_index,
+    grace_period=app.config['UPLOAD_GC_GRACE_DAYS'] * 86400,
+    render_cache_period=app.config['RENDER_CACHE_DAYS'] * 86400,
+    ops_per_second=app.config['UPLOAD_GC_OPS_PER_SECOND'],
+    remote_media=storage_backend.remote
+)
+#a day between marks, well inside the grace period
+upload_usage = UsageRecorder(content_store, refresh_interval=min(86400, app.config['UPLOAD_GC_GRACE_DAYS'] * 86400 / 4))
+if app.config['UPLOAD_GC_INTERVAL'] > 0:
+    upload_collector.start_background(app.config['UPLOAD_GC_INTERVAL'], dry_run=app.config['UPLOAD_GC_DRY_RUN'])
+image_hashes = ImageHashIndex(app.config['SIMILARITY_INDEX_PATH'])
+tierlist_renderer = TierlistRenderer(
+    app.config['UPLOAD_FOLDER'],
+    max_workers=app.config['THUMBNAIL_WORKERS'],
+    timeout=app.config['RENDER_TIMEOUT']
+)
+consensus_index = ConsensusIndex(app.config['CONSENSUS_INDEX_PATH'], kemeny_items=app.config['CONSENSUS_KEMENY_ITEMS'])
+upload_sessions = UploadSessions(
+    app.config['UPLOAD_FOLDER'],
+    part_size=app.config['RESUMABLE_PART_SIZE'],
+    max_bytes=app.config['RESUMABLE_MAX_BYTES'],
+    ttl=app.config['RESUMABLE_SESSION_TTL']
+)
+collab_sessions = create_collab_sessions(
+    app.config.get('COLLAB_REDIS_URL'),
+    ttl=app.config['COLLAB_SESSION_TTL'],
+    snapshot_interval=app.config['COLLAB_SNAPSHOT_INTERVAL'],
+    queue_size=app.config['COLLAB_QUEUE_SIZE']
+)
+#an open event stream holds a whole thread of a sync/gthread worker, so only
+#a few may be open per worker; under gevent a stream is just a greenlet
+if metrics.gevent_patched():
+    event_stream_slots = None
+else:
+    event_stream_slots = threading.BoundedSemaphore(app.config['COLLAB_THREAD_STREAMS'])
 
-# Logging setup for production
+# Logging setup for production: JSON lines written by a listener thread,
+# so file writes and rotation never happen on the request thread
 if env == 'production' and not app.debug:
-    if not os.path.exists('logs'):
-        os.mkdir('logs')
-    
-    file_handler = RotatingFileHandler(
-        'logs/tierlist.log', 
-        maxBytes=10240000, 
-        backupCount=10
-    )
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
+    configure_logging(app)
     app.logger.info('TierList application startup')
+init_request_logging(app)
 
 # Enhanced file validation
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp3', 'wav', 'ogg', 'm4a', 'aac'}
-ALLOWED_MIMES = {
-    'png': 'image/png',
-    'jpg': 'image/jpeg', 
-    'jpeg': 'image/jpeg',
-    'gif': 'image/gif',
-    'mp3': 'audio/mpeg',
-    'wav': 'audio/wav',
-    'ogg': 'audio/ogg',
-    'm4a': 'audio/mp4',
-    'aac': 'audio/aac'
-}
 MAX_FILES_PER_REQUEST = 10
 MAX_FILENAME_LENGTH = 100
+TIERLIST_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{10,43}')
+DIGEST_PATTERN = re.compile(r'[0-9a-f]{64}')
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{16}')
+DOCUMENT_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{16}')
 
-def validate_file(file):
-    """Enhanced file validation with security checks"""
-    if not file or not file.filename:
+def validate_filename(filename):
+    """check an upload's name before any of its content is read"""
+    if not filename:
         return False, "No file provided"
     
     # Check filename length
-    if len(file.filename) > MAX_FILENAME_LENGTH:
+    if len(filename) > MAX_FILENAME_LENGTH:
         return False, "Filename too long"
     
     # Check file extension
-    if not allowed_file(file.filename):
-        return False, f"File type not allowed: {file.filename}"
-    
-    # Validate MIME type
-    if hasattr(file, 'content_type') and file.content_type:
-        ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-        expected_mime = ALLOWED_MIMES.get(ext)
-        if expected_mime and not file.content_type.startswith(expected_mime.split('/')[0]):
-            return False, f"MIME type mismatch for {file.filename}"
+    if not allowed_file(filename):
+        return False, f"File type not allowed: {filename}"
     
     return True, "Valid file"
+
 def allowed_file(filename):
     """check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def is_audio_file(filename):
-    """check if file is an audio file"""
-    audio_extensions = {'mp3', 'wav', 'ogg', 'm4a', 'aac'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in audio_extensions
-
-def generate_secure_filename(original_filename):
-    """Generate a secure filename with hash"""
-    secured = secure_filename(original_filename)
-    name, ext = os.path.splitext(secured)
-    
-    # Create a hash of the original filename + timestamp for uniqueness
-    hash_input = f"{original_filename}{time.time()}{secrets.token_hex(8)}"
-    file_hash = hashlib.sha256(hash_input.encode()).hexdigest()[:12]
-    
-    return f"{name}_{file_hash}{ext}"
-
 @app.route('/')
-@cache.cached(timeout=3600)  #cache for 1 hour
+@cache.cached(timeout=3600, key_prefix=f'view/index/{asset_manifest.version}')  #cache for 1 hour, per asset build
 def index():
     """main page with tier list interface"""
     response = make_response(render_template('index.html'))
@@ -159,74 +285,103 @@ def index():
     response.headers['Cache-Control'] = 'public, max-age=3600'
     return response
 
+@app.route('/static/dist/<path:filename>')
+@limiter.exempt
+def built_asset(filename):
+    """fingerprinted js/css, served precompressed and cached forever"""
+    if filename.endswith(('.gz', '.br')):
+        abort(404)
+    path, encoding = asset_manifest.precompressed(filename, request.accept_encodings)
+    response = send_from_directory(
+        os.path.join(app.static_folder, DIST_DIR), path,
+        mimetype=mimetypes.guess_type(filename)[0],
+        conditional=True, max_age=None
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def publish_upload(writer, started):
+    """publish a blob stored through the app under its upload name"""
+    return publish_blob(
+        writer.filename, writer.digest, writer.size, writer.original_filename,
+        'deduplicated' if writer.deduplicated else 'stored', started
+    )
+
+def publish_blob(unique_filename, digest, file_size, original_filename, result, started):
+    """make a stored blob available under its upload name and describe it for the client
+
+    ``result`` is the upload metric outcome: stored, deduplicated or direct.
+    Derivatives and hashes are queued when the blob is in the upload folder;
+    direct uploads to a bucket get them on first use instead.
+    """
+    local = media_storage.publish(unique_filename, digest)
+    upload_index.add(unique_filename)
+    metrics.UPLOAD_STORE_LATENCY.observe(time.perf_counter() - started)
+    metrics.UPLOADED_BYTES.inc(file_size)
+    metrics.UPLOADED_FILES.labels(result=result).inc()
+    
+    if local and is_image_file(unique_filename):
+        try:
+            image_hashes.index_upload(app.config['UPLOAD_FOLDER'], unique_filename, digest,
+                                      max_workers=app.config['THUMBNAIL_WORKERS'])
+        except Exception as e:
+            app.logger.warning(f"Could not index {unique_filename} for similarity: {str(e)}")
+    
+    if result == 'deduplicated':
+        app.logger.info(f"File deduplicated: {unique_filename} ({digest[:12]}) by {get_remote_address()}")
+    else:
+        app.logger.info(f"File uploaded successfully: {unique_filename} by {get_remote_address()}")
+        if local and is_image_file(unique_filename):
+            queue_derivatives(app.config['UPLOAD_FOLDER'], unique_filename, digest,
+                              max_workers=app.config['THUMBNAIL_WORKERS'])
+        elif local and is_audio_file(unique_filename):
+            queue_audio_derivatives(app.config['UPLOAD_FOLDER'], unique_filename, digest,
+                                    max_workers=app.config['THUMBNAIL_WORKERS'])
+    
+    return {
+        'filename': unique_filename,
+        'original_name': secure_filename(original_filename),
+        'url': url_for('uploaded_file', filename=unique_filename),
+        'is_audio': is_audio_file(unique_filename),
+        'size': file_size,
+        'digest': digest
+    }
+
 @app.route('/upload', methods=['POST'])
 @limiter.limit("20 per minute")  # Rate limit uploads
 def upload_files():
-    """handle multiple file uploads with enhanced validation and security"""
+    """handle multiple file uploads with enhanced validation and security
+
+    The body is parsed as it arrives: each file is checked by name and magic
+    bytes before anything is written, then streamed once into the content
+    store. Names are only linked after the whole request has been accepted.
+    """
     try:
-        if 'files' not in request.files:
-            app.logger.warning(f"Upload attempt without files from {get_remote_address()}")
-            return jsonify({'error': 'No files uploaded'}), 400
-        
-        files = request.files.getlist('files')
-        if not files:
-            return jsonify({'error': 'No files selected'}), 400
-        
-        # Limit number of files per request
-        if len(files) > MAX_FILES_PER_REQUEST:
-            app.logger.warning(f"Too many files uploaded: {len(files)} from {get_remote_address()}")
-            return jsonify({'error': f'Too many files. Maximum {MAX_FILES_PER_REQUEST} allowed per request'}), 400
+        # Ensure upload directory exists and is secure
+        os.makedirs(app.config['UPLOAD_FOLDER'], mode=0o755, exist_ok=True)
+        started = time.perf_counter()
+        try:
+            writers, errors = ingest_multipart(
+                request.stream, request.content_type, content_store,
+                field_name='files',
+                max_files=MAX_FILES_PER_REQUEST,
+                max_total_bytes=app.config['MAX_CONTENT_LENGTH'],
+                validate_filename=validate_filename
+            )
+        except UploadRejected as e:
+            app.logger.warning(f"Upload rejected: {e.message} from {get_remote_address()}")
+            return jsonify({'error': e.message}), e.status
         
         uploaded_files = []
-        errors = []
-        total_size = 0
-        
-        for file in files:
-            if file.filename == '':
-                continue
-                
-            # Validate file
-            is_valid, message = validate_file(file)
-            if not is_valid:
-                errors.append(message)
-                continue
-            # Check total size
-            file.seek(0, 2)  # Seek to end
-            file_size = file.tell()
-            file.seek(0)  # Reset to beginning
-            total_size += file_size
-            
-            if total_size > app.config['MAX_CONTENT_LENGTH']:
-                errors.append(f'Total upload size too large')
-                break
-                
+        for writer in writers:
             try:
-                #generate secure filename
-                unique_filename = generate_secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                
-                # Ensure upload directory exists and is secure
-                os.makedirs(app.config['UPLOAD_FOLDER'], mode=0o755, exist_ok=True)
-                
-                #save file with error handling
-                file.save(file_path)
-                
-                # Set secure file permissions
-                os.chmod(file_path, 0o644)
-                
-                app.logger.info(f"File uploaded successfully: {unique_filename} by {get_remote_address()}")
-                
-                uploaded_files.append({
-                    'filename': unique_filename,
-                    'original_name': secure_filename(file.filename),
-                    'url': url_for('uploaded_file', filename=unique_filename),
-                    'is_audio': is_audio_file(unique_filename),
-                    'size': file_size
-                })
-                
+                uploaded_files.append(publish_upload(writer, started))
             except Exception as e:
-                app.logger.error(f"Failed to upload {file.filename}: {str(e)}")
-                errors.append(f'Failed to upload {file.filename}: Server error')
+                app.logger.error(f"Failed to upload {writer.original_filename}: {str(e)}")
+                errors.append(f'Failed to upload {writer.original_filename}: Server error')
         
         if errors and not uploaded_files:
             return jsonify({'error': '; '.join(errors)}), 400
@@ -237,15 +392,279 @@ def upload_files():
             
         return jsonify(response_data)
         
+    except HTTPException:
+        raise
     except Exception as e:
         app.logger.error(f"Upload error: {str(e)}")
         return jsonify({'error': 'Upload failed due to server error'}), 500
 
+def direct_upload_entry(entry):
+    """``(name, digest)`` of one file described to the direct upload routes"""
+    if not isinstance(entry, dict) or not isinstance(entry.get('name'), str):
+        raise UploadRejected('Invalid file description')
+    name = entry['name']
+    is_valid, error_msg = validate_filename(name)
+    if not is_valid:
+        raise UploadRejected(error_msg)
+    digest = entry.get('sha256')
+    if not isinstance(digest, str) or not DIGEST_PATTERN.fullmatch(digest):
+        raise UploadRejected(f'Missing or invalid sha256 for {name}')
+    return name, digest
+
+def direct_upload_files():
+    data = request.get_json(silent=True)
+    files = data.get('files') if isinstance(data, dict) else None
+    if not isinstance(files, list) or not files:
+        raise UploadRejected('No files described')
+    if len(files) > MAX_FILES_PER_REQUEST:
+        raise UploadRejected(f'Too many files. Maximum {MAX_FILES_PER_REQUEST} allowed per request')
+    return files
+
+@app.route('/upload/direct', methods=['POST'])
+@limiter.limit("20 per minute")  # Same budget as /upload
+def prepare_direct_upload():
+    """presigned PUT URLs so the browser sends files straight to storage
+
+    Takes ``{"files": [{"name", "size", "sha256"}]}`` and returns each file's
+    upload name with ``upload: {method, url, headers}``, or ``upload: null``
+    when the storage already has the content. The PUT must carry exactly
+    the declared size and digest. Finish with /upload/direct/complete.
+    """
+    try:
+        files = direct_upload_files()
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status
+    
+    prepared = []
+    errors = []
+    for entry in files:
+        try:
+            name, digest = direct_upload_entry(entry)
+            size = entry.get('size')
+            if not isinstance(size, int) or size <= 0:
+                raise UploadRejected(f'Missing or invalid size for {name}')
+            if size > DIRECT_UPLOAD_MAX_BYTES:
+                raise UploadRejected(f'File too large: {name}')
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            prepared.append(media_storage.prepare_upload(
+                name, digest, size, content_type, app.config['DIRECT_UPLOAD_EXPIRES']
+            ))
+        except UploadRejected as e:
+            errors.append(e.message)
+        except Exception as e:
+            app.logger.error(f"Direct upload preparation failed: {str(e)}")
+            errors.append('Storage unavailable')
+    
+    if errors and not prepared:
+        return jsonify({'error': '; '.join(errors)}), 400
+    response_data = {'files': prepared}
+    if errors:
+        response_data['warnings'] = errors
+    return jsonify(response_data)
+
+@app.route('/upload/direct/complete', methods=['POST'])
+@limiter.limit("20 per minute")  # Same budget as /upload
+def complete_direct_upload():
+    """completion callback for direct uploads: validate, link and index
+
+    Takes the same ``{"files": [{"name", "sha256"}]}`` and answers like
+    /upload. Content that is missing, too large or not of its file type is
+    reported (and dropped from storage) instead of being published.
+    """
+    try:
+        files = direct_upload_files()
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status
+    
+    started = time.perf_counter()
+    uploaded_files = []
+    errors = []
+    for entry in files:
+        try:
+            name, digest = direct_upload_entry(entry)
+            filename, size = media_storage.verify_upload(name, digest, DIRECT_UPLOAD_MAX_BYTES)
+            uploaded_files.append(publish_blob(filename, digest, size, name, 'direct', started))
+        except UploadRejected as e:
+            app.logger.warning(f"Direct upload rejected: {e.message} from {get_remote_address()}")
+            errors.append(e.message)
+        except Exception as e:
+            app.logger.error(f"Failed to complete direct upload: {str(e)}")
+            errors.append(f"Failed to upload {entry.get('name') if isinstance(entry, dict) else entry}: Server error")
+    
+    if errors and not uploaded_files:
+        return jsonify({'error': '; '.join(errors)}), 400
+    response_data = {'files': uploaded_files}
+    if errors:
+        response_data['warnings'] = errors
+    return jsonify(response_data)
+
+@app.route('/storage/<path:key>', methods=['GET', 'PUT'])
+@limiter.limit("100 per minute")  # Same budget as file access
+def storage_object(key):
+    """presigned transfers for the local storage backend, standing in for a bucket"""
+    if storage_backend.remote:
+        abort(404)
+    try:
+        expires = int(request.args.get('expires', ''))
+    except ValueError:
+        abort(403)
+    size = request.args.get('size', '')
+    if not storage_backend.verify(request.method, key, expires, request.args.get('signature', ''), size):
+        abort(403)
+    
+    if request.method == 'GET':
+        return serve_upload_path(key, True, 'private, max-age=300')
+    
+    if str(request.content_length) != size:
+        return jsonify({'error': 'Body does not match the declared size'}), 400
+    _, ext = os.path.splitext(os.path.basename(key))
+    try:
+        writer = ingest_stream(request.stream, os.path.basename(key), content_store)
+    except UploadRejected as e:
+        return jsonify({'error': e.message}), e.status
+    if content_store.blob_key(writer.digest, ext) != key:
+        #like a bucket's checksum check: the body is not the content that was signed for
+        if not writer.deduplicated:
+            os.unlink(writer.blob)
+        return jsonify({'error': 'Body does not match the declared sha256'}), 400
+    return '', 200
+
+def redirect_to_storage(filename):
+    """send the client to a presigned URL of an upload's original, None if it has none"""
+    expires = app.config['DOWNLOAD_URL_EXPIRES']
+    url = media_storage.download_url(filename, expires)
+    if url is None:
+        return None
+    response = redirect(url)
+    #the signed URL stays valid for a while, let the browser reuse it
+    response.headers['Cache-Control'] = f"private, max-age={expires // 2}"
+    return response
+
+def serve_upload_path(relpath, etag, cache_control):
+    """send a file below the upload folder without buffering it in Python
+
+    Behind nginx the body is handed off with X-Accel-Redirect, otherwise it
+    is streamed with conditional (ETag/Last-Modified) and Range support.
+    """
+    if request.headers.get('X-Sendfile-Type') == 'X-Accel-Redirect' and app.config.get('X_ACCEL_UPLOADS_PREFIX'):
+        #let nginx serve the bytes (sendfile, ranges, conditionals)
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_UPLOADS_PREFIX'] + relpath.replace(os.sep, '/')
+        response.headers['Content-Type'] = mimetypes.guess_type(relpath)[0] or 'application/octet-stream'
+    else:
+        #conditional=True gives 304/206 handling, file_wrapper gives sendfile
+        response = send_from_directory(
+            app.config['UPLOAD_FOLDER'],
+            relpath,
+            conditional=True,
+            etag=etag,
+            max_age=None
+        )
+    
+    #add security and caching headers
+    response.headers['Cache-Control'] = cache_control
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Accept-Ranges'] = 'bytes'
+    
+    return response
+
+@app.route('/upload/sessions', methods=['POST'])
+@limiter.limit("20 per minute")  # Same budget as /upload
+def create_upload_session():
+    """start a resumable upload: the client then PUTs each part"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename')
+        if not isinstance(filename, str) or not filename:
+            return jsonify({'error': 'No file provided'}), 400
+        is_valid, message = validate_filename(filename)
+        if not is_valid:
+            return jsonify({'error': message}), 400
+        
+        meta = upload_sessions.create(filename, data.get('size'))
+        app.logger.info(f"Upload session {meta['id']} started for {filename} ({meta['size']} bytes) by {get_remote_address()}")
+        return jsonify({
+            'session_id': meta['id'],
+            'part_size': meta['part_size'],
+            'parts': meta['parts']
+        }), 201
+        
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Upload session error: {str(e)}")
+        return jsonify({'error': 'Upload failed due to server error'}), 500
+
+@app.route('/upload/sessions/<session_id>', methods=['GET'])
+@limiter.limit("60 per minute")
+def upload_session_status(session_id):
+    """report which parts have arrived, so a client can resume"""
+    try:
+        meta = upload_sessions.load(session_id)
+        return jsonify({
+            'session_id': session_id,
+            'parts': meta['parts'],
+            'received_parts': upload_sessions.received_parts(session_id)
+        })
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+
+@app.route('/upload/sessions/<session_id>/parts/<int:index>', methods=['PUT'])
+@limiter.limit("600 per minute")  # Many small requests per file
+def upload_session_part(session_id, index):
+    """store one part, verified against the X-Part-SHA256 header if sent"""
+    try:
+        size = upload_sessions.write_part(session_id, index, request.stream, request.headers.get('X-Part-SHA256'))
+        return jsonify({'part': index, 'size': size})
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Upload part error: {str(e)}")
+        return jsonify({'error': 'Upload failed due to server error'}), 500
+
+@app.route('/upload/sessions/<session_id>/complete', methods=['POST'])
+@limiter.limit("20 per minute")
+def complete_upload_session(session_id):
+    """assemble the parts into the content store and end the session"""
+    try:
+        meta, reader = upload_sessions.open_assembled(session_id)
+        started = time.perf_counter()
+        try:
+            writer = ingest_stream(reader, meta['filename'], content_store)
+        finally:
+            reader.close()
+        uploaded = publish_upload(writer, started)
+        upload_sessions.discard(session_id)
+        return jsonify({'files': [uploaded]})
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+    except UploadRejected as e:
+        upload_sessions.discard(session_id)
+        return jsonify({'error': e.message}), e.status
+    except Exception as e:
+        app.logger.error(f"Upload completion error: {str(e)}")
+        return jsonify({'error': 'Upload failed due to server error'}), 500
+
+@app.route('/upload/sessions/<session_id>', methods=['DELETE'])
+@limiter.limit("20 per minute")
+def abort_upload_session(session_id):
+    """drop an upload session and its parts"""
+    try:
+        upload_sessions.load(session_id)
+        upload_sessions.discard(session_id)
+        return '', 204
+    except UploadSessionError as e:
+        return jsonify({'error': e.message}), e.status
+
 @app.route('/uploads/<filename>')
-@cache.cached(timeout=86400)  #cache for 24 hours
 @limiter.limit("100 per minute")  # Rate limit file access
 def uploaded_file(filename):
-    """serve uploaded files with security checks"""
+    """serve uploaded files with security checks
+
+    ``?size=thumb|medium`` serves a downscaled image derivative instead of
+    the original, as webp when the client accepts it (or ``?format=``).
+    ``?size=preview`` serves a short low-bitrate mp3 of an audio upload.
+    """
     try:
         # Validate filename for path traversal attacks
         secured_filename = secure_filename(filename)
@@ -253,31 +672,269 @@ def uploaded_file(filename):
             app.logger.warning(f"Suspicious filename access attempt: {filename} from {get_remote_address()}")
             abort(404)
         
+        size = request.args.get('size')
+        if storage_backend.remote and size is None:
+            #originals come straight from the bucket (legacy files stay local)
+            response = redirect_to_storage(secured_filename)
+            if response is not None:
+                return response
+        
         # Check if file exists and is in uploads directory
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], secured_filename)
-        if not os.path.exists(file_path) or not os.path.commonpath([app.config['UPLOAD_FOLDER'], file_path]) == app.config['UPLOAD_FOLDER']:
+        if not os.path.commonpath([app.config['UPLOAD_FOLDER'], file_path]) == app.config['UPLOAD_FOLDER'] or not media_storage.ensure_local(secured_filename):
             app.logger.warning(f"Invalid file access attempt: {filename} from {get_remote_address()}")
             abort(404)
         
-        response = make_response(send_from_directory(app.config['UPLOAD_FOLDER'], secured_filename))
+        #content-addressed uploads never change, legacy ones may be replaced
+        digest = content_store.resolve(secured_filename)
+        if digest:
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'public, max-age=86400'
         
-        #add security and caching headers
-        response.headers['Cache-Control'] = 'public, max-age=86400'
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['Accept-Ranges'] = 'bytes'
+        if size is None:
+            return serve_upload_path(secured_filename, digest or True, cache_control)
+        
+        key = digest or secured_filename
+        if size == 'preview' and is_audio_file(secured_filename):
+            try:
+                relpath = ensure_audio_derivative(
+                    app.config['UPLOAD_FOLDER'], secured_filename, key, 'preview',
+                    max_workers=app.config['THUMBNAIL_WORKERS'], timeout=app.config['AUDIO_DERIVATIVE_WAIT']
+                )
+            except FutureTimeoutError:
+                #still transcoding in the pool, the original plays meanwhile
+                return serve_upload_path(secured_filename, digest or True, 'no-cache')
+            except (OSError, ValueError) as e:
+                #no ffmpeg or undecodable audio, fall back to the original
+                app.logger.warning(f"Audio preview failed for {secured_filename}: {str(e)}")
+                return serve_upload_path(secured_filename, digest or True, cache_control)
+            response = serve_upload_path(relpath, f"{key}-preview", cache_control)
+            response.headers['Content-Type'] = PREVIEW_MIMETYPE
+            return response
         
+        #downscaled derivative, rendered now if the background pool has not yet
+        if size not in DERIVATIVE_SIZES or not is_image_file(secured_filename):
+            abort(404)
+        fmt = request.args.get('format')
+        if fmt is None:
+            fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+        if fmt not in DERIVATIVE_FORMATS:
+            abort(404)
+        
+        try:
+            relpath = ensure_derivative(app.config['UPLOAD_FOLDER'], secured_filename, key, size, fmt)
+        except (OSError, ValueError) as e:
+            #undecodable image, the original is still better than nothing
+            app.logger.warning(f"Derivative rendering failed for {secured_filename}: {str(e)}")
+            return serve_upload_path(secured_filename, digest or True, cache_control)
+        response = serve_upload_path(relpath, f"{key}-{size}-{fmt}", cache_control)
+        if 'format' not in request.args:
+            response.vary.add('Accept')
         return response
         
+    except HTTPException:
+        raise
     except FileNotFoundError:
         abort(404)
     except Exception as e:
         app.logger.error(f"File serve error: {str(e)}")
         abort(500)
 
+@app.route('/uploads/<filename>/waveform')
+@limiter.limit("100 per minute")  # Same budget as file access
+def upload_waveform(filename):
+    """precomputed waveform peaks of an audio upload
+
+    Served as the binary audiowaveform .dat file, or with ``?format=json``
+    as its JSON equivalent (interleaved min/max int8 pairs).
+    """
+    try:
+        secured_filename = secure_filename(filename)
+        if secured_filename != filename or not is_audio_file(secured_filename):
+            abort(404)
+        if not media_storage.ensure_local(secured_filename):
+            abort(404)
+        fmt = request.args.get('format', 'dat')
+        if fmt not in ('dat', 'json'):
+            abort(404)
+        
+        digest = content_store.resolve(secured_filename)
+        key = digest or secured_filename
+        cache_control = 'public, max-age=31536000, immutable' if digest else 'public, max-age=86400'
+        try:
+            relpath = ensure_audio_derivative(
+                app.config['UPLOAD_FOLDER'], secured_filename, key, 'waveform',
+                max_workers=app.config['THUMBNAIL_WORKERS'], timeout=app.config['AUDIO_DERIVATIVE_WAIT']
+            )
+        except FutureTimeoutError:
+            #the render keeps going in the pool and lands with the derivatives
+            response = jsonify({'error': 'Waveform is still being computed, try again in a few seconds'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        except (OSError, ValueError) as e:
+            app.logger.warning(f"Waveform failed for {secured_filename}: {str(e)}")
+            abort(404)
+        
+        if fmt == 'dat':
+            response = serve_upload_path(relpath, f"{key}-waveform", cache_control)
+            response.headers['Content-Type'] = 'application/octet-stream'
+            return response
+        response = make_response(waveform_json(os.path.join(app.config['UPLOAD_FOLDER'], relpath)))
+        response.headers['Content-Type'] = 'application/json'
+        response.headers['Cache-Control'] = cache_control
+        response.set_etag(f"{key}-waveform-json")
+        return response.make_conditional(request)
+        
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        abort(404)
+    except Exception as e:
+        app.logger.error(f"Waveform serve error: {str(e)}")
+        abort(500)
+
+def mark_in_use(filenames):
+    """keep uploads a tierlist still uses from the upload GC, off the request path"""
+    upload_usage.mark(filenames)
+
+def resolve_import_items(items):
+    """check a batch of imported media entries with one index lookup
+
+    Returns ``(available_files, missing_files)`` in entry order.
+    """
+    filenames = []
+    for file_data in items:
+        filename = file_data.get('filename')
+        # Validate filename for security
+        if filename and isinstance(filename, str) and secure_filename(filename) == filename:
+            filenames.append(filename)
+        else:
+            filenames.append(None)
+    
+    present = upload_index.contains_many(name for name in filenames if name)
+    mark_in_use(present)
+    
+    available_files = []
+    missing_files = []
+    for file_data, filename in zip(items, filenames):
+        if filename is None:
+            continue
+        if filename not in present:
+            missing_files.append(filename)
+            continue
+        available_files.append({
+            'filename': filename,
+            'original_name': file_data.get('original_name', filename),
+            'url': url_for('uploaded_file', filename=filename),
+            'is_audio': file_data.get('is_audio', False)
+        })
+    metrics.IMPORT_ITEMS.labels(result='available').inc(len(available_files))
+    metrics.IMPORT_ITEMS.labels(result='missing').inc(len(missing_files))
+    return available_files, missing_files
+
+def load_tierlist(events):
+    """rebuild a tierlist document from parser events
+
+    Returns the document and the flat list of its media entries.
+    """
+    tierlist_data = {}
+    tiers = []
+    items = []
+    
+    for event in events:
+        kind = event[0]
+        if kind == 'field':
+            tierlist_data[event[1]] = event[2]
+        elif kind == 'tier_start':
+            tiers.append({})
+        elif kind == 'tier_field':
+            tiers[-1][event[2]] = event[3]
+        elif kind == 'item':
+            key, file_data = event[2], event[3]
+            tiers[-1].setdefault(key, []).append(file_data)
+            items.append(file_data)
+    tierlist_data['tiers'] = tiers
+    
+    return tierlist_data, items
+
+def tierlist_error_message(e):
+    """user-facing message for a rejected tierlist document"""
+    if isinstance(e, TierlistFormatError):
+        return f'Invalid tierlist format: {e}'
+    if isinstance(e, ImportTooLargeError):
+        return f'JSON file too large (max {e.max_bytes // (1024 * 1024)}MB)'
+    if isinstance(e, UnicodeDecodeError):
+        return 'File encoding not supported'
+    return 'Invalid JSON format'
+
+TIERLIST_ERRORS = (TierlistFormatError, ImportTooLargeError, json.JSONDecodeError, UnicodeDecodeError)
+
+def stream_import(events):
+    """render tierlist import events as NDJSON lines
+
+    Media entries are flushed in batches so neither the document nor the
+    response is ever held in memory as a whole.
+    """
+    batch_size = app.config['IMPORT_STREAM_BATCH_SIZE']
+    tier_fields = {}
+    batch = []
+    totals = {'tiers': 0, 'available': 0, 'missing': 0}
+    
+    def flush(index):
+        available_files, missing_files = resolve_import_items(batch)
+        totals['available'] += len(available_files)
+        totals['missing'] += len(missing_files)
+        line = json.dumps({
+            'type': 'files',
+            'tier': index,
+            'files': batch,
+            'available_files': available_files,
+            'missing_files': missing_files
+        }) + '\n'
+        batch.clear()
+        return line
+    
+    try:
+        for event in events:
+            kind = event[0]
+            if kind == 'field':
+                yield json.dumps({'type': 'field', 'key': event[1], 'value': event[2]}) + '\n'
+            elif kind == 'tier_start':
+                tier_fields = {}
+            elif kind == 'tier_field':
+                tier_fields[event[2]] = event[3]
+            elif kind == 'item':
+                index = event[1]
+                batch.append(event[3])
+                if len(batch) >= batch_size:
+                    yield flush(index)
+            elif kind == 'tier_end':
+                index = event[1]
+                if batch:
+                    yield flush(index)
+                totals['tiers'] += 1
+                yield json.dumps({'type': 'tier', 'index': index, 'tier': tier_fields}) + '\n'
+        
+        app.logger.info(f"Tierlist streamed: {totals['available']} available, {totals['missing']} missing files")
+        yield json.dumps({'type': 'done', **totals}) + '\n'
+        
+    except TIERLIST_ERRORS as e:
+        yield json.dumps({'type': 'error', 'error': tierlist_error_message(e)}) + '\n'
+    except Exception as e:
+        app.logger.error(f"Streaming import error: {str(e)}")
+        yield json.dumps({'type': 'error', 'error': 'Error processing file'}) + '\n'
+
 @app.route('/import', methods=['POST'])
 @limiter.limit("5 per minute")  # Rate limit imports
 def import_tierlist():
-    """import a previously exported tierlist JSON file with enhanced validation"""
+    """import a previously exported tierlist JSON file with enhanced validation
+
+    The document is parsed incrementally from the upload stream. With
+    ``?stream=1`` (or ``Accept: application/x-ndjson``) the result is sent
+    back as NDJSON lines as it is validated, which allows much larger
+    tierlists than the buffered JSON response.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -290,53 +947,21 @@ def import_tierlist():
             app.logger.warning(f"Invalid import file type: {file.filename} from {get_remote_address()}")
             return jsonify({'error': 'Invalid file type. Please upload a JSON file.'}), 400
         
-        #parse JSON content with size limit
-        content = file.read()
-        if len(content) > 1024 * 1024:  #1MB limit for JSON
-            app.logger.warning(f"Oversized JSON import attempt: {len(content)} bytes from {get_remote_address()}")
-            return jsonify({'error': 'JSON file too large (max 1MB)'}), 400
-        
-        content_str = content.decode('utf-8')
-        tierlist_data = json.loads(content_str)
+        streaming = request.args.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+        max_bytes = app.config['IMPORT_STREAM_MAX_BYTES'] if streaming else app.config['IMPORT_MAX_BYTES']
+        events = iter_tierlist_events(file.stream, max_bytes, app.config['MAX_IMPORT_TIERS'])
         
-        #validate structure with security checks
-        if not isinstance(tierlist_data, dict) or 'tiers' not in tierlist_data:
-            return jsonify({'error': 'Invalid tierlist format: missing tiers data'}), 400
+        if streaming:
+            app.logger.info(f"Streaming tierlist import by {get_remote_address()}")
+            response = Response(stream_with_context(stream_import(events)), mimetype='application/x-ndjson')
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
         
-        if not isinstance(tierlist_data['tiers'], list) or len(tierlist_data['tiers']) > 20:
-            return jsonify({'error': 'Invalid tierlist format: invalid tiers structure'}), 400
-        #collect all referenced files and check if they exist
-        missing_files = []
-        available_files = []
+        #buffered mode rebuilds the document for the JSON response
+        tierlist_data, items = load_tierlist(events)
         
-        for tier in tierlist_data['tiers']:
-            if not isinstance(tier, dict):
-                continue
-                
-            #support both new 'files' format and legacy 'images' format
-            media_items = tier.get('files', []) or tier.get('images', [])
-            if not isinstance(media_items, list):
-                continue
-                
-            for file_data in media_items:
-                if not isinstance(file_data, dict):
-                    continue
-                    
-                filename = file_data.get('filename')
-                if filename and isinstance(filename, str):
-                    # Validate filename for security
-                    secured_filename = secure_filename(filename)
-                    if secured_filename == filename:
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                        if os.path.exists(file_path):
-                            available_files.append({
-                                'filename': filename,
-                                'original_name': file_data.get('original_name', filename),
-                                'url': url_for('uploaded_file', filename=filename),
-                                'is_audio': file_data.get('is_audio', False)
-                            })
-                        else:
-                            missing_files.append(filename)
+        #collect all referenced files and check them in one batch
+        available_files, missing_files = resolve_import_items(items)
         
         app.logger.info(f"Tierlist imported successfully by {get_remote_address()}")
         return jsonify({
@@ -345,15 +970,685 @@ def import_tierlist():
             'missing_files': missing_files
         })
         
-    except json.JSONDecodeError:
-        app.logger.warning(f"Invalid JSON import attempt from {get_remote_address()}")
-        return jsonify({'error': 'Invalid JSON format'}), 400
-    except UnicodeDecodeError:
-        return jsonify({'error': 'File encoding not supported'}), 400
+    except TIERLIST_ERRORS as e:
+        app.logger.warning(f"Invalid tierlist import attempt from {get_remote_address()}: {str(e)}")
+        return jsonify({'error': tierlist_error_message(e)}), 400
     except Exception as e:
         app.logger.error(f"Import error: {str(e)}")
         return jsonify({'error': 'Error processing file'}), 500
 
+def submit_ranking(list_key, document):
+    """count a saved tierlist towards /consensus; a failure never fails the save"""
+    try:
+        consensus_index.submit(list_key, ranking(document))
+    except Exception as e:
+        app.logger.warning(f"Consensus submit failed for {list_key}: {str(e)}")
+
+@app.route('/tierlists', methods=['POST'])
+@limiter.limit("10 per minute")  # Rate limit shares
+def create_tierlist():
+    """store a tierlist server-side and return its short share id
+
+    File resolution is done once here and the /t/<id> response body is
+    stored with the document, so reads are a single primary-key lookup.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Expected a JSON tierlist'}), 400
+        
+        events = iter_tierlist_events(request.stream, app.config['IMPORT_MAX_BYTES'], app.config['MAX_IMPORT_TIERS'])
+        tierlist_data, items = load_tierlist(events)
+        available_files, missing_files = resolve_import_items(items)
+        
+        document_json = json.dumps(tierlist_data, sort_keys=True, separators=(',', ':'))
+        response_json = json.dumps({
+            'tierlist': tierlist_data,
+            'available_files': available_files,
+            'missing_files': missing_files
+        }, separators=(',', ':'))
+        tierlist_id = tierlist_store.save(document_json, response_json)
+        submit_ranking(f't:{tierlist_id}', tierlist_data)
+        
+        app.logger.info(f"Tierlist {tierlist_id} shared by {get_remote_address()}")
+        return jsonify({
+            'id': tierlist_id,
+            'url': url_for('view_tierlist', tierlist_id=tierlist_id)
+        }), 201
+        
+    except TIERLIST_ERRORS as e:
+        app.logger.warning(f"Invalid tierlist share attempt from {get_remote_address()}: {str(e)}")
+        return jsonify({'error': tierlist_error_message(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Share error: {str(e)}")
+        return jsonify({'error': 'Error saving tierlist'}), 500
+
+@app.route('/t/<tierlist_id>')
+@limiter.limit("60 per minute")  # Rate limit shared list views
+def view_tierlist(tierlist_id):
+    """serve a shared tierlist: the app page for browsers, JSON otherwise"""
+    if not TIERLIST_ID_PATTERN.fullmatch(tierlist_id):
+        abort(404)
+    
+    record = tierlist_store.get(tierlist_id)
+    if record is None:
+        abort(404)
+    
+    if request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html':
+        response = make_response(render_template('index.html', shared_tierlist_id=record.id))
+        response.headers['Cache-Control'] = 'public, max-age=300'
+    else:
+        #shared documents never change, so the stored body can be cached hard
+        response = app.response_class(record.response, mimetype='application/json')
+        response.set_etag(record.etag)
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+    
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+def unknown_uploads(filenames):
+    """the filenames that are not uploads, checked in one index lookup"""
+    names = set(filenames)
+    valid = {name for name in names if secure_filename(name) == name}
+    present = upload_index.contains_many(valid)
+    mark_in_use(present)
+    return sorted(names - present)
+
+@app.route('/documents', methods=['POST'])
+@limiter.limit("10 per minute")  # Rate limit new versioned tierlists
+def create_document():
+    """store a versioned tierlist; later saves send patches against it
+
+    Entries whose files are missing are left out of version 1.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Expected a JSON tierlist'}), 400
+        
+        events = iter_tierlist_events(request.stream, app.config['IMPORT_MAX_BYTES'], app.config['MAX_IMPORT_TIERS'])
+        tierlist_data, items = load_tierlist(events)
+        available_files, missing_files = resolve_import_items(items)
+        available = {entry['filename'] for entry in available_files}
+        for tier in tierlist_data['tiers']:
+            #patches address tier entries under 'files' only
+            entries = tier.pop('files', None) or tier.pop('images', None) or []
+            tier.pop('images', None)
+            tier['files'] = [entry for entry in entries if entry.get('filename') in available]
+        
+        document_id = tierlist_history.create(tierlist_data)
+        submit_ranking(f'd:{document_id}', tierlist_data)
+        app.logger.info(f"Versioned tierlist {document_id} created by {get_remote_address()}")
+        return jsonify({
+            'id': document_id,
+            'version': 1,
+            'url': url_for('view_document', document_id=document_id),
+            'missing_files': missing_files
+        }), 201
+        
+    except TIERLIST_ERRORS as e:
+        app.logger.warning(f"Invalid versioned tierlist from {get_remote_address()}: {str(e)}")
+        return jsonify({'error': tierlist_error_message(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Versioned tierlist error: {str(e)}")
+        return jsonify({'error': 'Error saving tierlist'}), 500
+
+@app.route('/d/<document_id>')
+def view_document(document_id):
+    """the app page with a versioned tierlist loaded"""
+    if not DOCUMENT_ID_PATTERN.fullmatch(document_id):
+        abort(404)
+    response = make_response(render_template('index.html', saved_document_id=document_id))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/documents/<document_id>', methods=['GET'])
+@limiter.limit("120 per minute")  # Rate limit versioned tierlist loads
+def get_document(document_id):
+    """the latest version of a tierlist
+
+    With ``?since=<version>`` a client that has that version gets the JSON
+    patch from it to the latest one, unless the full document is smaller.
+    """
+    if not DOCUMENT_ID_PATTERN.fullmatch(document_id):
+        abort(404)
+    since = request.args.get('since', type=int)
+    try:
+        changes = tierlist_history.changes(document_id, since)
+    except PatchError as e:
+        app.logger.error(f"Versioned tierlist {document_id} does not replay: {str(e)}")
+        return jsonify({'error': 'Error loading tierlist'}), 500
+    if changes is None:
+        return jsonify({'error': 'Tierlist not found'}), 404
+    
+    version, patch_json, document_json = changes
+    #stored JSON is spliced in as is, without a parse and re-encode
+    if patch_json is not None:
+        body = f'{{"id":"{document_id}","version":{version},"since":{since},"patch":{patch_json}}}'
+    else:
+        body = f'{{"id":"{document_id}","version":{version},"document":{document_json}}}'
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(f'{document_id}-{version}-{since if patch_json is not None else 0}')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/documents/<document_id>', methods=['PATCH'])
+@limiter.limit("60 per minute")  # Rate limit versioned saves
+def patch_document(document_id):
+    """save a revision as a JSON patch against the client's base version
+
+    Only the operations and the entries they add are checked, so a save
+    costs the size of the change, not of the tierlist. A base that is not
+    the latest version gets a 409 with the latest version number.
+    """
+    if not DOCUMENT_ID_PATTERN.fullmatch(document_id):
+        abort(404)
+    if (request.content_length or 0) > app.config['IMPORT_MAX_BYTES']:
+        return jsonify({'error': f"Patch too large (max {app.config['IMPORT_MAX_BYTES'] // (1024 * 1024)}MB)"}), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('base'), int):
+        return jsonify({'error': 'Expected a base version and a patch'}), 400
+    
+    try:
+        missing_files = unknown_uploads(check_patch(data.get('patch'), app.config['TIERLIST_PATCH_MAX_OPS']))
+        if missing_files:
+            return jsonify({'error': f"Unknown files: {', '.join(missing_files[:10])}", 'missing_files': missing_files}), 400
+        version = tierlist_history.commit(document_id, data['base'], data['patch'])
+    except PatchError as e:
+        return jsonify({'error': f'Invalid patch: {e}'}), 400
+    except RevisionConflict as e:
+        return jsonify({'error': 'The tierlist was saved from somewhere else meanwhile', 'version': e.version}), 409
+    except Exception as e:
+        app.logger.error(f"Versioned save error: {str(e)}")
+        return jsonify({'error': 'Error saving tierlist'}), 500
+    if version is None:
+        return jsonify({'error': 'Tierlist not found'}), 404
+    if data['patch']:
+        submit_ranking(f'd:{document_id}', tierlist_history.head(document_id)[1])
+    return jsonify({'id': document_id, 'version': version})
+
+def render_layout(tierlist_data):
+    """a tierlist as the renderer draws it, uploads that are gone left out"""
+    tiers = [tier if isinstance(tier, dict) else {} for tier in tierlist_data.get('tiers', [])]
+    entries = [
+        [entry for entry in (tier.get('files') or tier.get('images') or []) if isinstance(entry, dict)]
+        for tier in tiers
+    ]
+    names = {entry.get('filename') for tier_entries in entries for entry in tier_entries}
+    present = upload_index.contains_many(
+        name for name in names if isinstance(name, str) and secure_filename(name) == name
+    )
+    mark_in_use(present)
+    
+    layout_tiers = []
+    for index, (tier, tier_entries) in enumerate(zip(tiers, entries)):
+        items = []
+        for entry in tier_entries:
+            filename = entry.get('filename')
+            if filename not in present or not (is_image_file(filename) or is_audio_file(filename)):
+                continue
+            items.append({
+                'file': filename,
+                'key': content_store.resolve(filename) or filename,
+                'audio': is_audio_file(filename),
+                'name': str(entry.get('original_name') or filename)
+            })
+        label = tier.get('label')
+        layout_tiers.append({'label': label if isinstance(label, str) and label else tier_label(index), 'items': items})
+    title = tierlist_data.get('title')
+    return {'title': title if isinstance(title, str) and title else 'Tier List', 'tiers': layout_tiers}
+
+def fetch_render_sources(layout):
+    """bring originals from media storage for thumbnails not rendered yet"""
+    if not storage_backend.remote:
+        return
+    for tier in layout['tiers']:
+        for item in tier['items']:
+            if not item['audio']:
+                media_storage.ensure_local(item['file'])
+
+def render_response(tierlist_data, cache_control, download_name):
+    """the tierlist as ``?format=png|webp|pdf``, from the render cache when possible"""
+    fmt = request.args.get('format', 'png')
+    if fmt not in RENDER_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(RENDER_FORMATS)}"}), 400
+    layout = render_layout(tierlist_data)
+    item_count = sum(len(tier['items']) for tier in layout['tiers'])
+    if item_count > app.config['RENDER_MAX_ITEMS']:
+        return jsonify({'error': f"Too many items to render (max {app.config['RENDER_MAX_ITEMS']})"}), 400
+    
+    try:
+        key, relpath, cached = tierlist_renderer.render(layout, fmt, prepare=fetch_render_sources)
+    except FutureTimeoutError:
+        #the render keeps going in the pool and lands in the cache
+        response = jsonify({'error': 'Still rendering, try again in a few seconds'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    metrics.RENDERS.labels(result='cached' if cached else 'rendered').inc()
+    
+    response = serve_upload_path(relpath, key, cache_control)
+    response.headers['Content-Type'] = RENDER_FORMATS[fmt][2]
+    disposition = 'attachment' if request.args.get('download') == '1' else 'inline'
+    response.headers['Content-Disposition'] = f'{disposition}; filename="{download_name}{RENDER_FORMATS[fmt][1]}"'
+    return response
+
+@app.route('/render', methods=['POST'])
+@limiter.limit("10 per minute")  # Rate limit exports of unsaved lists
+def render_posted_tierlist():
+    """render the tierlist in the request body (the board as it is now)"""
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Expected a JSON tierlist'}), 400
+        events = iter_tierlist_events(request.stream, app.config['IMPORT_MAX_BYTES'], app.config['MAX_IMPORT_TIERS'])
+        tierlist_data, _ = load_tierlist(events)
+        response = render_response(tierlist_data, 'private, no-cache', 'tierlist')
+        app.logger.info(f"Tierlist rendered for {get_remote_address()}")
+        return response
+    except TIERLIST_ERRORS as e:
+        return jsonify({'error': tierlist_error_message(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Render error: {str(e)}")
+        return jsonify({'error': 'Error rendering tierlist'}), 500
+
+@app.route('/render/<tierlist_id>')
+@limiter.limit("60 per minute")  # Same budget as shared list views
+def render_tierlist(tierlist_id):
+    """a shared or versioned tierlist as ``?format=png|webp|pdf``
+
+    Shared lists never change, so their renders are cacheable by anyone;
+    versioned ones are revalidated against the render key.
+    """
+    try:
+        record = tierlist_store.get(tierlist_id) if TIERLIST_ID_PATTERN.fullmatch(tierlist_id) else None
+        if record is not None:
+            return render_response(json.loads(record.document), 'public, max-age=86400', f'tierlist-{tierlist_id}')
+        head = tierlist_history.head(tierlist_id) if DOCUMENT_ID_PATTERN.fullmatch(tierlist_id) else None
+        if head is None:
+            abort(404)
+        return render_response(head[1], 'no-cache', f'tierlist-{tierlist_id}-v{head[0]}')
+    except HTTPException:
+        raise
+    except Exception as e:
+        app.logger.error(f"Render error for {tierlist_id}: {str(e)}")
+        return jsonify({'error': 'Error rendering tierlist'}), 500
+
+@app.route('/sessions', methods=['POST'])
+@limiter.limit("10 per minute")  # Rate limit new live sessions
+def create_session():
+    """start a live session from a tierlist document
+
+    The body is a tierlist like the one POSTed to /tierlists, plus an
+    optional ``pool`` of unranked files.
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Expected a JSON tierlist'}), 400
+        
+        events = iter_tierlist_events(request.stream, app.config['IMPORT_MAX_BYTES'], app.config['MAX_IMPORT_TIERS'])
+        tierlist_data, items = load_tierlist(events)
+        pool = tierlist_data.get('pool')
+        pool = [entry for entry in pool if isinstance(entry, dict)] if isinstance(pool, list) else []
+        available_files, missing_files = resolve_import_items(items + pool)
+        
+        session_id = collab_sessions.create(initial_state(tierlist_data['tiers'], available_files, pool))
+        app.logger.info(f"Live session {session_id} started by {get_remote_address()}")
+        return jsonify({
+            'id': session_id,
+            'url': url_for('view_session', session_id=session_id),
+            'missing_files': missing_files
+        }), 201
+        
+    except TIERLIST_ERRORS as e:
+        app.logger.warning(f"Invalid live session attempt from {get_remote_address()}: {str(e)}")
+        return jsonify({'error': tierlist_error_message(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Live session error: {str(e)}")
+        return jsonify({'error': 'Error starting live session'}), 500
+
+@app.route('/s/<session_id>')
+def view_session(session_id):
+    """the app page joined to a live session"""
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        abort(404)
+    response = make_response(render_template('index.html', live_session_id=session_id))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/sessions/<session_id>/ops', methods=['POST'])
+@limiter.limit("600 per minute")  # Rate limit live edits
+def post_session_ops(session_id):
+    """log a batch of operations; viewers get them through the event stream"""
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        abort(404)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('ops'), list) or not data['ops']:
+        return jsonify({'error': 'Expected a list of operations'}), 400
+    if len(data['ops']) > app.config['COLLAB_MAX_OPS_PER_REQUEST']:
+        return jsonify({'error': f"Too many operations (max {app.config['COLLAB_MAX_OPS_PER_REQUEST']})"}), 400
+    
+    try:
+        ops = [normalize_op(op, app.config['MAX_IMPORT_TIERS']) for op in data['ops']]
+    except OpRejected as e:
+        return jsonify({'error': f'Invalid operation: {e}'}), 400
+    for op in ops:
+        if op['op'] == 'add':
+            #only files this server has, with the urls it serves them under
+            op['files'], _ = resolve_import_items(op['files'])
+    
+    try:
+        versions = collab_sessions.append(session_id, ops)
+    except Exception as e:
+        app.logger.error(f"Live session {session_id} op error: {str(e)}")
+        return jsonify({'error': 'Error saving operations'}), 500
+    if versions is None:
+        return jsonify({'error': 'Session not found'}), 404
+    for op in ops:
+        metrics.COLLAB_OPS.labels(op=op['op']).inc()
+    return jsonify({'versions': versions})
+
+EVENT_STREAM_BUSY_RETRY_MS = 5000
+
+@app.route('/sessions/<session_id>/events')
+@limiter.limit("120 per minute")  # Rate limit event stream (re)connects
+def session_events(session_id):
+    """server-sent events: a snapshot, then every operation as it is logged"""
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        abort(404)
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    since = int(since) if since and since.isdigit() else None
+    
+    if event_stream_slots is not None and not event_stream_slots.acquire(blocking=False):
+        #no thread to spare: a 200 with a retry hint, since EventSource gives
+        #up on error statuses; it reconnects and catches up from Last-Event-ID
+        metrics.COLLAB_STREAMS_REFUSED.inc()
+        response = Response(f"retry: {EVENT_STREAM_BUSY_RETRY_MS}\n\nevent: busy\ndata: {{}}\n\n", mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    #subscribe before reading the log so no operation falls in between
+    try:
+        subscriber = collab_sessions.subscribe(session_id)
+        try:
+            loaded = collab_sessions.load(session_id)
+        except Exception:
+            collab_sessions.unsubscribe(subscriber)
+            raise
+    except Exception:
+        release_event_stream_slot()
+        raise
+    if loaded is None:
+        collab_sessions.unsubscribe(subscriber)
+        release_event_stream_slot()
+        return jsonify({'error': 'Session not found'}), 404
+    
+    def generate():
+        try:
+            yield from collab_sessions.stream(
+                subscriber, loaded, since,
+                duration=app.config['COLLAB_STREAM_SECONDS'],
+                keepalive=app.config['COLLAB_KEEPALIVE_SECONDS']
+            )
+        finally:
+            collab_sessions.unsubscribe(subscriber)
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    #runs when the server closes the response, even if it never iterated it
+    response.call_on_close(release_event_stream_slot)
+    return response
+
+def release_event_stream_slot():
+    if event_stream_slots is not None:
+        event_stream_slots.release()
+
+def recognize_uploads(filenames):
+    """label uploaded images, one upstream call per uncached digest
+
+    Returns ``{filename: {'label': ..., 'cached': ...} or None}``. Misses
+    that are not done within ``RECOGNITION_BATCH_SECONDS`` come back with
+    ``'pending': True`` and keep running into the cache.
+    """
+    deadline = time.monotonic() + app.config['RECOGNITION_BATCH_SECONDS']
+    digests = {}
+    for filename in filenames:
+        if secure_filename(filename) == filename and is_image_file(filename) and media_storage.ensure_local(filename):
+            digests[filename] = content_store.digest(filename)
+    
+    results = {filename: None for filename in filenames}
+    cached = recognizer.cache.get_many(digests.values())
+    misses = []
+    for filename, digest in digests.items():
+        if digest in cached:
+            results[filename] = {'label': cached[digest], 'cached': True}
+        else:
+            misses.append(filename)
+    
+    def locate(filename):
+        #the 512px jpeg derivative is what the model sees
+        relpath = ensure_derivative(app.config['UPLOAD_FOLDER'], filename, digests[filename], 'medium', 'jpeg')
+        return os.path.join(app.config['UPLOAD_FOLDER'], relpath)
+    
+    futures = {filename: recognizer.submit(digests[filename], partial(locate, filename)) for filename in misses}
+    done, _ = wait_futures(futures.values(), timeout=max(0, deadline - time.monotonic()))
+    for filename, future in futures.items():
+        if future not in done:
+            results[filename] = {'label': None, 'cached': False, 'pending': True}
+            continue
+        try:
+            label, was_cached = future.result()
+        except Exception as e:
+            app.logger.warning(f"Recognition failed for {filename}: {str(e)}")
+            label, was_cached = None, False
+        results[filename] = {'label': label, 'cached': was_cached}
+    
+    return results
+
+@app.route('/recognize/<filename>')
+@limiter.limit("60 per minute")  # Cached answers are cheap, misses are not
+def recognize_file(filename):
+    """one-word label for an uploaded image"""
+    try:
+        result = recognize_uploads([filename])[filename]
+        if result is None:
+            abort(404)
+        return jsonify({'filename': filename, **result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        app.logger.error(f"Recognition error: {str(e)}")
+        return jsonify({'error': 'Recognition failed'}), 500
+
+@app.route('/recognize', methods=['POST'])
+@limiter.limit("20 per minute")
+def recognize_batch():
+    """labels for many uploaded images in one call: {"filenames": [...]}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filenames = data.get('filenames')
+        if not isinstance(filenames, list) or not all(isinstance(name, str) for name in filenames):
+            return jsonify({'error': 'Expected a list of filenames'}), 400
+        if len(filenames) > app.config['RECOGNITION_BATCH_LIMIT']:
+            return jsonify({'error': f"Too many files. Maximum {app.config['RECOGNITION_BATCH_LIMIT']} per request"}), 400
+        
+        return jsonify({'results': recognize_uploads(list(dict.fromkeys(filenames)))})
+    except Exception as e:
+        app.logger.error(f"Batch recognition error: {str(e)}")
+        return jsonify({'error': 'Recognition failed'}), 500
+
+def find_similar(filenames, within=None, k=10, max_distance=None):
+    """near-duplicate and top-k similar uploads for each image
+
+    Returns ``{filename: {'near_duplicates': [...], 'similar': [...]} or None}``
+    with ``{'filename', 'url', 'distance'}`` entries (Hamming bits of 64).
+    """
+    if max_distance is None:
+        max_distance = app.config['SIMILARITY_MAX_DISTANCE']
+    results = {}
+    for filename in filenames:
+        results[filename] = None
+        if not (secure_filename(filename) == filename and is_image_file(filename) and media_storage.ensure_local(filename)):
+            continue
+        try:
+            value = image_hashes.ensure(app.config['UPLOAD_FOLDER'], filename, content_store.digest(filename))
+        except (OSError, ValueError) as e:
+            app.logger.warning(f"Perceptual hash failed for {filename}: {str(e)}")
+            continue
+        near, similar = image_hashes.query(value, k=k, max_distance=max_distance, exclude=[filename], within=within)
+        results[filename] = {'near_duplicates': near[:app.config['SIMILARITY_MAX_RESULTS']], 'similar': similar}
+    
+    #deleted uploads stay in the hash index, drop them here
+    found = {name for result in results.values() if result for entries in result.values() for name, _ in entries}
+    present = upload_index.contains_many(found)
+    for result in results.values():
+        if result:
+            for key, entries in result.items():
+                result[key] = [
+                    {'filename': name, 'url': url_for('uploaded_file', filename=name), 'distance': distance}
+                    for name, distance in entries if name in present
+                ]
+    return results
+
+def similarity_params(source):
+    """k and max_distance from query args or a JSON body, clamped"""
+    try:
+        k = int(source.get('k', 10))
+        max_distance = int(source.get('max_distance', app.config['SIMILARITY_MAX_DISTANCE']))
+    except (TypeError, ValueError):
+        return None
+    return max(0, min(k, app.config['SIMILARITY_MAX_RESULTS'])), max(0, min(max_distance, 32))
+
+@app.route('/similar/<filename>')
+@limiter.limit("60 per minute")
+def similar_file(filename):
+    """uploads that look like an image: ?k=10&max_distance=10"""
+    try:
+        params = similarity_params(request.args)
+        if params is None:
+            return jsonify({'error': 'k and max_distance must be integers'}), 400
+        result = find_similar([filename], k=params[0], max_distance=params[1])[filename]
+        if result is None:
+            abort(404)
+        return jsonify({'filename': filename, **result})
+    except HTTPException:
+        raise
+    except Exception as e:
+        app.logger.error(f"Similarity error: {str(e)}")
+        return jsonify({'error': 'Similarity lookup failed'}), 500
+
+@app.route('/similar', methods=['POST'])
+@limiter.limit("20 per minute")
+def similar_batch():
+    """similar uploads for many images: {"filenames": [...], "within": [...]}
+
+    ``within`` limits matches to those uploads, e.g. the items already on
+    the client's board.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        filenames = data.get('filenames')
+        within = data.get('within')
+        if not isinstance(filenames, list) or not all(isinstance(name, str) for name in filenames):
+            return jsonify({'error': 'Expected a list of filenames'}), 400
+        if len(filenames) > app.config['RECOGNITION_BATCH_LIMIT']:
+            return jsonify({'error': f"Too many files. Maximum {app.config['RECOGNITION_BATCH_LIMIT']} per request"}), 400
+        if within is not None and (not isinstance(within, list) or not all(isinstance(name, str) for name in within)):
+            return jsonify({'error': 'within must be a list of filenames'}), 400
+        params = similarity_params(data)
+        if params is None:
+            return jsonify({'error': 'k and max_distance must be integers'}), 400
+        
+        results = find_similar(list(dict.fromkeys(filenames)), within=within, k=params[0], max_distance=params[1])
+        return jsonify({'results': results})
+    except Exception as e:
+        app.logger.error(f"Batch similarity error: {str(e)}")
+        return jsonify({'error': 'Similarity lookup failed'}), 500
+
+@app.route('/consensus')
+@limiter.limit("30 per minute")
+def consensus():
+    """consensus tiers over every shared and saved tierlist
+
+    ``?method=borda|mean|median|kemeny&tiers=5&min_lists=1&limit=100``.
+    The response is a tierlist (so it imports as one) whose entries also
+    carry their aggregate scores.
+    """
+    method = request.args.get('method', 'borda')
+    if method not in CONSENSUS_METHODS:
+        return jsonify({'error': f"method must be one of {', '.join(CONSENSUS_METHODS)}"}), 400
+    try:
+        tier_count = int(request.args.get('tiers', 5))
+        min_lists = int(request.args.get('min_lists', 1))
+        limit = int(request.args.get('limit', 100))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'tiers, min_lists and limit must be integers'}), 400
+    tier_count = max(1, min(tier_count, app.config['MAX_IMPORT_TIERS']))
+    limit = max(0, min(limit, app.config['CONSENSUS_MAX_RESULTS']))
+    
+    try:
+        result = consensus_index.rank(method, tiers=tier_count, min_lists=min_lists, limit=limit)
+    except Exception as e:
+        app.logger.error(f"Consensus error: {str(e)}")
+        return jsonify({'error': 'Consensus ranking failed'}), 500
+    
+    #deleted uploads stay in the rankings, drop them here
+    present = upload_index.contains_many(entry['filename'] for tier in result['tiers'] for entry in tier)
+    tiers = []
+    for index, entries in enumerate(result['tiers']):
+        tiers.append({
+            'label': tier_label(index),
+            'files': [
+                {**entry, 'url': url_for('uploaded_file', filename=entry['filename'])}
+                for entry in entries if entry['filename'] in present
+            ]
+        })
+    response = jsonify({
+        'title': 'Consensus',
+        'method': method,
+        'lists': result['lists'],
+        'items': result['items'],
+        'tiers': tiers
+    })
+    response.set_etag(f"consensus-{consensus_index.last_seq}-{method}-{tier_count}-{min_lists}-{limit}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/commands/parse', methods=['POST'])
+@limiter.limit("60 per minute")
+def parse_commands():
+    """parse voice transcripts into move commands
+
+    Body: ``{"transcripts": [...], "tiers": [...], "items": [{"id", "names"}]}``
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        transcripts = data.get('transcripts')
+        if transcripts is None and isinstance(data.get('transcript'), str):
+            transcripts = [data['transcript']]
+        tiers = data.get('tiers')
+        items = data.get('items')
+        
+        if not isinstance(transcripts, list) or not all(isinstance(t, str) for t in transcripts):
+            return jsonify({'error': 'Expected a list of transcripts'}), 400
+        if len(transcripts) > app.config['COMMAND_PARSE_BATCH_LIMIT']:
+            return jsonify({'error': f"Too many transcripts. Maximum {app.config['COMMAND_PARSE_BATCH_LIMIT']} per request"}), 400
+        if not isinstance(tiers, list) or not all(isinstance(t, str) for t in tiers):
+            return jsonify({'error': 'Expected a list of tier labels'}), 400
+        if not isinstance(items, list) or len(items) > app.config['COMMAND_PARSE_MAX_ITEMS']:
+            return jsonify({'error': 'Expected a list of items'}), 400
+        for item in items:
+            if not (isinstance(item, dict) and isinstance(item.get('id'), str)
+                    and isinstance(item.get('names'), list)
+                    and all(isinstance(name, str) for name in item['names'])):
+                return jsonify({'error': 'Each item needs an id and a list of names'}), 400
+        
+        items = [{'id': item['id'], 'names': item['names']} for item in items]
+        commands = command_parser.parse_many(transcripts, tiers, items)
+        return jsonify({'commands': commands})
+    except Exception as e:
+        app.logger.error(f"Command parse error: {str(e)}")
+        return jsonify({'error': 'Command parsing failed'}), 500
+
 # Enhanced security headers
 @app.after_request
 def after_request(response):
@@ -410,6 +1705,20 @@ def health_check():
         'version': '1.0.0'
     })
 
+# Prometheus metrics, summed over all gunicorn workers
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    """metrics in Prometheus text format"""
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(404)
+    body, content_type = metrics.render()
+    response = make_response(body)
+    response.headers['Content-Type'] = content_type
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 # Security endpoint for monitoring
 @app.route('/security-info')
 @limiter.limit("1 per minute")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline
+
+At build time (``python assets.py``, run by the Dockerfile) every source in
+ASSET_SOURCES is minified, written under ``static/dist/`` with a content
+hash in its name, and precompressed into ``.gz`` and ``.br`` siblings. A
+manifest maps source names to built names. At runtime ``AssetManifest``
+turns ``asset_url('js/app.js')`` into the fingerprinted URL, and the app
+serves ``static/dist/`` with immutable caching and the best precompressed
+variant the client accepts.
+"""
+import os
+import sys
+import gzip
+import json
+import hashlib
+from flask import url_for
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ASSET_SOURCES = ['js/app.js', 'css/output.css']
+#best first; the encoding a client accepts that has a file on disk wins
+PRECOMPRESSED = [('br', '.br'), ('gzip', '.gz')]
+
+
+def minify(source, data):
+    if source.endswith('.js'):
+        import rjsmin
+        return rjsmin.jsmin(data)
+    if source.endswith('.css'):
+        import rcssmin
+        return rcssmin.cssmin(data)
+    return data
+
+
+def build(static_folder, sources=ASSET_SOURCES):
+    """minify, fingerprint and precompress the sources; returns the manifest"""
+    import brotli
+
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, mode=0o755, exist_ok=True)
+    manifest = {}
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            data = minify(source, f.read()).encode('utf-8')
+
+        name, ext = os.path.splitext(os.path.basename(source))
+        built = f"{DIST_DIR}/{name}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        path = os.path.join(static_folder, built)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.gz', 'wb') as f:
+            #mtime=0 keeps rebuilds byte-identical
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+        manifest[source] = built
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class AssetManifest:
+    """maps source asset names to their fingerprinted builds
+
+    Without a build (local development) names map to themselves, so the
+    unminified sources are served as before.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.assets = {}
+        try:
+            with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as f:
+                self.assets = json.load(f)
+        except FileNotFoundError:
+            pass
+        #changes whenever any asset does, e.g. for page cache keys
+        self.version = hashlib.sha256(json.dumps(self.assets, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+    def url(self, filename):
+        return url_for('static', filename=self.assets.get(filename, filename))
+
+    def precompressed(self, filename, accept_encodings):
+        """(path, encoding) of the best stored variant the client accepts"""
+        path = os.path.join(self.static_folder, DIST_DIR, filename)
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding in accept_encodings and os.path.isfile(path + suffix):
+                return filename + suffix, encoding
+        return filename, None
+
+
+if __name__ == '__main__':
+    static_folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    for source, built in build(static_folder).items():
+        sizes = [os.path.getsize(os.path.join(static_folder, built + suffix)) for suffix in ('', '.gz', '.br')]
+        original = os.path.getsize(os.path.join(static_folder, source))
+        print(f"{source} -> {built}  {original} -> {sizes[0]} bytes (gzip {sizes[1]}, brotli {sizes[2]})")
@@ -0,0 +1,200 @@
+import os
+import json
+import struct
+import secrets
+import threading
+import subprocess
+from thumbnails import DERIVED_DIR, get_pool, log_failure
+
+AUDIO_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a', 'aac'}
+FFMPEG = 'ffmpeg'
+#ffmpeg runs in the background pool, requests wait at most AUDIO_DERIVATIVE_WAIT
+FFMPEG_TIMEOUT = 120
+
+# short mono mp3: plays everywhere and is a few hundred KB at most
+PREVIEW_SECONDS = 30
+PREVIEW_BITRATE = '64k'
+PREVIEW_SAMPLE_RATE = 22050
+PREVIEW_MIMETYPE = 'audio/mpeg'
+
+# waveform peaks in the audiowaveform .dat (v1, 8 bit) layout: a 20 byte
+# header, then one (min, max) int8 pair per bin
+WAVEFORM_BINS = 800
+WAVEFORM_SAMPLE_RATE = 8000
+WAVEFORM_HEADER = struct.Struct('<iIiiI')
+WAVEFORM_VERSION = 1
+WAVEFORM_FLAG_8BIT = 1
+
+
+#renders waited on by requests in this process, by key
+pending = {}
+pending_lock = threading.Lock()
+
+
+class AudioDecodeError(ValueError):
+    """ffmpeg could not read or convert an upload"""
+
+
+def is_audio_file(filename):
+    """check if file is an audio file"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in AUDIO_EXTENSIONS
+
+
+def preview_relpath(key):
+    """path of an audio preview relative to the upload folder"""
+    return os.path.join(DERIVED_DIR, key[:2], f"{key}_preview.mp3")
+
+
+def waveform_relpath(key):
+    """path of a waveform peak file relative to the upload folder"""
+    return os.path.join(DERIVED_DIR, key[:2], f"{key}_peaks.dat")
+
+
+def run_ffmpeg(args):
+    """run ffmpeg quietly and return its stdout"""
+    try:
+        result = subprocess.run(
+            [FFMPEG, '-nostdin', '-v', 'error', *args],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=FFMPEG_TIMEOUT, check=True
+        )
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(e.stderr.decode('utf-8', 'replace').strip() or 'ffmpeg failed')
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError('ffmpeg timed out')
+    return result.stdout
+
+
+def write_atomic(dest_path, write):
+    os.makedirs(os.path.dirname(dest_path), mode=0o755, exist_ok=True)
+    tmp_path = f"{dest_path}.{secrets.token_hex(4)}.tmp"
+    try:
+        write(tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return dest_path
+
+
+def render_preview(source_path, dest_path):
+    """transcode the start of an upload into a small mono mp3"""
+    def write(tmp_path):
+        run_ffmpeg([
+            '-i', source_path, '-t', str(PREVIEW_SECONDS), '-vn', '-ac', '1',
+            '-ar', str(PREVIEW_SAMPLE_RATE), '-c:a', 'libmp3lame', '-b:a', PREVIEW_BITRATE,
+            '-map_metadata', '-1', '-f', 'mp3', '-y', tmp_path
+        ])
+    return write_atomic(dest_path, write)
+
+
+def decode_samples(source_path, sample_rate=WAVEFORM_SAMPLE_RATE):
+    """whole upload as mono 16 bit samples at a low rate"""
+    import numpy as np
+
+    pcm = run_ffmpeg(['-i', source_path, '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-'])
+    return np.frombuffer(pcm, dtype='<i2')
+
+
+def compute_peaks(samples, bins=WAVEFORM_BINS):
+    """(min, max) per bin as interleaved int8, plus the samples per bin
+
+    The samples are zero padded to a whole number of bins and reshaped so
+    each row is one bin, which keeps the reduction in NumPy.
+    """
+    import numpy as np
+
+    per_bin = max(1, -(-len(samples) // bins))
+    padded = np.zeros(per_bin * bins, dtype=np.int16)
+    padded[:len(samples)] = samples
+    rows = padded.reshape(bins, per_bin)
+    peaks = np.empty(bins * 2, dtype=np.int8)
+    #keep the top byte of each 16 bit extreme
+    peaks[0::2] = rows.min(axis=1) >> 8
+    peaks[1::2] = rows.max(axis=1) >> 8
+    return peaks, per_bin
+
+
+def render_waveform(source_path, dest_path, bins=WAVEFORM_BINS):
+    """decode an upload and store its waveform peaks"""
+    peaks, per_bin = compute_peaks(decode_samples(source_path), bins)
+    header = WAVEFORM_HEADER.pack(WAVEFORM_VERSION, WAVEFORM_FLAG_8BIT, WAVEFORM_SAMPLE_RATE, per_bin, bins)
+
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(peaks.tobytes())
+    return write_atomic(dest_path, write)
+
+
+def waveform_json(path):
+    """a stored peak file in the audiowaveform JSON layout"""
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    version, flags, sample_rate, per_bin, length = WAVEFORM_HEADER.unpack_from(data)
+    peaks = np.frombuffer(data, dtype=np.int8, offset=WAVEFORM_HEADER.size)
+    return json.dumps({
+        'version': 2,
+        'channels': 1,
+        'sample_rate': sample_rate,
+        'samples_per_pixel': per_bin,
+        'bits': 8,
+        'length': length,
+        'duration': round(per_bin * length / sample_rate, 3),
+        'data': peaks.tolist(),
+    }, separators=(',', ':'))
+
+
+AUDIO_DERIVATIVES = {
+    'preview': (preview_relpath, render_preview),
+    'waveform': (waveform_relpath, render_waveform),
+}
+
+
+def render_audio_derivatives(upload_folder, filename, key):
+    """create the preview and waveform for an upload if they are missing"""
+    source_path = os.path.join(upload_folder, filename)
+    created = []
+    for relpath, render in AUDIO_DERIVATIVES.values():
+        dest_path = os.path.join(upload_folder, relpath(key))
+        if not os.path.exists(dest_path):
+            created.append(render(source_path, dest_path))
+    return created
+
+
+def queue_audio_derivatives(upload_folder, filename, key, max_workers=2):
+    """render audio derivatives in the shared background pool"""
+    future = get_pool(max_workers).submit(render_audio_derivatives, upload_folder, filename, key)
+    future.add_done_callback(log_failure(filename))
+    return future
+
+
+def ensure_audio_derivative(upload_folder, filename, key, kind, max_workers=2, timeout=None):
+    """return a preview or waveform path, waiting on the background pool if it is missing
+
+    Raises concurrent.futures.TimeoutError when the render takes longer
+    than ``timeout`` seconds; it still finishes into the derivative cache.
+    Requests for the same upload in one worker share a render.
+    """
+    relpath = AUDIO_DERIVATIVES[kind][0]
+    dest_relpath = relpath(key)
+    dest_path = os.path.join(upload_folder, dest_relpath)
+    if os.path.exists(dest_path):
+        return dest_relpath
+    with pending_lock:
+        future = pending.get(key)
+        started = future is None
+        if started:
+            future = pending[key] = queue_audio_derivatives(upload_folder, filename, key, max_workers)
+    if started:
+        future.add_done_callback(lambda _: forget_pending(key))
+    future.result(timeout=timeout)
+    return dest_relpath
+
+
+def forget_pending(key):
+    with pending_lock:
+        pending.pop(key, None)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Consensus ranking load and update cost
+
+Writes random tierlists (popularity-skewed picks from a pool of items) into
+a ConsensusIndex in a temporary SQLite file, then times the first load of
+all of them, single resubmissions absorbed on top, and queries per method.
+The accumulators are checked against a recompute from scratch.
+
+Usage: python benchmarks/bench_consensus.py [--lists 100000] [--items 10000] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+from consensus import METHODS, ConsensusIndex
+
+
+def random_tiers(rng, weights, args):
+    size = int(rng.integers(args.min_length, args.max_length + 1))
+    picks = rng.choice(len(weights), size=size, replace=False, p=weights)
+    tier_count = int(rng.integers(3, 9))
+    levels = rng.integers(0, tier_count, size=size)
+    tiers = [[] for _ in range(tier_count)]
+    for item, level in zip(picks.tolist(), levels.tolist()):
+        tiers[level].append(f'item{item}.png')
+    return tiers
+
+
+def fill(index, rng, weights, args):
+    index.submit_many((f't:{i}', random_tiers(rng, weights, args)) for i in range(args.lists))
+
+
+def check(index):
+    #accumulators after all the updates must match a fresh load
+    fresh = ConsensusIndex(index.path)
+    fresh.refresh()
+    size = len(index.names)
+    assert np.array_equal(fresh.counts[:size], index.counts[:size])
+    assert np.allclose(fresh.position_sums[:size], index.position_sums[:size])
+    assert np.allclose(fresh.borda_sums[:size], index.borda_sums[:size])
+    assert np.array_equal(fresh.histograms[:size], index.histograms[:size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lists', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--min-length', type=int, default=10)
+    parser.add_argument('--max-length', type=int, default=80)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--kemeny-items', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    weights = 1 / np.arange(1, args.items + 1) ** 0.8
+    weights /= weights.sum()
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ConsensusIndex(os.path.join(tmp, 'consensus.db'), kemeny_items=args.kemeny_items)
+        fill(index, rng, weights, args)
+        started = time.perf_counter()
+        index.refresh()
+        results = {'lists': args.lists, 'items': len(index.names), 'load_ms': (time.perf_counter() - started) * 1000}
+
+        for method in METHODS:
+            started = time.perf_counter()
+            index.rank(method, tiers=6, limit=100)
+            results[f'{method}_ms'] = (time.perf_counter() - started) * 1000
+
+        #resubmissions: half replace an existing list, half are new
+        latencies = []
+        for i in range(args.updates):
+            key = f't:{rng.integers(args.lists)}' if i % 2 else f'new:{i}'
+            index.submit(key, random_tiers(rng, weights, args))
+            started = time.perf_counter()
+            index.refresh()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results['update_p50_ms'] = latencies[len(latencies) // 2] * 1000
+        results['update_p99_ms'] = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000
+        check(index)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['lists']} lists over {results['items']} items: load {results['load_ms']:.0f} ms")
+    print('  first query: ' + '  '.join(f"{method} {results[f'{method}_ms']:.1f} ms" for method in METHODS))
+    print(f"  absorb one submission: p50 {results['update_p50_ms']:.2f} ms p99 {results['update_p99_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+"""
+Hot path benchmark suite: upload, serve, import and index
+
+Builds deterministic synthetic corpora (images and audio of several sizes,
+tierlist JSON from 10 to 10k items) and drives POST /upload, GET
+/uploads/<name> (original and thumbnail), POST /import and GET / through
+the Flask test client and through a local gunicorn started with the
+tree's own gunicorn.conf.py. For every scenario it records throughput,
+p50/p99 latency and RSS (per worker for gunicorn) as JSON.
+
+Rate limits are switched off in the process under test so that they do not
+cap throughput.
+
+Usage:
+  python benchmarks/bench_hot_paths.py run [--targets client,gunicorn] [--output results.json]
+  python benchmarks/bench_hot_paths.py compare base.json head.json [--threshold 0.1]
+  python benchmarks/bench_hot_paths.py revisions <base-rev> <head-rev> [run options]
+
+``revisions`` checks both revisions out into temporary git worktrees, runs
+this copy of the suite against each, and reports regressions of the head
+against the base. ``compare`` exits with status 1 when there are any.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import wave
+import shutil
+import struct
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMAGE_SIZES = {'small': (128, 128), 'medium': (800, 600), 'large': (1920, 1080)}
+AUDIO_SECONDS = {'short': 2, 'long': 20}
+IMPORT_SIZES = [10, 100, 1000, 10000]
+#buffered imports are capped by IMPORT_MAX_BYTES, larger lists are streamed only
+BUFFERED_IMPORT_MAX_ITEMS = 1000
+
+#entry point for gunicorn: rate limits off, gevent patched first when used
+WSGI_SHIM = """
+import os
+if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+import app as tierlist_app
+tierlist_app.app.config['RATELIMIT_ENABLED'] = False
+tierlist_app.limiter.enabled = False
+application = tierlist_app.app
+"""
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid='self'):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(parent):
+    """direct children of a process, from /proc"""
+    children = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                #the command name may contain spaces, fields follow the last ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            children.append(int(name))
+    return children
+
+
+def git_revision(root):
+    try:
+        return subprocess.run(
+            ['git', '-C', root, 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Corpora
+
+def make_image(size, fmt):
+    """smooth gradient with mild noise, compresses like a real picture"""
+    import numpy as np
+    from PIL import Image
+
+    width, height = size
+    rng = np.random.default_rng(width * height)
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    pixels = np.concatenate([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    pixels = np.clip(pixels + rng.normal(0, 12, pixels.shape), 0, 255).astype('uint8')
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, fmt, quality=85)
+    return buf.getvalue()
+
+
+def make_wav(seconds, rate=22050):
+    import numpy as np
+
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (np.sin(2 * np.pi * 220 * t) * 12000).astype('<i2')
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+def build_media_corpus():
+    """name -> (filename, bytes)"""
+    corpus = {}
+    for label, size in IMAGE_SIZES.items():
+        corpus[f'png_{label}'] = (f'bench_{label}.png', make_image(size, 'PNG'))
+        corpus[f'jpeg_{label}'] = (f'bench_{label}.jpg', make_image(size, 'JPEG'))
+    for label, seconds in AUDIO_SECONDS.items():
+        corpus[f'wav_{label}'] = (f'bench_{label}.wav', make_wav(seconds))
+    return corpus
+
+
+def make_tierlist(items, filenames):
+    """tierlist JSON with ``items`` entries over 5 tiers, a tenth of them missing"""
+    tiers = [{'label': label, 'color': '#888888', 'files': []} for label in 'SABCD']
+    for i in range(items):
+        filename = filenames[i % len(filenames)] if i % 10 else f'missing_{i:06d}.png'
+        tiers[i % len(tiers)]['files'].append({
+            'filename': filename,
+            'original_name': f'item {i}.png',
+            'is_audio': filename.endswith('.wav'),
+        })
+    return json.dumps({'title': f'bench {items}', 'tiers': tiers}).encode('utf-8')
+
+
+def multipart(field, filename, data, content_type='application/octet-stream'):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+# Scenarios: each yields (variant, request factory); a request is
+# (method, path, body, headers)
+
+def upload_scenarios(corpus):
+    for name, (filename, data) in corpus.items():
+        def request(i, filename=filename, data=data):
+            #a unique trailer after the end marker defeats deduplication
+            body, content_type = multipart('files', filename, data + struct.pack('<q', i))
+            return 'POST', '/upload', body, {'Content-Type': content_type}
+        yield name, request
+
+
+def serve_scenarios(uploaded, size=None):
+    for name, url in uploaded.items():
+        if size and not name.startswith(('png', 'jpeg')):
+            continue
+        path = f'{url}?size={size}' if size else url
+
+        def request(i, path=path):
+            return 'GET', path, None, {'Accept': 'image/webp,*/*'}
+        yield name, request
+
+
+def import_scenarios(filenames, sizes):
+    for items in sizes:
+        document = make_tierlist(items, filenames)
+        modes = ['stream'] if items > BUFFERED_IMPORT_MAX_ITEMS else ['buffered', 'stream']
+        for mode in modes:
+            path = '/import?stream=1' if mode == 'stream' else '/import'
+
+            def request(i, document=document, path=path):
+                body, content_type = multipart('file', 'tierlist.json', document, 'application/json')
+                return 'POST', path, body, {'Content-Type': content_type}
+            yield f'{items}_{mode}', request
+
+
+def index_scenarios():
+    yield 'page', lambda i: ('GET', '/', None, {})
+
+
+# Targets
+
+class ClientTarget:
+    """the app in this process through the Flask test client"""
+
+    name = 'client'
+
+    def __init__(self, root, workdir):
+        os.environ.update(bench_environment(workdir))
+        os.chdir(root)
+        sys.path.insert(0, root)
+        import app as tierlist_app
+        tierlist_app.app.config['RATELIMIT_ENABLED'] = False
+        tierlist_app.limiter.enabled = False
+        self.app = tierlist_app.app
+        self.local = threading.local()
+
+    def send(self, method, path, body, headers):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=body, headers=headers)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+
+    def rss(self):
+        return {'process': rss_mb()}
+
+    def close(self):
+        pass
+
+
+class GunicornTarget:
+    """a local gunicorn run with the tree's gunicorn.conf.py"""
+
+    name = 'gunicorn'
+
+    def __init__(self, root, workdir, workers, worker_class):
+        self.port = free_port()
+        shim_dir = os.path.join(workdir, 'shim')
+        os.makedirs(shim_dir)
+        with open(os.path.join(shim_dir, 'bench_wsgi.py'), 'w') as f:
+            f.write(WSGI_SHIM)
+        env = dict(
+            os.environ,
+            GUNICORN_WORKERS=str(workers),
+            GUNICORN_WORKER_CLASS=worker_class,
+            PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'metrics'),
+            **bench_environment(workdir)
+        )
+        cmd = [
+            sys.executable, '-m', 'gunicorn',
+            '-c', 'gunicorn.conf.py',
+            '--bind', f'127.0.0.1:{self.port}',
+            '--pid', os.path.join(workdir, 'gunicorn.pid'),
+            '--pythonpath', f'{shim_dir},{root}',
+            '--access-logfile', '/dev/null',
+            '--worker-class', worker_class,
+            '--workers', str(workers),
+            'bench_wsgi:application',
+        ]
+        self.server = subprocess.Popen(cmd, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.local = threading.local()
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if self.send('GET', '/health', None, {})[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.server.kill()
+        raise RuntimeError(f"gunicorn did not start: {self.server.stderr.read().decode()[-2000:]}")
+
+    def send(self, method, path, body, headers):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (http.client.HTTPException, OSError):
+            #the server closed a kept-alive connection, retry once on a new one
+            conn.close()
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+
+    def rss(self):
+        return {str(pid): rss_mb(pid) for pid in child_pids(self.server.pid)}
+
+    def close(self):
+        self.server.terminate()
+        try:
+            self.server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.server.kill()
+
+
+def bench_environment(workdir):
+    return {
+        'FLASK_ENV': 'development',
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'TIERLIST_STORE_URL': 'sqlite:///' + os.path.join(workdir, 'tierlists.db'),
+        'RECOGNITION_CACHE_PATH': os.path.join(workdir, 'recognition.db'),
+        'SIMILARITY_INDEX_PATH': os.path.join(workdir, 'image_hashes.db'),
+        'CACHE_REDIS_URL': 'memory://',
+        'RATELIMIT_STORAGE_URL': 'memory://',
+    }
+
+
+def drive(target, request, count, concurrency, warmup):
+    """send ``count`` requests from ``concurrency`` threads, timing each"""
+    for i in range(warmup):
+        target.send(*request(-1 - i))
+
+    latencies = []
+    errors = []
+
+    def one(i):
+        method, path, body, headers = request(i)
+        start = time.perf_counter()
+        try:
+            status, _ = target.send(method, path, body, headers)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(str(e))
+            return
+        latencies.append(time.perf_counter() - start)
+        if status >= 400:
+            errors.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+def run_target(target, args, corpus):
+    results = []
+    scenarios = args.scenarios.split(',')
+    uploaded = {}
+    filenames = []
+    #one upload of every corpus file for the serve and import scenarios
+    for name, (filename, data) in corpus.items():
+        body, content_type = multipart('files', filename, data)
+        status, response = target.send('POST', '/upload', body, {'Content-Type': content_type})
+        if status != 200:
+            raise RuntimeError(f"setup upload of {filename} failed with {status}: {response[:200]!r}")
+        info = json.loads(response)['files'][0]
+        uploaded[name] = info['url']
+        filenames.append(info['filename'])
+    #let background thumbnails for the setup uploads finish
+    time.sleep(2)
+
+    plan = []
+    if 'upload' in scenarios:
+        plan += [('upload', v, r) for v, r in upload_scenarios(corpus)]
+    if 'serve' in scenarios:
+        plan += [('serve', v, r) for v, r in serve_scenarios(uploaded)]
+    if 'thumb' in scenarios:
+        plan += [('thumb', v, r) for v, r in serve_scenarios(uploaded, size='thumb')]
+    if 'import' in scenarios:
+        sizes = [int(size) for size in args.import_sizes.split(',')]
+        plan += [('import', v, r) for v, r in import_scenarios(filenames, sizes)]
+    if 'index' in scenarios:
+        plan += [('index', v, r) for v, r in index_scenarios()]
+
+    for scenario, variant, request in plan:
+        #big imports are slow per request, keep their runs short
+        count = args.requests if scenario != 'import' else max(5, args.requests // max(1, int(variant.split('_')[0]) // 100))
+        latencies, errors, elapsed = drive(target, request, count, args.concurrency, args.warmup)
+        rss = {pid: value for pid, value in target.rss().items() if value is not None}
+        result = {
+            'target': target.name,
+            'scenario': scenario,
+            'variant': variant,
+            'requests': count,
+            'errors': len(errors),
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'rss_mb': rss,
+            'rss_max_mb': max(rss.values(), default=None),
+        }
+        if errors:
+            result['error_sample'] = [str(e) for e in errors[:5]]
+        results.append(result)
+        print(format_result(result), file=sys.stderr)
+    return results
+
+
+def format_result(result):
+    rss = f"{result['rss_max_mb']:7.1f} MB" if result['rss_max_mb'] is not None else '      n/a'
+    return (f"{result['target']:>8} {result['scenario']:>6} {result['variant']:<16} "
+            f"{result['rps']:8.1f} req/s  p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+            f"rss {rss}  errors {result['errors']}")
+
+
+def run(args):
+    root = os.path.abspath(args.root)
+    corpus = build_media_corpus()
+    results = []
+    for target_name in args.targets.split(','):
+        workdir = tempfile.mkdtemp(prefix='bench-hot-')
+        try:
+            if target_name == 'client':
+                #the test client imports the app, keep that out of this process
+                results += run_client_subprocess(args, root, workdir)
+                continue
+            target = GunicornTarget(root, workdir, args.workers, args.worker_class)
+            try:
+                results += run_target(target, args, corpus)
+            finally:
+                target.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'revision': git_revision(root),
+            'root': root,
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'params': {key: value for key, value in vars(args).items() if key not in ('func', 'output')},
+        },
+        'results': results,
+    }
+    write_report(report, args.output)
+    return report
+
+
+def run_client_subprocess(args, root, workdir):
+    """run the client target in a fresh interpreter (one app import per tree)"""
+    output = os.path.join(workdir, 'client.json')
+    cmd = [sys.executable, os.path.abspath(__file__), 'client-worker', '--root', root, '--workdir', workdir,
+           '--output', output, *run_arguments(args)]
+    subprocess.run(cmd, check=True)
+    with open(output) as f:
+        return json.load(f)
+
+
+def client_worker(args):
+    target = ClientTarget(os.path.abspath(args.root), args.workdir)
+    results = run_target(target, args, build_media_corpus())
+    with open(args.output, 'w') as f:
+        json.dump(results, f)
+
+
+def write_report(report, output):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+# Comparison
+
+# metric -> (direction, threshold option); +1 means higher is worse
+METRICS = {
+    'p50_ms': (1, 'threshold'),
+    'p99_ms': (1, 'p99_threshold'),
+    'rps': (-1, 'threshold'),
+    'rss_max_mb': (1, 'rss_threshold'),
+}
+
+
+def compare_reports(base, head, args):
+    """list of (key, metric, base, head, change, regressed)"""
+    base_results = {(r['target'], r['scenario'], r['variant']): r for r in base['results']}
+    rows = []
+    for result in head['results']:
+        key = (result['target'], result['scenario'], result['variant'])
+        before = base_results.get(key)
+        if before is None:
+            continue
+        for metric, (direction, option) in METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change * direction > getattr(args, option)
+            if metric.endswith('_ms') and abs(new - old) < args.min_delta_ms:
+                #sub-millisecond jitter on fast paths is not a regression
+                regressed = False
+            rows.append((key, metric, old, new, change, regressed))
+        if result['errors'] > before['errors']:
+            rows.append((key, 'errors', before['errors'], result['errors'], float('inf'), True))
+    return rows
+
+
+def print_comparison(rows, base, head):
+    print(f"base {base['meta'].get('revision')}  head {head['meta'].get('revision')}")
+    for key, metric, old, new, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f"{'/'.join(key):<40} {metric:>10} {old:10.2f} -> {new:10.2f}  {change * 100:+7.1f}%  {flag}")
+    regressions = sum(1 for row in rows if row[5])
+    print(f"{regressions} regression(s) in {len(rows)} comparisons")
+    return regressions
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    regressions = print_comparison(compare_reports(base, head, args), base, head)
+    sys.exit(1 if regressions else 0)
+
+
+def revisions(args):
+    workdir = tempfile.mkdtemp(prefix='bench-revs-')
+    reports = []
+    try:
+        for revision in (args.base_rev, args.head_rev):
+            tree = os.path.join(workdir, revision.replace('/', '_'))
+            subprocess.run(['git', '-C', ROOT, 'worktree', 'add', '--detach', tree, revision],
+                           check=True, stdout=subprocess.DEVNULL)
+            output = os.path.join(workdir, f"{revision.replace('/', '_')}.json")
+            print(f"benchmarking {revision}", file=sys.stderr)
+            subprocess.run([sys.executable, os.path.abspath(__file__), 'run', '--root', tree,
+                            '--output', output, *run_arguments(args)], check=True)
+            with open(output) as f:
+                reports.append(json.load(f))
+        if args.output:
+            write_report({'base': reports[0], 'head': reports[1]}, args.output)
+        regressions = print_comparison(compare_reports(reports[0], reports[1], args), *reports)
+    finally:
+        for revision in (args.base_rev, args.head_rev):
+            tree = os.path.join(workdir, revision.replace('/', '_'))
+            if os.path.isdir(tree):
+                subprocess.run(['git', '-C', ROOT, 'worktree', 'remove', '--force', tree],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if regressions else 0)
+
+
+RUN_OPTIONS = ['targets', 'scenarios', 'requests', 'warmup', 'concurrency', 'workers', 'worker_class', 'import_sizes']
+
+
+def run_arguments(args):
+    """the run options of ``args`` as command line arguments"""
+    argv = []
+    for option in RUN_OPTIONS:
+        argv += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    return argv
+
+
+def add_run_options(parser):
+    parser.add_argument('--targets', default='client,gunicorn')
+    parser.add_argument('--scenarios', default='upload,serve,thumb,import,index')
+    parser.add_argument('--requests', type=int, default=200, help='per scenario variant')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class')
+    parser.add_argument('--import-sizes', default=','.join(map(str, IMPORT_SIZES)))
+
+
+def add_compare_options(parser):
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed p50/throughput change')
+    parser.add_argument('--p99-threshold', type=float, default=0.25)
+    parser.add_argument('--rss-threshold', type=float, default=0.15)
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore smaller latency changes')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='benchmark one tree')
+    run_parser.add_argument('--root', default=ROOT, help='app tree to benchmark')
+    run_parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    add_run_options(run_parser)
+    run_parser.set_defaults(func=run)
+
+    worker_parser = commands.add_parser('client-worker')
+    worker_parser.add_argument('--root', required=True)
+    worker_parser.add_argument('--workdir', required=True)
+    worker_parser.add_argument('--output', required=True)
+    add_run_options(worker_parser)
+    worker_parser.set_defaults(func=client_worker)
+
+    compare_parser = commands.add_parser('compare', help='flag regressions between two reports')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    add_compare_options(compare_parser)
+    compare_parser.set_defaults(func=compare)
+
+    revisions_parser = commands.add_parser('revisions', help='benchmark and compare two git revisions')
+    revisions_parser.add_argument('base_rev')
+    revisions_parser.add_argument('head_rev')
+    revisions_parser.add_argument('--output', help='write both reports here')
+    add_run_options(revisions_parser)
+    add_compare_options(revisions_parser)
+    revisions_parser.set_defaults(func=revisions)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Rate limiter overhead: redis vs hybrid storage
+
+Runs the same small Flask app with flask-limiter once on the plain redis
+storage (one round trip per checked limit) and once on the hybrid storage
+(per-worker counters, batched sync), plus a baseline without limits. It
+reports the added latency per request and the Redis round trips made.
+Needs a reachable Redis; the database given in the URL is flushed.
+
+Usage: python benchmarks/bench_ratelimit.py [--redis-url redis://localhost:6379/15] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import redis
+from flask import Flask
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from ratelimit_storage import hybrid_storage_uri
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_app(storage_uri, storage_options, limited):
+    app = Flask(__name__)
+    limiter = Limiter(
+        get_remote_address,
+        app=app,
+        default_limits=["1000000 per day", "100000 per hour"],
+        storage_uri=storage_uri,
+        storage_options=storage_options,
+        enabled=limited
+    )
+
+    @app.route('/uploads/<filename>')
+    @limiter.limit("1000000 per minute")
+    def uploaded_file(filename):
+        return filename
+
+    #the decorators only hold a weak reference to the limiter
+    return app, limiter
+
+
+ROUND_TRIPS = [0]
+send_packed_command = redis.connection.Connection.send_packed_command
+
+
+def counting_send_packed_command(self, *args, **kwargs):
+    #one call per request/response cycle; a pipeline counts once
+    ROUND_TRIPS[0] += 1
+    return send_packed_command(self, *args, **kwargs)
+
+
+redis.connection.Connection.send_packed_command = counting_send_packed_command
+
+
+def run_mode(mode, args, client):
+    if mode == 'hybrid':
+        app, limiter = make_app(hybrid_storage_uri(args.redis_url), {'sync_interval': args.sync_interval}, True)
+    else:
+        app, limiter = make_app(args.redis_url, {}, mode == 'redis')
+    test_client = app.test_client()
+
+    client.flushdb()
+    for i in range(args.warmup):
+        test_client.get(f'/uploads/tile{i}.png')
+
+    before = ROUND_TRIPS[0]
+    latencies = []
+    started = time.perf_counter()
+    for i in range(args.requests):
+        start = time.perf_counter()
+        test_client.get(f'/uploads/tile{i % 100}.png')
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    round_trips = ROUND_TRIPS[0] - before
+
+    return {
+        'mode': mode,
+        'requests': args.requests,
+        'mean_us': elapsed / args.requests * 1e6,
+        'p50_us': percentile(latencies, 50) * 1e6,
+        'p99_us': percentile(latencies, 99) * 1e6,
+        'redis_round_trips_per_request': round_trips / args.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--redis-url', default='redis://localhost:6379/15')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--sync-interval', type=float, default=0.5)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    client = redis.from_url(args.redis_url)
+    results = [run_mode(mode, args, client) for mode in ('none', 'redis', 'hybrid')]
+    baseline = results[0]['mean_us']
+    for result in results:
+        result['limiter_overhead_us'] = result['mean_us'] - baseline
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['mode']:>6}: mean {result['mean_us']:8.1f} us  p50 {result['p50_us']:8.1f} us  "
+              f"p99 {result['p99_us']:8.1f} us  limiter overhead {result['limiter_overhead_us']:8.1f} us  "
+              f"redis round trips/request {result['redis_round_trips_per_request']:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Perceptual hash index query latency
+
+Fills an ImageHashIndex with random 64 bit hashes (in a temporary SQLite
+file) and times near-duplicate plus top-k queries over the whole index,
+with NumPy's popcount and with the SWAR fallback used on NumPy < 2.
+
+Usage: python benchmarks/bench_similarity.py [--sizes 10000,100000,1000000] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import similarity
+from similarity import ImageHashIndex
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def fill(index, size, rng):
+    values = rng.integers(0, 2 ** 63, size=size, dtype=np.int64)
+    conn = index.connection()
+    with conn:
+        conn.executemany(
+            'INSERT INTO image_hashes (filename, digest, hash) VALUES (?, ?, ?)',
+            ((f'img{i}.png', f'{i:064x}', int(value)) for i, value in enumerate(values))
+        )
+    started = time.perf_counter()
+    index.refresh()
+    return time.perf_counter() - started
+
+
+def run(size, args, rng):
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ImageHashIndex(os.path.join(tmp, 'hashes.db'))
+        load_seconds = fill(index, size, rng)
+        queries = [int(value) for value in rng.integers(0, 2 ** 63, size=args.queries, dtype=np.int64)]
+        results = {'size': size, 'load_ms': load_seconds * 1000}
+        for mode in ('numpy', 'swar'):
+            if mode == 'numpy' and not hasattr(np, 'bitwise_count'):
+                continue
+            saved = getattr(np, 'bitwise_count', None)
+            if mode == 'swar' and saved is not None:
+                del np.bitwise_count
+            try:
+                latencies = []
+                for value in queries:
+                    start = time.perf_counter()
+                    index.query(value, k=args.k, max_distance=10)
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                if saved is not None:
+                    np.bitwise_count = saved
+            results[f'{mode}_p50_ms'] = percentile(latencies, 50) * 1000
+            results[f'{mode}_p99_ms'] = percentile(latencies, 99) * 1000
+        #the fallback must agree with NumPy's popcount
+        sample = index.hashes[:min(size, 10000)]
+        if hasattr(np, 'bitwise_count'):
+            saved = np.bitwise_count
+            del np.bitwise_count
+            try:
+                assert np.array_equal(similarity.popcount(sample), saved(sample))
+            finally:
+                np.bitwise_count = saved
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = [run(int(size), args, rng) for size in args.sizes.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        line = f"{result['size']:>9} hashes: load {result['load_ms']:8.1f} ms"
+        for mode in ('numpy', 'swar'):
+            if f'{mode}_p50_ms' in result:
+                line += f"  {mode} p50 {result[f'{mode}_p50_ms']:6.2f} ms p99 {result[f'{mode}_p99_ms']:6.2f} ms"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
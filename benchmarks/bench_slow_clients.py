@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Slow-client load test: sync vs gevent gunicorn workers
+
+Starts a local gunicorn per worker mode, trickles multipart uploads from a
+number of slow clients and meanwhile hammers /health from a few fast
+clients. Reports fast-path throughput and latency while the slow uploads
+are in flight.
+
+Usage: python benchmarks/bench_slow_clients.py [--modes sync,gevent] [--json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = {
+    'sync': 'wsgi:application',
+    'gevent': 'wsgi_gevent:application',
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workers, workdir):
+    """run gunicorn in the given worker mode and wait for /health"""
+    env = dict(
+        os.environ,
+        FLASK_ENV='development',
+        GUNICORN_WORKER_CLASS=mode,
+        GUNICORN_WORKERS=str(workers),
+        UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+        TIERLIST_STORE_URL='sqlite:///' + os.path.join(workdir, 'tierlists.db'),
+        CACHE_REDIS_URL='memory://',
+    )
+    cmd = [
+        sys.executable, '-m', 'gunicorn',
+        '-c', 'gunicorn.conf.py',
+        '--bind', f'127.0.0.1:{port}',
+        '--pid', os.path.join(workdir, 'gunicorn.pid'),
+        '--access-logfile', '/dev/null',
+        '--timeout', '120',
+        ENTRY_POINTS[mode],
+    ]
+    server = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"gunicorn ({mode}) did not start: {server.stderr.read().decode()[-2000:]}")
+
+
+def slow_upload(port, size, seconds, results):
+    """send one multipart upload spread evenly over `seconds`"""
+    boundary = 'benchboundary'
+    payload = b'\x89PNG\r\n\x1a\n' + os.urandom(size)
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="slow.png"\r\n'
+        f'Content-Type: image/png\r\n\r\n'
+    ).encode() + payload + f'\r\n--{boundary}--\r\n'.encode()
+    headers = (
+        f'POST /upload HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: {len(body)}\r\n'
+        f'Content-Type: multipart/form-data; boundary={boundary}\r\nConnection: close\r\n\r\n'
+    ).encode()
+
+    start = time.monotonic()
+    status = 'error'
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=seconds + 60) as sock:
+            sock.sendall(headers)
+            steps = 50
+            step = max(1, len(body) // steps)
+            for offset in range(0, len(body), step):
+                sock.sendall(body[offset:offset + step])
+                time.sleep(seconds / steps)
+            status = sock.recv(64).split(b' ')[1].decode()
+    except (OSError, IndexError):
+        pass
+    results.append((status, time.monotonic() - start))
+
+
+def fast_probe(port, deadline, latencies, failures):
+    """request /health back to back until the deadline"""
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            conn.request('GET', '/health')
+            conn.getresponse().read()
+            latencies.append(time.monotonic() - start)
+        except OSError:
+            failures.append(time.monotonic() - start)
+
+
+def run_mode(mode, args):
+    workdir = tempfile.mkdtemp(prefix=f'bench-{mode}-')
+    port = free_port()
+    server = start_server(mode, port, args.workers, workdir)
+    try:
+        uploads, latencies, failures = [], [], []
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=slow_upload, args=(port, args.upload_kb * 1024, args.duration, uploads))
+            for _ in range(args.slow_clients)
+        ]
+        threads += [
+            threading.Thread(target=fast_probe, args=(port, deadline, latencies, failures))
+            for _ in range(args.fast_clients)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        statuses = {}
+        for status, _ in uploads:
+            statuses[status] = statuses.get(status, 0) + 1
+        return {
+            'mode': mode,
+            'workers': args.workers,
+            'slow_clients': args.slow_clients,
+            'health_requests': len(latencies),
+            'health_failures': len(failures),
+            'health_rps': len(latencies) / elapsed,
+            'health_p50_ms': percentile(latencies, 50) * 1000,
+            'health_p99_ms': percentile(latencies, 99) * 1000,
+            'health_max_ms': max(latencies, default=float('nan')) * 1000,
+            'upload_statuses': statuses,
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', default='sync,gevent', help='comma separated worker classes')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--slow-clients', type=int, default=8, help='stays below the 20/min upload limit')
+    parser.add_argument('--fast-clients', type=int, default=4)
+    parser.add_argument('--upload-kb', type=int, default=256)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds each slow upload takes')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    results = [run_mode(mode, args) for mode in args.modes.split(',')]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['mode']:>7}: /health {result['health_rps']:8.1f} req/s  "
+              f"p50 {result['health_p50_ms']:8.1f} ms  p99 {result['health_p99_ms']:8.1f} ms  "
+              f"max {result['health_max_ms']:8.1f} ms  failures {result['health_failures']}  "
+              f"uploads {result['upload_statuses']}")
+
+
+if __name__ == '__main__':
+    main()
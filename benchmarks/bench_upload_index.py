@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compare /import file resolution: one os.path.exists per item vs UploadIndex
+
+Usage: python benchmarks/bench_upload_index.py [--entries 10000] [--lookups 2000]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upload_index import UploadIndex
+
+
+def make_upload_dir(path, entries):
+    """fill a directory with empty upload-like files"""
+    names = []
+    for i in range(entries):
+        name = f"item{i}_{i:012x}.png"
+        open(os.path.join(path, name), 'wb').close()
+        names.append(name)
+    return names
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=10000, help='files in the upload folder')
+    parser.add_argument('--lookups', type=int, default=2000, help='filenames resolved per import')
+    parser.add_argument('--missing', type=float, default=0.05, help='fraction of lookups that do not exist')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dir', help='directory to benchmark in (e.g. on a network mount)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(dir=args.dir)
+    try:
+        names = make_upload_dir(root, args.entries)
+        lookups = random.sample(names, min(args.lookups, len(names)))
+        for i in range(int(len(lookups) * args.missing)):
+            lookups[i] = f"missing{i}.png"
+
+        def stat_each():
+            return [name for name in lookups if os.path.exists(os.path.join(root, name))]
+
+        index = UploadIndex(root, refresh_interval=3600)
+        build_time = timed(index.build, 1)
+
+        def index_batch():
+            return index.contains_many(lookups)
+
+        assert set(stat_each()) == index_batch()
+
+        stat_time = timed(stat_each, args.repeat)
+        index_time = timed(index_batch, args.repeat)
+
+        print(f"entries={args.entries} lookups={len(lookups)} missing={args.missing:.0%}")
+        print(f"index build (one scandir):   {build_time * 1000:9.2f} ms")
+        print(f"os.path.exists per item:     {stat_time * 1000:9.2f} ms")
+        print(f"UploadIndex.contains_many:   {index_time * 1000:9.2f} ms")
+        print(f"speedup:                     {stat_time / index_time:9.1f}x")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,577 @@
+"""
+Live collaborative tierlist sessions
+
+Every edit in a session is a small operation (move a file, relabel or
+add tiers, add or remove files). Operations are numbered by a per-session
+op log, and every subscriber applies them in that order, so all clients
+converge on the same state without ever resending it whole. Every
+``snapshot_interval`` operations the log is compacted into a snapshot,
+which is what a new viewer receives along with the operations since.
+
+Without Redis the log and the fan-out live in the process, which is only
+correct with a single worker. With Redis the log is a list appended by a
+Lua script and every operation is published once per session channel.
+Each worker holds one pub/sub connection and fans the messages out to its
+local viewers, so the cost per viewer is a queue put, not a Redis
+connection.
+"""
+import os
+import json
+import time
+import queue
+import secrets
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER_LABELS = ('S', 'A', 'B', 'C', 'D', 'F', 'G', 'H')
+MAX_LABEL_LENGTH = 100
+MAX_FILES_PER_OP = 100
+MAX_CLIENT_ID_LENGTH = 64
+REDIS_PREFIX = 'tierlist:collab:'
+
+#append ops and publish them under one version counter, atomically;
+#KEYS: version, ops, snapshot  ARGV: ttl, channel, op...
+APPEND_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    return nil
+end
+local versions = {}
+for i = 3, #ARGV do
+    local version = redis.call('INCR', KEYS[1])
+    local entry = version .. ' ' .. ARGV[i]
+    redis.call('RPUSH', KEYS[2], entry)
+    redis.call('PUBLISH', ARGV[2], entry)
+    versions[#versions + 1] = version
+end
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[1])
+end
+versions[#versions + 1] = redis.call('LLEN', KEYS[2])
+return versions
+"""
+
+
+class OpRejected(ValueError):
+    """an operation that is malformed or not allowed"""
+
+
+def tier_label(index):
+    """default label of the tier at index, as the browser picks it"""
+    return DEFAULT_TIER_LABELS[index] if index < len(DEFAULT_TIER_LABELS) else f'T{index + 1}'
+
+
+def new_session_id():
+    return secrets.token_urlsafe(12)
+
+
+def initial_state(tiers, available_files, pool_entries=()):
+    """session state from an imported document and its available files
+
+    The state holds each file's entry once, under ``files``; tiers and the
+    unranked ``pool`` only list filenames.
+    """
+    files = {entry['filename']: entry for entry in available_files}
+    placed = set()
+    state = {'tiers': [], 'pool': [], 'files': files}
+    for index, tier in enumerate(tiers):
+        names = []
+        for entry in tier.get('files') or tier.get('images') or []:
+            name = entry.get('filename')
+            if name in files and name not in placed:
+                names.append(name)
+                placed.add(name)
+        label = tier.get('label')
+        if not isinstance(label, str) or not label.strip():
+            label = tier_label(index)
+        state['tiers'].append({'label': label.strip()[:MAX_LABEL_LENGTH], 'files': names})
+    for entry in pool_entries:
+        name = entry.get('filename')
+        if name in files and name not in placed:
+            state['pool'].append(name)
+            placed.add(name)
+    #imported entries that were dropped from their tier still belong somewhere
+    state['pool'].extend(name for name in files if name not in placed)
+    return state
+
+
+def normalize_op(op, max_tiers):
+    """validate a client operation and return the fields that are kept
+
+    Only the shape is checked here; references to files or tiers that no
+    longer exist are skipped by ``apply_op`` the same way on every client.
+    """
+    if not isinstance(op, dict):
+        raise OpRejected('operation must be an object')
+    kind = op.get('op')
+    client = op.get('client')
+    seq = op.get('seq')
+    if not isinstance(client, str) or not 0 < len(client) <= MAX_CLIENT_ID_LENGTH:
+        raise OpRejected('invalid client id')
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+        raise OpRejected('invalid sequence number')
+    normalized = {'op': kind, 'client': client, 'seq': seq}
+
+    def index(name, upper, optional=False):
+        value = op.get(name)
+        if value is None and optional:
+            return None
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value < upper:
+            raise OpRejected(f'invalid {name}')
+        return value
+
+    def filename():
+        value = op.get('file')
+        if not isinstance(value, str) or not value or len(value) > 255:
+            raise OpRejected('invalid file')
+        return value
+
+    if kind == 'move':
+        normalized['file'] = filename()
+        normalized['tier'] = index('tier', max_tiers, optional=True)
+        position = index('index', 1 << 31, optional=True)
+        if position is not None:
+            normalized['index'] = position
+    elif kind == 'remove':
+        normalized['file'] = filename()
+    elif kind == 'label':
+        label = op.get('label')
+        if not isinstance(label, str) or not label.strip():
+            raise OpRejected('invalid label')
+        normalized['tier'] = index('tier', max_tiers)
+        normalized['label'] = label.strip()[:MAX_LABEL_LENGTH]
+    elif kind == 'tiers':
+        normalized['count'] = index('count', max_tiers + 1)
+        if normalized['count'] == 0:
+            raise OpRejected('invalid count')
+    elif kind == 'add':
+        files = op.get('files')
+        if not isinstance(files, list) or not 0 < len(files) <= MAX_FILES_PER_OP:
+            raise OpRejected('invalid files')
+        normalized['files'] = [entry for entry in files if isinstance(entry, dict)]
+    else:
+        raise OpRejected('unknown operation')
+    return normalized
+
+
+def _detach(state, name):
+    if name in state['pool']:
+        state['pool'].remove(name)
+    for tier in state['tiers']:
+        if name in tier['files']:
+            tier['files'].remove(name)
+
+
+def apply_op(state, op):
+    """apply one logged operation to a session state in place
+
+    Mirrored by ``applySessionOp`` in static/js/app.js; both must agree.
+    """
+    kind = op['op']
+    if kind == 'move':
+        name = op['file']
+        if name not in state['files']:
+            return
+        _detach(state, name)
+        tier = op['tier']
+        if tier is None or tier >= len(state['tiers']):
+            target = state['pool']
+        else:
+            target = state['tiers'][tier]['files']
+        position = op.get('index')
+        if position is None or position >= len(target):
+            target.append(name)
+        else:
+            target.insert(position, name)
+    elif kind == 'remove':
+        _detach(state, op['file'])
+        state['files'].pop(op['file'], None)
+    elif kind == 'label':
+        if op['tier'] < len(state['tiers']):
+            state['tiers'][op['tier']]['label'] = op['label']
+    elif kind == 'tiers':
+        tiers = state['tiers']
+        count = op['count']
+        while len(tiers) < count:
+            tiers.append({'label': tier_label(len(tiers)), 'files': []})
+        for tier in tiers[count:]:
+            state['pool'].extend(tier['files'])
+        del tiers[count:]
+    elif kind == 'add':
+        for entry in op['files']:
+            if entry['filename'] not in state['files']:
+                state['files'][entry['filename']] = entry
+                state['pool'].append(entry['filename'])
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def event_frame(kind, version, data):
+    """one server-sent event; data is already JSON"""
+    return f'id: {version}\nevent: {kind}\ndata: {data}\n\n'
+
+
+def snapshot_frame(version, state_json):
+    return event_frame('snapshot', version, f'{{"version":{version},"state":{state_json}}}')
+
+
+class Subscriber:
+    """one viewer's queue of (version, frame) pairs"""
+
+    def __init__(self, session_id, maxsize):
+        self.session_id = session_id
+        self.queue = queue.Queue(maxsize)
+        #set when messages may have been dropped; the stream re-reads the log
+        self.stale = False
+
+    def put(self, version, frame):
+        try:
+            self.queue.put_nowait((version, frame))
+        except queue.Full:
+            self.stale = True
+
+
+class CollabSessions(ABC):
+    """session op logs plus the fan-out to this worker's viewers
+
+    Backends implement ``create``, ``load``, ``append_entries``, ``compact``
+    and, for a shared log, ``listen``/``unlisten`` of a session's messages.
+    """
+
+    def __init__(self, ttl=86400, snapshot_interval=200, queue_size=256):
+        self.ttl = ttl
+        self.snapshot_interval = snapshot_interval
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def create(self, state):
+        """start a session from a state, returns its id"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def load(self, session_id):
+        """``(version, state_json, [(version, op_json), ...])`` or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_entries(self, session_id, op_jsons):
+        """log operations, returns (versions, log length) or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def compact(self, session_id):
+        """fold the logged operations into the snapshot"""
+        raise NotImplementedError
+
+    def listen(self, session_id):
+        pass
+
+    def unlisten(self, session_id):
+        pass
+
+    def append(self, session_id, ops):
+        """log normalized operations, returns their versions or None"""
+        result = self.append_entries(session_id, [dumps(op) for op in ops])
+        if result is None:
+            return None
+        versions, length = result
+        if length >= self.snapshot_interval:
+            try:
+                self.compact(session_id)
+            except Exception as e:
+                logger.warning(f"Could not compact session {session_id}: {str(e)}")
+        return versions
+
+    def fold(self, state_json, entries):
+        state = json.loads(state_json)
+        for _, op_json in entries:
+            apply_op(state, json.loads(op_json))
+        return dumps(state)
+
+    def subscribe(self, session_id):
+        subscriber = Subscriber(session_id, self.queue_size)
+        with self.lock:
+            subscribers = self.subscribers.setdefault(session_id, set())
+            first = not subscribers
+            subscribers.add(subscriber)
+        if first:
+            self.listen(session_id)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.session_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            last = not subscribers
+            if last:
+                del self.subscribers[subscriber.session_id]
+        if last:
+            self.unlisten(subscriber.session_id)
+
+    def viewers(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    def dispatch(self, session_id, entry):
+        """hand one logged ``"<version> <op json>"`` entry to local viewers"""
+        version, _, op_json = entry.partition(' ')
+        version = int(version)
+        #formatted once, whatever the number of viewers
+        frame = event_frame('op', version, op_json)
+        with self.lock:
+            subscribers = list(self.subscribers.get(session_id, ()))
+        for subscriber in subscribers:
+            subscriber.put(version, frame)
+
+    def mark_stale(self):
+        with self.lock:
+            subscribers = [s for group in self.subscribers.values() for s in group]
+        for subscriber in subscribers:
+            subscriber.stale = True
+
+    def stream(self, subscriber, loaded, since=None, duration=25, keepalive=15):
+        """server-sent events for one viewer
+
+        Starts with the snapshot (unless ``since``, the last event id the
+        client saw, is still covered by the log) and the logged operations,
+        then forwards live operations for ``duration`` seconds. A gap in
+        the live messages is filled from the log. The browser reconnects
+        with Last-Event-ID and resumes where it stopped.
+        """
+        session_id = subscriber.session_id
+        yield 'retry: 1000\n\n'
+        last = since
+
+        def catch_up(loaded):
+            nonlocal last
+            if loaded is None:
+                return
+            version, state_json, entries = loaded
+            if last is None or last < version or last > (entries[-1][0] if entries else version):
+                yield snapshot_frame(version, state_json)
+                last = version
+            for entry_version, op_json in entries:
+                if entry_version > last:
+                    yield event_frame('op', entry_version, op_json)
+                    last = entry_version
+
+        yield from catch_up(loaded)
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                version, frame = subscriber.queue.get(timeout=min(keepalive, remaining))
+            except queue.Empty:
+                if subscriber.stale:
+                    subscriber.stale = False
+                    yield from catch_up(self.load(session_id))
+                else:
+                    yield ': keepalive\n\n'
+                continue
+            if subscriber.stale or version > last + 1:
+                subscriber.stale = False
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                yield from catch_up(self.load(session_id))
+            elif version == last + 1:
+                yield frame
+                last = version
+
+
+class MemoryCollabSessions(CollabSessions):
+    """op logs in this process; only correct with a single worker"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sessions = {}
+        self.log_lock = threading.Lock()
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for session_id in [s for s, session in self.sessions.items() if session['touched'] < cutoff]:
+            del self.sessions[session_id]
+
+    def create(self, state):
+        session_id = new_session_id()
+        with self.log_lock:
+            self.expire()
+            self.sessions[session_id] = {
+                'version': 0, 'snapshot': (0, dumps(state)), 'ops': [], 'touched': time.monotonic()
+            }
+        return session_id
+
+    def load(self, session_id):
+        with self.log_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            version, state_json = session['snapshot']
+            return version, state_json, list(session['ops'])
+
+    def append_entries(self, session_id, op_jsons):
+        entries = []
+        with self.log_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            for op_json in op_jsons:
+                session['version'] += 1
+                session['ops'].append((session['version'], op_json))
+                entries.append(f"{session['version']} {op_json}")
+            session['touched'] = time.monotonic()
+            length = len(session['ops'])
+            #dispatch under the lock so viewers see versions in order
+            for entry in entries:
+                self.dispatch(session_id, entry)
+        return [int(entry.partition(' ')[0]) for entry in entries], length
+
+    def compact(self, session_id):
+        loaded = self.load(session_id)
+        if loaded is None or not loaded[2]:
+            return
+        _, state_json, entries = loaded
+        state_json = self.fold(state_json, entries)
+        with self.log_lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session['snapshot'] = (entries[-1][0], state_json)
+                del session['ops'][:len(entries)]
+
+
+class RedisCollabSessions(CollabSessions):
+    """op logs in Redis, fanned out to every worker through pub/sub"""
+
+    def __init__(self, redis_url, **kwargs):
+        super().__init__(**kwargs)
+        import redis
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=5, decode_responses=True)
+        self.append_script = self.redis.register_script(APPEND_SCRIPT)
+        self.pubsub = None
+        self.listener = None
+        self.listener_pid = None
+        self.pubsub_lock = threading.Lock()
+
+    def keys(self, session_id):
+        #one hash slot per session, for Redis Cluster
+        base = f'{REDIS_PREFIX}{{{session_id}}}'
+        return f'{base}:version', f'{base}:ops', f'{base}:snapshot'
+
+    def channel(self, session_id):
+        return f'{REDIS_PREFIX}{session_id}'
+
+    def create(self, state):
+        session_id = new_session_id()
+        version_key, _, snapshot_key = self.keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.set(version_key, 0, ex=self.ttl)
+        pipe.set(snapshot_key, f'0 {dumps(state)}', ex=self.ttl)
+        pipe.execute()
+        return session_id
+
+    def load(self, session_id):
+        _, ops_key, snapshot_key = self.keys(session_id)
+        pipe = self.redis.pipeline()
+        pipe.get(snapshot_key)
+        pipe.lrange(ops_key, 0, -1)
+        snapshot, entries = pipe.execute()
+        if snapshot is None:
+            return None
+        version, _, state_json = snapshot.partition(' ')
+        parsed = []
+        for entry in entries:
+            entry_version, _, op_json = entry.partition(' ')
+            parsed.append((int(entry_version), op_json))
+        return int(version), state_json, parsed
+
+    def append_entries(self, session_id, op_jsons):
+        result = self.append_script(
+            keys=self.keys(session_id), args=[self.ttl, self.channel(session_id), *op_jsons]
+        )
+        if result is None:
+            return None
+        return [int(version) for version in result[:-1]], int(result[-1])
+
+    def compact(self, session_id):
+        _, ops_key, snapshot_key = self.keys(session_id)
+        lock_key = f'{snapshot_key}:compacting'
+        if not self.redis.set(lock_key, 1, nx=True, ex=30):
+            return
+        try:
+            loaded = self.load(session_id)
+            if loaded is None or not loaded[2]:
+                return
+            _, state_json, entries = loaded
+            state_json = self.fold(state_json, entries)
+            #only compaction trims the head of the list, appends go to the tail
+            pipe = self.redis.pipeline()
+            pipe.set(snapshot_key, f'{entries[-1][0]} {state_json}', ex=self.ttl)
+            pipe.ltrim(ops_key, len(entries), -1)
+            pipe.execute()
+        finally:
+            self.redis.delete(lock_key)
+
+    def listen(self, session_id):
+        with self.pubsub_lock:
+            self.start_listener()
+            self.pubsub.subscribe(self.channel(session_id))
+
+    def unlisten(self, session_id):
+        with self.pubsub_lock:
+            if self.pubsub is not None:
+                try:
+                    self.pubsub.unsubscribe(self.channel(session_id))
+                except Exception as e:
+                    logger.warning(f"Could not unsubscribe from session {session_id}: {str(e)}")
+
+    def start_listener(self):
+        #one pub/sub connection and reader thread per worker, made after the fork
+        if self.listener is not None and self.listener_pid == os.getpid():
+            return
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.listener_pid = os.getpid()
+        self.listener = threading.Thread(target=self.listen_loop, name='collab-pubsub', daemon=True)
+        self.listener.start()
+
+    def listen_loop(self):
+        prefix_length = len(REDIS_PREFIX)
+        while True:
+            try:
+                message = self.pubsub.get_message(timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Session pub/sub connection lost: {str(e)}")
+                time.sleep(1)
+                self.resubscribe()
+                continue
+            if message is None or message['type'] != 'message':
+                continue
+            self.dispatch(message['channel'][prefix_length:], message['data'])
+
+    def resubscribe(self):
+        with self.lock:
+            session_ids = list(self.subscribers)
+        with self.pubsub_lock:
+            try:
+                self.pubsub.reset()
+                if session_ids:
+                    self.pubsub.subscribe(*[self.channel(session_id) for session_id in session_ids])
+            except Exception as e:
+                logger.warning(f"Could not resubscribe to sessions: {str(e)}")
+        #anything published meanwhile is only in the log
+        self.mark_stale()
+
+
+def create_collab_sessions(redis_url=None, **kwargs):
+    """shared sessions with a Redis URL, process-local ones without"""
+    if redis_url:
+        return RedisCollabSessions(redis_url, **kwargs)
+    return MemoryCollabSessions(**kwargs)
@@ -14,14 +14,124 @@ class Config:
     # File upload settings
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 5242880))  #5MB
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+    THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+    AUDIO_DERIVATIVE_WAIT = int(os.environ.get('AUDIO_DERIVATIVE_WAIT', 10))  #then the original plays / the waveform answers 503
+    
+    # Resumable uploads (each part is one request under MAX_CONTENT_LENGTH)
+    RESUMABLE_PART_SIZE = int(os.environ.get('RESUMABLE_PART_SIZE', 2097152))  #2MB
+    RESUMABLE_MAX_BYTES = int(os.environ.get('RESUMABLE_MAX_BYTES', 52428800))  #50MB
+    RESUMABLE_SESSION_TTL = int(os.environ.get('RESUMABLE_SESSION_TTL', 86400))
+    
+    # Media storage: local: keeps blobs in UPLOAD_FOLDER, s3://bucket/prefix
+    # (?endpoint=http://minio:9000&region=...&public_url=...) stores them in
+    # a bucket and lets browsers upload and download with presigned URLs
+    MEDIA_STORAGE_URL = os.environ.get('MEDIA_STORAGE_URL', 'local:')
+    MEDIA_STORAGE_ACCESS_KEY = os.environ.get('MEDIA_STORAGE_ACCESS_KEY')
+    MEDIA_STORAGE_SECRET_KEY = os.environ.get('MEDIA_STORAGE_SECRET_KEY')
+    #direct (presigned) uploads from the browser; default: on with a bucket
+    DIRECT_UPLOADS = os.environ.get('DIRECT_UPLOADS', '').lower() or None
+    DIRECT_UPLOAD_EXPIRES = int(os.environ.get('DIRECT_UPLOAD_EXPIRES', 900))
+    DOWNLOAD_URL_EXPIRES = int(os.environ.get('DOWNLOAD_URL_EXPIRES', 3600))
+    
+    # Upload filename index used by /import (shared through Redis when set)
+    UPLOAD_INDEX_REDIS_URL = os.environ.get('UPLOAD_INDEX_REDIS_URL')
+    UPLOAD_INDEX_REFRESH_INTERVAL = int(os.environ.get('UPLOAD_INDEX_REFRESH_INTERVAL', 60))
+    
+    # Upload GC: names no shared tierlist uses and nothing touched within the
+    # grace period are deleted by a paced background sweep (0 = no sweeps)
+    UPLOAD_GC_INTERVAL = int(os.environ.get('UPLOAD_GC_INTERVAL', 0))
+    UPLOAD_GC_GRACE_DAYS = float(os.environ.get('UPLOAD_GC_GRACE_DAYS', 30))
+    UPLOAD_GC_OPS_PER_SECOND = int(os.environ.get('UPLOAD_GC_OPS_PER_SECOND', 50))
+    UPLOAD_GC_DRY_RUN = os.environ.get('UPLOAD_GC_DRY_RUN', 'false').lower() == 'true'
+    
+    # Live collaboration sessions (op log and fan-out shared through Redis
+    # when set; without it sessions only work with a single worker). Event
+    # streams end after COLLAB_STREAM_SECONDS and the browser resumes them,
+    # which keeps sync workers under the gunicorn timeout. A sync/gthread
+    # worker keeps at most COLLAB_THREAD_STREAMS streams open (no cap under
+    # gevent) and tells further viewers to retry
+    COLLAB_REDIS_URL = os.environ.get('COLLAB_REDIS_URL')
+    COLLAB_SESSION_TTL = int(os.environ.get('COLLAB_SESSION_TTL', 86400))
+    COLLAB_SNAPSHOT_INTERVAL = int(os.environ.get('COLLAB_SNAPSHOT_INTERVAL', 200))
+    COLLAB_STREAM_SECONDS = int(os.environ.get('COLLAB_STREAM_SECONDS', 25))
+    COLLAB_THREAD_STREAMS = int(os.environ.get('COLLAB_THREAD_STREAMS', 1))
+    COLLAB_KEEPALIVE_SECONDS = int(os.environ.get('COLLAB_KEEPALIVE_SECONDS', 15))
+    COLLAB_QUEUE_SIZE = int(os.environ.get('COLLAB_QUEUE_SIZE', 256))
+    COLLAB_MAX_OPS_PER_REQUEST = int(os.environ.get('COLLAB_MAX_OPS_PER_REQUEST', 50))
+    
+    # Shared tierlists (sqlite:///relative.db or sqlite:////absolute.db)
+    TIERLIST_STORE_URL = os.environ.get('TIERLIST_STORE_URL', 'sqlite:///data/tierlists.db')
+    #versioned tierlists keep a full snapshot every N revisions, patches otherwise
+    TIERLIST_SNAPSHOT_INTERVAL = int(os.environ.get('TIERLIST_SNAPSHOT_INTERVAL', 50))
+    TIERLIST_PATCH_MAX_OPS = int(os.environ.get('TIERLIST_PATCH_MAX_OPS', 1000))
+    TIERLIST_HEAD_CACHE_SIZE = int(os.environ.get('TIERLIST_HEAD_CACHE_SIZE', 256))
+    
+    # Image recognition proxy (any OpenAI-style chat completions endpoint)
+    RECOGNITION_API_URL = os.environ.get('RECOGNITION_API_URL', 'https://ai.hackclub.com/chat/completions')
+    RECOGNITION_MODEL = os.environ.get('RECOGNITION_MODEL')
+    RECOGNITION_TIMEOUT = int(os.environ.get('RECOGNITION_TIMEOUT', 15))
+    RECOGNITION_CONCURRENCY = int(os.environ.get('RECOGNITION_CONCURRENCY', 4))
+    RECOGNITION_BATCH_LIMIT = int(os.environ.get('RECOGNITION_BATCH_LIMIT', 100))
+    RECOGNITION_BATCH_SECONDS = int(os.environ.get('RECOGNITION_BATCH_SECONDS', 20))  #then misses answer pending; below the 30s worker timeout
+    RECOGNITION_CACHE_PATH = os.environ.get('RECOGNITION_CACHE_PATH', 'data/recognition.db')
+    RECOGNITION_CACHE_TTL = int(os.environ.get('RECOGNITION_CACHE_TTL', 2592000))  #30 days
+    RECOGNITION_CACHE_MAX_ENTRIES = int(os.environ.get('RECOGNITION_CACHE_MAX_ENTRIES', 100000))
+    
+    # Perceptual hash index for near-duplicate and similar image lookup
+    SIMILARITY_INDEX_PATH = os.environ.get('SIMILARITY_INDEX_PATH', 'data/image_hashes.db')
+    SIMILARITY_MAX_DISTANCE = int(os.environ.get('SIMILARITY_MAX_DISTANCE', 10))  #of 64 bits
+    SIMILARITY_MAX_RESULTS = int(os.environ.get('SIMILARITY_MAX_RESULTS', 50))
+    
+    # Consensus rankings over shared and saved tierlists
+    CONSENSUS_INDEX_PATH = os.environ.get('CONSENSUS_INDEX_PATH', 'data/consensus.db')
+    CONSENSUS_KEMENY_ITEMS = int(os.environ.get('CONSENSUS_KEMENY_ITEMS', 50))  #ordered by pairwise majority
+    CONSENSUS_MAX_RESULTS = int(os.environ.get('CONSENSUS_MAX_RESULTS', 1000))
+    
+    # Tierlist image/PDF exports (rendered in the thumbnail pool, cached under uploads/rendered)
+    RENDER_MAX_ITEMS = int(os.environ.get('RENDER_MAX_ITEMS', 1000))
+    RENDER_TIMEOUT = int(os.environ.get('RENDER_TIMEOUT', 20))  #fetching sources included; keep below gunicorn's 30s worker timeout
+    RENDER_CACHE_DAYS = float(os.environ.get('RENDER_CACHE_DAYS', 7))  #since last served, cleared by the upload GC
+    
+    # Observability (/metrics; profiles are only written when the threshold is > 0)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    PROFILE_SLOW_REQUESTS_MS = int(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+    PROFILE_SAMPLE_INTERVAL_MS = int(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5))
+    PROFILE_OUTPUT_DIR = os.environ.get('PROFILE_OUTPUT_DIR', 'logs/profiles')
+    
+    # Voice command parsing (grammar and fuzzy match first, AI only on a miss)
+    COMMAND_PARSE_API_URL = os.environ.get('COMMAND_PARSE_API_URL', RECOGNITION_API_URL)
+    COMMAND_PARSE_MODEL = os.environ.get('COMMAND_PARSE_MODEL', RECOGNITION_MODEL)
+    COMMAND_PARSE_TIMEOUT = int(os.environ.get('COMMAND_PARSE_TIMEOUT', 10))
+    COMMAND_PARSE_CACHE_SIZE = int(os.environ.get('COMMAND_PARSE_CACHE_SIZE', 2048))
+    COMMAND_PARSE_BATCH_LIMIT = int(os.environ.get('COMMAND_PARSE_BATCH_LIMIT', 20))
+    COMMAND_PARSE_BATCH_SECONDS = int(os.environ.get('COMMAND_PARSE_BATCH_SECONDS', 20))  #AI fallbacks share it; below the 30s worker timeout
+    COMMAND_PARSE_CONCURRENCY = int(os.environ.get('COMMAND_PARSE_CONCURRENCY', 4))
+    COMMAND_PARSE_MAX_ITEMS = int(os.environ.get('COMMAND_PARSE_MAX_ITEMS', 2000))
+    
+    # Tierlist import limits (buffered JSON response vs streamed NDJSON)
+    IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 1048576))  #1MB
+    IMPORT_STREAM_MAX_BYTES = int(os.environ.get('IMPORT_STREAM_MAX_BYTES', 33554432))  #32MB
+    IMPORT_STREAM_BATCH_SIZE = int(os.environ.get('IMPORT_STREAM_BATCH_SIZE', 200))
+    MAX_IMPORT_TIERS = int(os.environ.get('MAX_IMPORT_TIERS', 20))
     
     # Caching
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
     
-    # Rate limiting
+    # Upload serving (internal nginx location used for X-Accel-Redirect)
+    X_ACCEL_UPLOADS_PREFIX = os.environ.get('X_ACCEL_UPLOADS_PREFIX', '/_protected_uploads/')
+    
+    # Logging (success logs are sampled per request in production)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FILE = os.environ.get('LOG_FILE', 'logs/tierlist.log')
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    
+    # Rate limiting (hybrid: per-worker counters synced to Redis in batches)
     RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'redis://localhost:6379/1')
+    RATELIMIT_HYBRID = os.environ.get('RATELIMIT_HYBRID', 'true').lower() == 'true'
+    RATELIMIT_SYNC_INTERVAL = float(os.environ.get('RATELIMIT_SYNC_INTERVAL', 0.5))
     
     # Security headers
     SECURITY_HEADERS = {
@@ -47,6 +157,9 @@ class ProductionConfig(Config):
     
     # Cache settings
     CACHE_TYPE = 'redis'
+    UPLOAD_INDEX_REDIS_URL = os.environ.get('UPLOAD_INDEX_REDIS_URL', Config.CACHE_REDIS_URL)
+    COLLAB_REDIS_URL = os.environ.get('COLLAB_REDIS_URL', Config.CACHE_REDIS_URL)
+    UPLOAD_GC_INTERVAL = int(os.environ.get('UPLOAD_GC_INTERVAL', 21600))  #6 hours
     
     # Security settings
     SESSION_COOKIE_SECURE = True
@@ -100,8 +213,7 @@ class ProductionConfig(Config):
     MAX_FILENAME_LENGTH = int(os.environ.get('MAX_FILENAME_LENGTH', 100))
     
     # Logging
-    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
-    LOG_FILE = os.environ.get('LOG_FILE', 'logs/tierlist.log')
+    LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.1))
 
 class TestingConfig(Config):
     """Testing configuration"""
@@ -113,15 +225,27 @@ class TestingConfig(Config):
     
     # Use in-memory storage for testing
     UPLOAD_FOLDER = '/tmp/test_uploads'
+    TIERLIST_STORE_URL = 'sqlite:////tmp/test_tierlists.db'
+    RECOGNITION_CACHE_PATH = '/tmp/test_recognition.db'
+    SIMILARITY_INDEX_PATH = '/tmp/test_image_hashes.db'
+    CONSENSUS_INDEX_PATH = '/tmp/test_consensus.db'
+    RECOGNITION_API_URL = 'http://127.0.0.1:9/chat/completions'  # never reach upstream
+    COMMAND_PARSE_API_URL = 'http://127.0.0.1:9/chat/completions'
 
 class DockerConfig(ProductionConfig):
     """Docker-specific production configuration"""
     # Override paths for container environment
     UPLOAD_FOLDER = '/app/uploads'
-    LOG_FILE = '/app/logs/tierlist.log'
+    TIERLIST_STORE_URL = os.environ.get('TIERLIST_STORE_URL', 'sqlite:////app/data/tierlists.db')
+    RECOGNITION_CACHE_PATH = os.environ.get('RECOGNITION_CACHE_PATH', '/app/data/recognition.db')
+    SIMILARITY_INDEX_PATH = os.environ.get('SIMILARITY_INDEX_PATH', '/app/data/image_hashes.db')
+    CONSENSUS_INDEX_PATH = os.environ.get('CONSENSUS_INDEX_PATH', '/app/data/consensus.db')
+    LOG_FILE = os.environ.get('LOG_FILE', '/app/logs/tierlist.log')
     
     # Use Redis container for caching and rate limiting
     CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+    UPLOAD_INDEX_REDIS_URL = os.environ.get('UPLOAD_INDEX_REDIS_URL', CACHE_REDIS_URL)
+    COLLAB_REDIS_URL = os.environ.get('COLLAB_REDIS_URL', CACHE_REDIS_URL)
     RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/1')
 
 config = {
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Consensus rankings over submitted tierlists
+
+Every shared or saved tierlist is a ranking of its uploads. The latest
+ranking per list is kept in SQLite as item ids, and every worker folds them
+into per-item accumulators to rank by mean or median placement, Borda
+score or a Kemeny-style pairwise majority, with an agreement score per
+item. Run this file to submit the tierlists already in the tierlist store.
+
+Usage: python consensus.py [--json]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+
+#placement histogram resolution, medians are exact to 1/TIER_BINS
+TIER_BINS = 32
+METHODS = ('borda', 'mean', 'median', 'kemeny')
+#bound on SQL variables per IN (...) lookup
+LOOKUP_BATCH = 500
+
+
+def ranking(document):
+    """a tierlist document as ``[[filename, ...], ...]``, best tier first
+
+    Empty tiers are kept since they shift where the others sit. A file
+    listed twice only counts at its first placement.
+    """
+    seen = set()
+    tiers = []
+    for tier in document.get('tiers', []):
+        names = []
+        entries = (tier.get('files') or tier.get('images') or []) if isinstance(tier, dict) else []
+        for entry in entries:
+            name = entry.get('filename') if isinstance(entry, dict) else None
+            if isinstance(name, str) and name not in seen:
+                seen.add(name)
+                names.append(name)
+        tiers.append(names)
+    return tiers
+
+
+def placement_scores(lengths, tier_counts, owner, tier):
+    """normalized position and Borda share of every placement in a batch
+
+    ``owner`` is the list of each placement and ``tier`` its tier index
+    there. The position is the tier's midpoint in [0, 1], 0 being the
+    top; the Borda share is the fraction of the list's other items placed
+    below it, ties counting half.
+    """
+    import numpy as np
+
+    width = max(int(tier_counts.max()), 1)
+    sizes = np.bincount(owner * width + tier, minlength=len(lengths) * width).reshape(len(lengths), width)
+    through = sizes.cumsum(axis=1)
+    size = lengths[owner]
+    below = size - through[owner, tier]
+    tied = sizes[owner, tier] - 1
+    borda = np.where(size > 1, (below + 0.5 * tied) / np.maximum(size - 1, 1), 0.5)
+    position = (tier + 0.5) / tier_counts[owner]
+    return position, borda
+
+
+def local_kemeny(order, wins):
+    """reorder so no adjacent pair goes against the pairwise majority
+
+    Insertion sort on the majority relation (local Kemenization): the
+    result agrees with a Kemeny-optimal ranking on every adjacent pair and
+    stays close to the starting order where the majority is split.
+    """
+    order = list(order)
+    for i in range(1, len(order)):
+        j = i
+        while j > 0 and wins[order[j], order[j - 1]] > wins[order[j - 1], order[j]]:
+            order[j - 1], order[j] = order[j], order[j - 1]
+            j -= 1
+    return order
+
+
+class ConsensusIndex:
+    """consensus rankings over every submitted tierlist
+
+    SQLite holds the latest ranking per list key (a shared id, a versioned
+    document) as int32 item ids plus tier sizes, each write taking the next
+    sequence number. Each worker keeps per-item accumulators (count, sum
+    and square sum of placement, Borda sum, placement histogram) in NumPy
+    arrays indexed by item id and pulls only rows newer than its last
+    sequence before a query. A resubmitted list is subtracted with the
+    placements it was added with, so a submission costs the size of the
+    list, never a recompute.
+    """
+
+    def __init__(self, path, kemeny_items=50):
+        self.path = path
+        self.kemeny_items = kemeny_items
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        #names[item_id - 1]
+        self.names = []
+        self.lists = {}
+        self.last_seq = 0
+        self.counts = None
+        self.results = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+        with self.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS consensus_items ('
+                ' id INTEGER PRIMARY KEY,'
+                ' filename TEXT NOT NULL UNIQUE)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS consensus_lists ('
+                ' list_key TEXT PRIMARY KEY,'
+                ' seq INTEGER NOT NULL,'
+                ' tiers BLOB NOT NULL,'
+                ' items BLOB NOT NULL,'
+                ' created_at INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS consensus_lists_seq ON consensus_lists (seq)')
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def submit(self, list_key, tiers):
+        """store the ranking of a list, replacing what the key had before"""
+        self.submit_many([(list_key, tiers)])
+
+    def submit_many(self, rankings):
+        """store ``(list_key, tiers)`` pairs in one transaction"""
+        import numpy as np
+
+        conn = self.connection()
+        with conn:
+            for list_key, tiers in rankings:
+                names = [name for tier in tiers for name in tier]
+                ids = self._item_ids(conn, names)
+                #one statement, so concurrent writers still get increasing sequence numbers
+                conn.execute(
+                    'INSERT OR REPLACE INTO consensus_lists (list_key, seq, tiers, items, created_at)'
+                    ' VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM consensus_lists), ?, ?, ?)',
+                    (
+                        list_key,
+                        np.array([len(tier) for tier in tiers], dtype='<i4').tobytes(),
+                        np.array([ids[name] for name in names], dtype='<i4').tobytes(),
+                        int(time.time())
+                    )
+                )
+
+    def _item_ids(self, conn, names):
+        unique = list(dict.fromkeys(names))
+        conn.executemany('INSERT OR IGNORE INTO consensus_items (filename) VALUES (?)', ((name,) for name in unique))
+        ids = {}
+        for start in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[start:start + LOOKUP_BATCH]
+            ids.update(conn.execute(
+                f"SELECT filename, id FROM consensus_items WHERE filename IN ({','.join('?' * len(batch))})", batch
+            ))
+        return ids
+
+    def refresh(self):
+        """absorb the lists submitted (by any worker) since the last call"""
+        conn = self.connection()
+        rows = conn.execute(
+            'SELECT seq, list_key, tiers, items FROM consensus_lists WHERE seq > ? ORDER BY seq', (self.last_seq,)
+        ).fetchall()
+        if not rows:
+            return 0
+        #items are committed with or before the lists that use them
+        items = conn.execute(
+            'SELECT id, filename FROM consensus_items WHERE id > ? ORDER BY id', (len(self.names),)
+        ).fetchall()
+        with self.lock:
+            for item_id, filename in items:
+                if item_id > len(self.names):
+                    self.names.extend([None] * (item_id - 1 - len(self.names)))
+                    self.names.append(filename)
+            rows = [row for row in rows if row[0] > self.last_seq]
+            if rows:
+                self._absorb(rows)
+                self.last_seq = rows[-1][0]
+                self.results.clear()
+        return len(rows)
+
+    def _absorb(self, rows):
+        import numpy as np
+
+        keys = [row[1] for row in rows]
+        #the blobs of the whole batch decode in one go
+        tier_sizes = np.frombuffer(b''.join(row[2] for row in rows), dtype='<i4').astype(np.int64)
+        cols = np.frombuffer(b''.join(row[3] for row in rows), dtype='<i4').astype(np.int64) - 1
+        tier_counts = np.array([len(row[2]) // 4 for row in rows], dtype=np.int64)
+        self._grow(len(self.names))
+
+        #take out what resubmitted lists contributed before
+        replaced = [self.lists.pop(key) for key in keys if key in self.lists]
+        if replaced:
+            old_cols, _, position, borda = (np.concatenate(parts) for parts in zip(*replaced))
+            self._accumulate(old_cols, position, borda, sign=-1)
+
+        #tier index of every placement, and the list it belongs to
+        tier_owner = np.repeat(np.arange(len(rows)), tier_counts)
+        tier_index = np.arange(len(tier_sizes)) - np.repeat(np.cumsum(tier_counts) - tier_counts, tier_counts)
+        tier = np.repeat(tier_index, tier_sizes)
+        owner = np.repeat(tier_owner, tier_sizes)
+        lengths = np.bincount(tier_owner, weights=tier_sizes, minlength=len(rows)).astype(np.int64)
+        position, borda = placement_scores(lengths, tier_counts, owner, tier)
+        self._accumulate(cols, position, borda, sign=1)
+
+        #views into the batch arrays, to subtract on resubmission
+        ends = np.cumsum(lengths)
+        for key, end, length in zip(keys, ends.tolist(), lengths.tolist()):
+            start = end - length
+            self.lists[key] = (cols[start:end], tier[start:end], position[start:end], borda[start:end])
+
+    def _grow(self, size):
+        import numpy as np
+
+        capacity = 0 if self.counts is None else len(self.counts)
+        if size <= capacity:
+            return
+        #grow geometrically so new items stay amortized O(1)
+        capacity = max(size, capacity * 2, 1024)
+        if self.counts is None:
+            self.counts = np.zeros(capacity, dtype=np.int64)
+            self.position_sums = np.zeros(capacity)
+            self.position_squares = np.zeros(capacity)
+            self.borda_sums = np.zeros(capacity)
+            self.histograms = np.zeros((capacity, TIER_BINS), dtype=np.int64)
+            return
+        used = len(self.counts)
+        for attr in ('counts', 'position_sums', 'position_squares', 'borda_sums', 'histograms'):
+            old = getattr(self, attr)
+            grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[:used] = old
+            setattr(self, attr, grown)
+
+    def _accumulate(self, cols, position, borda, sign):
+        import numpy as np
+
+        #only the touched items: O(list size), not O(items)
+        touched, inverse = np.unique(cols, return_inverse=True)
+        size = len(touched)
+        self.counts[touched] += sign * np.bincount(inverse, minlength=size)
+        self.position_sums[touched] += sign * np.bincount(inverse, weights=position, minlength=size)
+        self.position_squares[touched] += sign * np.bincount(inverse, weights=position * position, minlength=size)
+        self.borda_sums[touched] += sign * np.bincount(inverse, weights=borda, minlength=size)
+        bins = np.minimum((position * TIER_BINS).astype(np.int64), TIER_BINS - 1)
+        self.histograms[touched] += sign * np.bincount(
+            inverse * TIER_BINS + bins, minlength=size * TIER_BINS
+        ).reshape(size, TIER_BINS)
+
+    def rank(self, method='borda', tiers=5, min_lists=1, limit=100):
+        """consensus tiers as ``{'lists', 'items', 'tiers'}``
+
+        ``tiers`` is a list of tiers, each a list of
+        ``{'filename', 'lists', 'mean', 'median', 'borda', 'agreement'}``
+        entries best first, with at most ``limit`` entries over all tiers.
+        Mean and median are placements in [0, 1] (0 is the top), borda the
+        share of other items ranked below and agreement 1 minus twice the
+        standard deviation of placement. ``kemeny`` orders the
+        ``kemeny_items`` best Borda items by pairwise majority.
+        """
+        self.refresh()
+        key = (method, tiers, min_lists, limit)
+        with self.lock:
+            if key not in self.results:
+                self.results[key] = self._rank(method, tiers, min_lists, limit)
+            return self.results[key]
+
+    def _rank(self, method, tier_count, min_lists, limit):
+        import numpy as np
+
+        size = len(self.names)
+        result = {'lists': len(self.lists), 'items': 0, 'tiers': [[] for _ in range(tier_count)]}
+        if not size:
+            return result
+        counts = self.counts[:size]
+        eligible = np.flatnonzero(counts >= max(min_lists, 1))
+        result['items'] = len(eligible)
+        if not len(eligible):
+            return result
+
+        n = counts[eligible].astype(np.float64)
+        mean = self.position_sums[eligible] / n
+        spread = np.sqrt(np.maximum(self.position_squares[eligible] / n - mean * mean, 0))
+        agreement = np.clip(1 - 2 * spread, 0, 1)
+        borda = self.borda_sums[eligible] / n
+        median = self._medians(eligible, n)
+
+        if method == 'mean':
+            score = mean
+        elif method == 'median':
+            score = median
+        else:
+            score = 1 - borda
+        #more lists first among equal scores
+        order = np.lexsort((-n, score))
+        levels = np.minimum((score * tier_count).astype(np.int64), tier_count - 1)
+        if method == 'kemeny':
+            order = order[:self.kemeny_items]
+            #Borda decides how many items each tier gets, the majority their order
+            wins = self._pairwise(eligible[order])
+            order = order[local_kemeny(range(len(order)), wins)]
+            levels = np.sort(levels[order])
+        else:
+            levels = levels[order]
+
+        for index, level in zip(order[:limit].tolist(), levels[:limit].tolist()):
+            result['tiers'][level].append({
+                'filename': self.names[eligible[index]],
+                'lists': int(n[index]),
+                'mean': round(float(mean[index]), 4),
+                'median': round(float(median[index]), 4),
+                'borda': round(float(borda[index]), 4),
+                'agreement': round(float(agreement[index]), 4),
+            })
+        return result
+
+    def _medians(self, eligible, n):
+        import numpy as np
+
+        histograms = self.histograms[eligible]
+        cumulative = histograms.cumsum(axis=1)
+        half = n / 2
+        #first bin reaching half the placements, interpolated inside it
+        bins = np.minimum((cumulative < half[:, None]).sum(axis=1), TIER_BINS - 1)
+        rows = np.arange(len(eligible))
+        before = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+        inside = np.maximum(histograms[rows, bins], 1)
+        return (bins + (half - before) / inside) / TIER_BINS
+
+    def _pairwise(self, candidates):
+        """``wins[i, j]``: lists placing candidate i in a better tier than j
+
+        ``candidates`` are item columns; one sparse list x candidate
+        product per tier.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        size = len(candidates)
+        wins = np.zeros((size, size))
+        if not self.lists or not size:
+            return wins
+        lookup = np.full(len(self.names), -1, dtype=np.int64)
+        lookup[candidates] = np.arange(size)
+        parts = list(self.lists.values())
+        local = lookup[np.concatenate([part[0] for part in parts])]
+        tier = np.concatenate([part[1] for part in parts])
+        owner = np.repeat(np.arange(len(parts)), [len(part[0]) for part in parts])
+        keep = local >= 0
+        local, tier, owner = local[keep], tier[keep], owner[keep]
+        if not len(local):
+            return wins
+
+        shape = (len(parts), size)
+        ones = np.ones(len(local))
+        for level in range(int(tier.max())):
+            above = tier == level
+            below = tier > level
+            if not above.any() or not below.any():
+                continue
+            upper = sparse.csr_matrix((ones[above], (owner[above], local[above])), shape=shape)
+            lower = sparse.csr_matrix((ones[below], (owner[below], local[below])), shape=shape)
+            wins += (upper.T @ lower).toarray()
+        return wins
+
+
+def backfill(index, store, history, batch_size=1000):
+    """submit every tierlist in the store, returns the counts"""
+    from tierlist_history import PatchError
+
+    report = {'shared': 0, 'versioned': 0, 'failed': 0}
+
+    def rankings():
+        for tierlist_id, document_json in store.iter_shared():
+            report['shared'] += 1
+            yield f't:{tierlist_id}', ranking(json.loads(document_json))
+        for document_id in store.iter_versioned_ids():
+            try:
+                head = history.head(document_id)
+            except PatchError:
+                report['failed'] += 1
+                continue
+            report['versioned'] += 1
+            yield f'd:{document_id}', ranking(head[1])
+
+    batch = []
+    for item in rankings():
+        batch.append(item)
+        if len(batch) >= batch_size:
+            index.submit_many(batch)
+            batch.clear()
+    index.submit_many(batch)
+    return report
+
+
+def main():
+    import argparse
+    from config import config
+    from tierlist_store import create_tierlist_store
+    from tierlist_history import TierlistHistory
+
+    settings = config[os.environ.get('FLASK_ENV', 'development')]
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000, help='lists per transaction')
+    parser.add_argument('--json', action='store_true', help='print the counts as JSON')
+    args = parser.parse_args()
+
+    store = create_tierlist_store(settings.TIERLIST_STORE_URL)
+    index = ConsensusIndex(settings.CONSENSUS_INDEX_PATH)
+    started = time.time()
+    report = backfill(index, store, TierlistHistory(store, cache_size=1), args.batch_size)
+    report['seconds'] = round(time.time() - started, 3)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Submitted {report['shared']} shared and {report['versioned']} versioned tierlists in {report['seconds']}s")
+    if report['failed']:
+        print(f"{report['failed']} versioned tierlists do not replay", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
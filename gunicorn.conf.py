@@ -1,5 +1,12 @@
+import gc
 import multiprocessing
 import os
+import shutil
+import sys
+import json
+import time
+
+startup_started = time.time()
 
 # Server socket
 bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
@@ -7,19 +14,42 @@ backlog = 2048
 
 # Worker processes
 workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
-worker_class = "sync"
-worker_connections = 1000
-timeout = 30
-keepalive = 2
+# "sync" (default), "gthread" (GUNICORN_THREADS per worker) or "gevent" for
+# the async mode, where slow uploads and downloads only tie up a greenlet
+# instead of a whole worker
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+if worker_class == 'gthread':
+    threads = int(os.environ.get('GUNICORN_THREADS', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# The gevent entry point monkey-patches before the app is imported; start
+# gunicorn without an app argument, which would override this
+if worker_class == 'gevent':
+    wsgi_app = 'wsgi_gevent:application'
+else:
+    wsgi_app = 'wsgi:application'
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 2))
+
+# Prometheus metrics are shared between workers through files in this
+# directory; start every server with an empty one
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/tierlist_metrics')
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
 
 # Restart workers after this many requests, to help prevent memory leaks
-max_requests = 1000
-max_requests_jitter = 100
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
 
 # Logging
 loglevel = os.environ.get('LOG_LEVEL', 'info')
 accesslog = '-'
 errorlog = '-'
+capture_output = True
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s'
 
 # Process naming
@@ -35,4 +65,41 @@ tmp_upload_dir = None
 
 # SSL (if needed)
 # keyfile = '/path/to/keyfile'
-# certfile = '/path/to/certfile' 
\ No newline at end of file
+# certfile = '/path/to/certfile' 
+
+# Preload warmup: with preload_app the master finishes the shared startup
+# work (templates, heavy imports) and freezes the GC before forking, so every
+# worker, including the ones max_requests recycles, starts warm and keeps
+# sharing those pages. Inspect the result with `python warmup.py`.
+preload_warmup = os.environ.get('PRELOAD_WARMUP', 'true').lower() == 'true'
+preload_heavy_imports = os.environ.get('PRELOAD_HEAVY_IMPORTS', 'true').lower() == 'true'
+if preload_app and preload_warmup:
+    #no collections during the app import, so the frozen heap stays compact
+    gc.disable()
+
+def when_ready(server):
+    if not (preload_app and preload_warmup):
+        return
+    try:
+        import warmup
+        app_module = sys.modules.get('app')
+        if app_module is None:
+            return
+        report = warmup.preload(app_module.app, startup_started, preload_heavy_imports)
+        warmup.write_report(report, server.cfg.pidfile)
+        server.log.info(f"Preload warmup: {json.dumps(report)}")
+    finally:
+        gc.enable()
+
+def pre_fork(server, worker):
+    # A reload (SIGHUP) re-executes this file, so gc.disable() above runs
+    # again but when_ready does not; no worker may start with the GC off
+    if not gc.isenabled():
+        gc.freeze()
+        gc.enable()
+
+def post_fork(server, worker):
+    worker.forked_at = time.time()
+
+def post_worker_init(worker):
+    worker.log.info(f"Worker {worker.pid} ready in {time.time() - worker.forked_at:.3f}s")
@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter as MetricCounter,
+    Histogram, generate_latest, multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+#with PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every worker writes
+#its samples to mmapped files there and /metrics sums them across workers
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+REQUEST_LATENCY = Histogram(
+    'tierlist_request_duration_seconds', 'Request latency by endpoint',
+    ['endpoint', 'method', 'status']
+)
+UPLOADED_BYTES = MetricCounter('tierlist_uploaded_bytes_total', 'Bytes received in uploads')
+UPLOADED_FILES = MetricCounter(
+    'tierlist_uploaded_files_total', 'Uploaded files by outcome', ['result']
+)
+UPLOAD_STORE_LATENCY = Histogram(
+    'tierlist_upload_store_seconds', 'Time spent hashing and writing one upload to disk'
+)
+IMPORT_ITEMS = MetricCounter(
+    'tierlist_import_items_total', 'Imported media entries by outcome', ['result']
+)
+CACHE_REQUESTS = MetricCounter(
+    'tierlist_cache_requests_total', 'Flask-Caching lookups by outcome', ['result']
+)
+COLLAB_OPS = MetricCounter(
+    'tierlist_collab_ops_total', 'Operations logged in live sessions', ['op']
+)
+COLLAB_STREAMS_REFUSED = MetricCounter(
+    'tierlist_collab_streams_refused_total', 'Event streams turned away for lack of a worker thread'
+)
+RENDERS = MetricCounter(
+    'tierlist_renders_total', 'Tierlist image/PDF exports by cache outcome', ['result']
+)
+RATELIMIT_CHECK_LATENCY = Histogram(
+    'tierlist_ratelimit_check_seconds', 'Rate limiter storage round trip per limit check',
+    ['operation', 'result'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+
+def render():
+    """current metrics as (body, content type) in Prometheus text format"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def instrument_cache(cache):
+    """count hits and misses of a Flask-Caching backend's get()"""
+    backend = cache.cache
+    original_get = backend.get
+
+    def get(*args, **kwargs):
+        value = original_get(*args, **kwargs)
+        CACHE_REQUESTS.labels(result='miss' if value is None else 'hit').inc()
+        return value
+
+    backend.get = get
+
+
+def instrument_limiter(limiter):
+    """time the storage calls flask-limiter makes for every checked limit"""
+    strategy = limiter.limiter
+    for operation in ('hit', 'test'):
+        original = getattr(strategy, operation)
+
+        def timed(*args, _original=original, _operation=operation, **kwargs):
+            start = time.perf_counter()
+            allowed = _original(*args, **kwargs)
+            RATELIMIT_CHECK_LATENCY.labels(
+                operation=_operation, result='allowed' if allowed else 'limited'
+            ).observe(time.perf_counter() - start)
+            return allowed
+
+        setattr(strategy, operation, timed)
+
+
+def folded_stack(frame):
+    """one sample as a flamegraph.pl / speedscope "collapsed" stack"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """sampling profiler that keeps the stacks of slow requests
+
+    A background thread samples the stack of every thread that is inside a
+    request each ``interval`` seconds. When a request ends slower than
+    ``threshold`` seconds its samples are written to ``output_dir`` as a
+    collapsed-stack file (``flamegraph.pl`` or speedscope can read it).
+    Works with thread-based workers; under gevent all greenlets share one
+    OS thread, so the profiler disables itself there.
+    """
+
+    def __init__(self, threshold, interval, output_dir):
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.active = {}
+        self.pid = None
+        self.enabled = not gevent_patched()
+        if not self.enabled:
+            logger.warning('Slow request profiler is not supported under gevent, disabled')
+
+    def ensure_sampler(self):
+        #threads do not survive a fork, start one per worker
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        threading.Thread(target=self.run, name='slow-request-profiler', daemon=True).start()
+
+    def begin(self):
+        if not self.enabled:
+            return
+        self.ensure_sampler()
+        with self.lock:
+            self.active[threading.get_ident()] = Counter()
+
+    def end(self, duration, label):
+        if not self.enabled:
+            return
+        with self.lock:
+            stacks = self.active.pop(threading.get_ident(), None)
+        if stacks and duration >= self.threshold:
+            self.dump(stacks, duration, label)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[folded_stack(frame)] += 1
+
+    def dump(self, stacks, duration, label):
+        os.makedirs(self.output_dir, mode=0o755, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}-{int(duration * 1000)}ms.folded"
+        path = os.path.join(self.output_dir, name)
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.info(f"Slow request profile written to {path}")
+
+
+def gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
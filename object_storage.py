@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+Media storage backends
+
+Upload blobs live in the upload folder (``local:``) or in an S3-compatible
+bucket (``s3://bucket/prefix``), chosen by ``MEDIA_STORAGE_URL``. Run this
+file to copy the upload folder's content-addressed uploads into the
+configured bucket before switching a deployment over to it.
+
+Usage: python object_storage.py
+"""
+import os
+import hmac
+import time
+import shutil
+import base64
+import hashlib
+import secrets
+import mimetypes
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs, quote, urlencode
+from upload_ingest import SNIFF_BYTES, UploadRejected, content_mismatch, signature_matches
+
+CHUNK_SIZE = 64 * 1024
+#upload name -> blob key records in a bucket
+NAME_PREFIX = 'names/'
+#ranged reads when hashing an object a backend did not check
+DIGEST_READ_SIZE = 8 * 1024 * 1024
+
+
+class StorageBackend(ABC):
+    """where upload blobs live
+
+    Keys are the blob paths of the content store (``blobs/ab/cd/<digest>.png``)
+    plus the name records of ``MediaStorage``. Backends that are ``remote``
+    are shared by every node and hand out presigned URLs that browsers use
+    to move media bytes without going through the app.
+
+    A presigned PUT must only accept a body of the declared size and sha256.
+    Backends that enforce that set ``checks_digest``; for the others
+    ``MediaStorage.verify_upload`` reads the object back and hashes it.
+    """
+
+    remote = False
+    origin = None
+    checks_digest = False
+
+    @abstractmethod
+    def presign_put(self, key, size, digest, content_type, expires):
+        """``(url, headers)`` for one PUT of exactly this content"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def presign_get(self, key, expires, content_type=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def head(self, key):
+        """size of an object, or None when it does not exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_range(self, key, start, length):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_bytes(self, key):
+        """a small object's content, or None when it does not exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        raise NotImplementedError
+
+    @abstractmethod
+    def upload(self, key, path):
+        """store a local file under a key"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def download(self, key, dest_path):
+        """copy an object to a local file, written atomically"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key):
+        raise NotImplementedError
+
+
+def write_atomic(dest_path, chunks):
+    os.makedirs(os.path.dirname(dest_path), mode=0o755, exist_ok=True)
+    tmp_path = f"{dest_path}.{secrets.token_hex(4)}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class LocalBackend(StorageBackend):
+    """blobs stay in the upload folder
+
+    Presigned URLs point back at this app (``/storage/<key>``), signed with
+    the app's secret key, so browsers use the same direct upload protocol
+    as with a bucket. ``/storage/<key>`` hashes each body it stores.
+    """
+
+    checks_digest = True
+
+    def __init__(self, root, signing_key, url_prefix='/storage/'):
+        self.root = os.path.abspath(root)
+        self.signing_key = signing_key.encode('utf-8')
+        self.url_prefix = url_prefix
+
+    def path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Key outside the storage root: {key}")
+        return path
+
+    def sign(self, method, key, expires, size=''):
+        message = f"{method}\n{key}\n{expires}\n{size}".encode('utf-8')
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()
+
+    def verify(self, method, key, expires, signature, size=''):
+        """check a presigned request made to /storage/<key>"""
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.sign(method, key, expires, size), signature)
+
+    def presigned_url(self, method, key, expires, size=''):
+        deadline = int(time.time()) + expires
+        query = {'expires': deadline, 'signature': self.sign(method, key, deadline, size)}
+        if size != '':
+            query['size'] = size
+        return f"{self.url_prefix}{quote(key)}?{urlencode(query)}"
+
+    def presign_put(self, key, size, digest, content_type, expires):
+        #the digest is part of the key and checked when the body is stored
+        return self.presigned_url('PUT', key, expires, size), {'Content-Type': content_type}
+
+    def presign_get(self, key, expires, content_type=None):
+        return self.presigned_url('GET', key, expires)
+
+    def head(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return None
+
+    def read_range(self, key, start, length):
+        with open(self.path(key), 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+    def get_bytes(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        write_atomic(self.path(key), [data])
+
+    def upload(self, key, path):
+        dest_path = self.path(key)
+        if os.path.abspath(path) != dest_path:
+            with open(path, 'rb') as f:
+                write_atomic(dest_path, iter(lambda: f.read(CHUNK_SIZE), b''))
+
+    def download(self, key, dest_path):
+        source_path = self.path(key)
+        if source_path != os.path.abspath(dest_path):
+            os.makedirs(os.path.dirname(dest_path), mode=0o755, exist_ok=True)
+            shutil.copyfile(source_path, dest_path)
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Backend(StorageBackend):
+    """an S3-compatible bucket (AWS, MinIO, ...) with path-style addressing
+
+    Requests are signed with AWS Signature Version 4 in the query string,
+    so the app's own requests and the URLs it hands to browsers work the
+    same way. ``public_url`` is the endpoint as browsers reach it, when that
+    differs from the one the app uses (e.g. ``http://minio:9000`` inside
+    docker-compose).
+    """
+
+    remote = True
+    #the presigned PUT signs x-amz-checksum-sha256
+    checks_digest = True
+
+    def __init__(self, bucket, endpoint, region, access_key, secret_key, prefix='', public_url=None, timeout=30):
+        self.bucket = bucket
+        self.endpoint = endpoint.rstrip('/')
+        self.public_url = (public_url or endpoint).rstrip('/')
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.timeout = timeout
+        public = urlparse(self.public_url)
+        self.origin = f"{public.scheme}://{public.netloc}"
+
+    def signing_key(self, date):
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        return key
+
+    def presign(self, method, key, expires, headers=None, query=None, public=False):
+        """a SigV4 query-signed URL; ``headers`` must be sent exactly as given"""
+        base = urlparse(self.public_url if public else self.endpoint)
+        path = quote(f"/{self.bucket}/{self.prefix}{key}", safe='/~')
+        now = time.gmtime()
+        amz_date = time.strftime('%Y%m%dT%H%M%SZ', now)
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        signed = {'host': base.netloc}
+        signed.update({name.lower(): str(value).strip() for name, value in (headers or {}).items()})
+        signed_names = ';'.join(sorted(signed))
+        params = dict(query or {})
+        params.update({
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self.access_key}/{scope}",
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expires),
+            'X-Amz-SignedHeaders': signed_names,
+        })
+        canonical_query = '&'.join(
+            f"{quote(name, safe='~')}={quote(str(value), safe='~')}" for name, value in sorted(params.items())
+        )
+        canonical_headers = ''.join(f"{name}:{signed[name]}\n" for name in sorted(signed))
+        canonical_request = '\n'.join(
+            [method, path, canonical_query, canonical_headers, signed_names, 'UNSIGNED-PAYLOAD']
+        )
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        signature = hmac.new(self.signing_key(amz_date[:8]), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        return f"{base.scheme}://{base.netloc}{path}?{canonical_query}&X-Amz-Signature={signature}"
+
+    def request(self, method, key, data=None, headers=None):
+        """send a signed request from the app; returns the open response"""
+        request = urllib.request.Request(self.presign(method, key, 60), data=data, method=method, headers=headers or {})
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def presign_put(self, key, size, digest, content_type, expires):
+        #the bucket rejects a body of another length or checksum
+        headers = {
+            'Content-Type': content_type,
+            'x-amz-checksum-sha256': base64.b64encode(bytes.fromhex(digest)).decode('ascii'),
+        }
+        url = self.presign('PUT', key, expires, headers={**headers, 'Content-Length': size}, public=True)
+        return url, headers
+
+    def presign_get(self, key, expires, content_type=None):
+        query = {'response-content-type': content_type} if content_type else None
+        return self.presign('GET', key, expires, query=query, public=True)
+
+    def head(self, key):
+        try:
+            with self.request('HEAD', key) as response:
+                return int(response.headers.get('Content-Length', 0))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def read_range(self, key, start, length):
+        with self.request('GET', key, headers={'Range': f"bytes={start}-{start + length - 1}"}) as response:
+            return response.read(length)
+
+    def get_bytes(self, key):
+        try:
+            with self.request('GET', key) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def put_bytes(self, key, data, content_type='application/octet-stream'):
+        self.request('PUT', key, data=data, headers={'Content-Type': content_type}).close()
+
+    def upload(self, key, path):
+        with open(path, 'rb') as f:
+            headers = {
+                'Content-Length': str(os.fstat(f.fileno()).st_size),
+                'Content-Type': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+            }
+            self.request('PUT', key, data=f, headers=headers).close()
+
+    def download(self, key, dest_path):
+        with self.request('GET', key) as response:
+            write_atomic(dest_path, iter(lambda: response.read(CHUNK_SIZE), b''))
+
+    def delete(self, key):
+        try:
+            self.request('DELETE', key).close()
+        except urllib.error.HTTPError as e:
+            if e.code != 404:
+                raise
+
+
+def local_backend_from_url(url, root, signing_key, **options):
+    return LocalBackend(root, signing_key)
+
+
+def s3_backend_from_url(url, access_key=None, secret_key=None, **options):
+    #s3://bucket/prefix?endpoint=http://minio:9000&region=us-east-1&public_url=...
+    params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    if not (access_key and secret_key):
+        raise ValueError('S3 media storage needs MEDIA_STORAGE_ACCESS_KEY and MEDIA_STORAGE_SECRET_KEY')
+    region = params.get('region', 'us-east-1')
+    return S3Backend(
+        url.netloc,
+        params.get('endpoint', f"https://s3.{region}.amazonaws.com"),
+        region,
+        access_key,
+        secret_key,
+        prefix=url.path,
+        public_url=params.get('public_url')
+    )
+
+
+BACKENDS = {
+    'local': local_backend_from_url,
+    's3': s3_backend_from_url,
+}
+
+
+def register_backend(scheme, factory):
+    """make another storage backend available under a URL scheme
+
+    See ``StorageBackend`` for what a backend must enforce on direct
+    uploads; without ``checks_digest`` every upload is read back once.
+    """
+    BACKENDS[scheme] = factory
+
+
+def create_storage_backend(storage_url, root, signing_key, access_key=None, secret_key=None):
+    """create the backend for a URL like ``local:`` or ``s3://bucket/prefix``"""
+    url = urlparse(storage_url)
+    if url.scheme not in BACKENDS:
+        raise ValueError(f"Unsupported media storage: {url.scheme}")
+    return BACKENDS[url.scheme](
+        url, root=root, signing_key=signing_key, access_key=access_key, secret_key=secret_key
+    )
+
+
+class MediaStorage:
+    """upload blobs in a storage backend, with the upload folder as local copy
+
+    With the local backend this is just the content store. With a remote
+    backend the bucket holds every blob and a small record per upload name
+    (its blob key), so any node can resolve any upload and browsers move the
+    bytes with presigned URLs. The upload folder then only holds the blobs a
+    node needed locally (for derivatives, hashes or recognition), fetched on
+    first use.
+    """
+
+    def __init__(self, store, backend, cache_size=4096):
+        self.store = store
+        self.backend = backend
+        self.cache_size = cache_size
+        self.keys = OrderedDict()
+
+    @property
+    def remote(self):
+        return self.backend.remote
+
+    def blob_key_for(self, filename, digest):
+        return self.store.blob_key(digest, os.path.splitext(filename)[1])
+
+    def remember(self, filename, key):
+        #names never move to other content, so the cache needs no invalidation
+        self.keys[filename] = key
+        self.keys.move_to_end(filename)
+        while len(self.keys) > self.cache_size:
+            self.keys.popitem(last=False)
+
+    def blob_key(self, filename):
+        """blob key of an upload name, or None if there is no such upload"""
+        digest = self.store.resolve(filename)
+        if digest:
+            return self.blob_key_for(filename, digest)
+        if not self.remote:
+            return None
+        key = self.keys.get(filename)
+        if key is None:
+            record = self.backend.get_bytes(NAME_PREFIX + filename)
+            if record is None:
+                return None
+            key = record.decode('utf-8')
+            self.remember(filename, key)
+        return key
+
+    def publish(self, filename, digest):
+        """make an upload name resolve to its blob on every node
+
+        Returns whether the blob is also in the local upload folder.
+        """
+        key = self.blob_key_for(filename, digest)
+        local_blob = os.path.join(self.store.root, key)
+        local = os.path.exists(local_blob)
+        if local:
+            self.store.link(filename, local_blob)
+        if self.remote:
+            if local and self.backend.head(key) is None:
+                self.backend.upload(key, local_blob)
+            self.backend.put_bytes(NAME_PREFIX + filename, key.encode('utf-8'), 'text/plain')
+            self.remember(filename, key)
+        return local
+
+    def ensure_local(self, filename):
+        """check an upload exists, fetching it into the upload folder if needed"""
+        if self.store.exists(filename):
+            return True
+        if not self.remote:
+            return False
+        key = self.blob_key(filename)
+        if key is None:
+            return False
+        local_blob = os.path.join(self.store.root, key)
+        if not os.path.exists(local_blob):
+            self.backend.download(key, local_blob)
+        self.store.link(filename, local_blob)
+        return True
+
+    def download_url(self, filename, expires):
+        """presigned URL of an upload's content, or None if there is no such upload"""
+        key = self.blob_key(filename)
+        if key is None:
+            return None
+        return self.backend.presign_get(key, expires, content_type=mimetypes.guess_type(filename)[0])
+
+    def prepare_upload(self, original_filename, digest, size, content_type, expires):
+        """the upload name of some content and, unless it is stored already, where to PUT it"""
+        filename = self.store.upload_name(original_filename, digest)
+        key = self.blob_key_for(filename, digest)
+        entry = {'name': original_filename, 'filename': filename, 'sha256': digest, 'upload': None}
+        if self.backend.head(key) is None:
+            url, headers = self.backend.presign_put(key, size, digest, content_type, expires)
+            entry['upload'] = {'method': 'PUT', 'url': url, 'headers': headers}
+        return entry
+
+    def verify_upload(self, original_filename, digest, max_bytes):
+        """check a direct upload arrived intact and is what its name says
+
+        Returns ``(filename, size)``. Content that fails the checks is
+        deleted, since no valid upload can share its key.
+        """
+        filename = self.store.upload_name(original_filename, digest)
+        key = self.blob_key_for(filename, digest)
+        size = self.backend.head(key)
+        if size is None:
+            raise UploadRejected(f"Upload not received: {original_filename}", 409)
+        if size > max_bytes:
+            self.backend.delete(key)
+            raise UploadRejected(f"File too large: {original_filename}", 413)
+        if not signature_matches(filename, self.backend.read_range(key, 0, SNIFF_BYTES)):
+            self.backend.delete(key)
+            raise UploadRejected(content_mismatch(filename))
+        if not self.backend.checks_digest and self.object_digest(key, size) != digest:
+            self.backend.delete(key)
+            raise UploadRejected(f"Upload does not match its sha256: {original_filename}")
+        return filename, size
+
+    def object_digest(self, key, size):
+        hasher = hashlib.sha256()
+        for start in range(0, size, DIGEST_READ_SIZE):
+            hasher.update(self.backend.read_range(key, start, min(DIGEST_READ_SIZE, size - start)))
+        return hasher.hexdigest()
+
+
+def main():
+    import argparse
+    from config import config
+    from storage import ContentStore
+
+    settings = config[os.environ.get('FLASK_ENV', 'development')]
+    parser = argparse.ArgumentParser(description='Copy local uploads into the configured media storage')
+    parser.parse_args()
+
+    backend = create_storage_backend(
+        settings.MEDIA_STORAGE_URL, settings.UPLOAD_FOLDER, settings.SECRET_KEY,
+        access_key=settings.MEDIA_STORAGE_ACCESS_KEY, secret_key=settings.MEDIA_STORAGE_SECRET_KEY
+    )
+    if not backend.remote:
+        print('MEDIA_STORAGE_URL is local, nothing to copy')
+        return
+    media = MediaStorage(ContentStore(settings.UPLOAD_FOLDER), backend)
+    published = skipped = 0
+    with os.scandir(settings.UPLOAD_FOLDER) as entries:
+        for entry in entries:
+            if entry.name.endswith('.tmp') or entry.is_dir(follow_symlinks=False):
+                continue
+            digest = media.store.resolve(entry.name)
+            if digest is None:
+                #legacy uploads are plain files, they keep being served locally
+                skipped += 1
+                continue
+            media.publish(entry.name, digest)
+            published += 1
+    print(f"Published {published} uploads, skipped {skipped} legacy files")
+
+
+if __name__ == '__main__':
+    main()
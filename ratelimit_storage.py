@@ -0,0 +1,185 @@
+import time
+import logging
+import threading
+import redis
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+HYBRID_SCHEME = 'hybrid+'
+KEY_PREFIX = 'LIMITS:'
+
+#same semantics as the limits redis storage: the first increment of a
+#window sets its expiry; returns the new count and the remaining ttl
+INCR_EXPIRE = """
+local current = redis.call('incrby', KEYS[1], ARGV[2])
+if current == tonumber(ARGV[2]) then
+    redis.call('expire', KEYS[1], ARGV[1])
+end
+return {current, redis.call('pttl', KEYS[1])}
+"""
+
+
+def hybrid_storage_uri(storage_uri):
+    """the hybrid variant of a redis:// limiter storage, others unchanged"""
+    if storage_uri.startswith(('redis://', 'rediss://')):
+        return HYBRID_SCHEME + storage_uri
+    return storage_uri
+
+
+class _Window:
+    __slots__ = ('expiry', 'expires_at', 'synced', 'pending')
+
+    def __init__(self, expiry, now):
+        self.expiry = expiry
+        self.expires_at = now + expiry
+        self.synced = 0
+        self.pending = 0
+
+
+class HybridRedisStorage(Storage):
+    """per-worker counters that reconcile with Redis in batches
+
+    ``incr`` only touches process memory: the count it returns is the
+    global count seen at the last sync plus this worker's hits since.
+    At most every ``sync_interval`` seconds, the request that notices the
+    interval passed flushes all pending deltas in one pipelined round
+    trip. That round trip also refreshes the global counts and window
+    expiries. Between syncs every worker may overshoot a limit by the hits
+    it has not flushed yet.
+
+    When Redis is unreachable the counters keep working per worker. The
+    limits are then local instead of global, and Redis is retried every
+    ``retry_interval`` seconds. Hits are never lost; they are flushed once
+    Redis is back.
+    """
+
+    STORAGE_SCHEME = ['hybrid+redis', 'hybrid+rediss']
+
+    def __init__(self, uri, sync_interval=0.5, retry_interval=5.0, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.client = redis.from_url(uri[len(HYBRID_SCHEME):], socket_timeout=1, socket_connect_timeout=1)
+        self.incr_expire = self.client.register_script(INCR_EXPIRE)
+        self.sync_interval = float(sync_interval)
+        self.retry_interval = float(retry_interval)
+        self.windows = {}
+        self.touched = set()
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.last_sync = 0.0
+        self.down_until = 0.0
+
+    @property
+    def base_exceptions(self):
+        return redis.RedisError
+
+    def window(self, key, now):
+        window = self.windows.get(key)
+        if window is not None and window.expires_at <= now:
+            #window over; hits that never reached redis belonged to it
+            del self.windows[key]
+            window = None
+        return window
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self.lock:
+            window = self.window(key, now)
+            if window is None:
+                window = self.windows[key] = _Window(expiry, now)
+            window.pending += amount
+            self.touched.add(key)
+            count = window.synced + window.pending
+        self.maybe_sync(now)
+        return count
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            window = self.window(key, now)
+            if window is None:
+                return 0
+            self.touched.add(key)
+            return window.synced + window.pending
+
+    def get_expiry(self, key):
+        with self.lock:
+            window = self.window(key, time.time())
+            return window.expires_at if window else time.time()
+
+    def check(self):
+        #degrades to per-worker limits instead of failing
+        return True
+
+    def reset(self):
+        with self.lock:
+            self.windows.clear()
+            self.touched.clear()
+        removed = 0
+        for key in self.client.scan_iter(match=f'{KEY_PREFIX}*', count=1000):
+            removed += self.client.delete(key)
+        return removed
+
+    def clear(self, key):
+        with self.lock:
+            self.windows.pop(key, None)
+            self.touched.discard(key)
+        self.client.delete(KEY_PREFIX + key)
+
+    def maybe_sync(self, now):
+        if now - self.last_sync < self.sync_interval or now < self.down_until:
+            return
+        #one thread syncs, the others carry on with local counts
+        if not self.sync_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_sync = now
+            self.sync()
+        finally:
+            self.sync_lock.release()
+
+    def sync(self):
+        """flush pending hits and refresh counts for recently used keys"""
+        now = time.time()
+        with self.lock:
+            batch = []
+            for key in self.touched:
+                window = self.window(key, now)
+                if window is not None:
+                    batch.append((key, window, window.pending))
+            self.touched = set()
+        if not batch:
+            return
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, window, delta in batch:
+                if delta:
+                    self.incr_expire(keys=[KEY_PREFIX + key], args=[window.expiry, delta], client=pipe)
+                else:
+                    pipe.get(KEY_PREFIX + key)
+                    pipe.pttl(KEY_PREFIX + key)
+            results = iter(pipe.execute())
+        except redis.RedisError as e:
+            self.down_until = now + self.retry_interval
+            with self.lock:
+                self.touched.update(key for key, _, _ in batch)
+            logger.warning(f"Rate limit sync failed, using per-worker counts: {str(e)}")
+            return
+
+        now = time.time()
+        with self.lock:
+            for key, window, delta in batch:
+                if delta:
+                    count, ttl = next(results)
+                else:
+                    count, ttl = int(next(results) or 0), next(results)
+                if self.windows.get(key) is not window:
+                    continue
+                window.pending -= delta
+                window.synced = int(count)
+                #follow the global window so all workers reset together
+                if ttl and ttl > 0:
+                    window.expires_at = now + ttl / 1000
+            for key in [key for key, window in self.windows.items() if window.expires_at <= now]:
+                del self.windows[key]
@@ -0,0 +1,220 @@
+import os
+import re
+import json
+import time
+import base64
+import sqlite3
+import logging
+import threading
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+PROMPT = """Analyze this image and provide a single word that best describes what it shows. Examples:
+- If it's a store/shop: "shop"
+- If it's a street/road: "street"
+- If it's a person: "person"
+- If it's food: "food"
+- If it's an animal: "animal"
+- If it's a vehicle: "vehicle"
+- If it's text/document: "document"
+- If it's art/drawing: "art"
+
+Respond with only ONE word, no explanations or additional text."""
+
+LABEL_PATTERN = re.compile(r'[a-z][a-z-]{0,31}')
+
+
+class RecognitionCache:
+    """persistent digest -> label cache with TTL and LRU eviction (SQLite)"""
+
+    def __init__(self, path, ttl, max_entries, evict_every=50):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.puts = 0
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+        with self.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS recognitions ('
+                ' digest TEXT PRIMARY KEY,'
+                ' label TEXT NOT NULL,'
+                ' created_at INTEGER NOT NULL,'
+                ' last_used INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS recognitions_last_used ON recognitions (last_used)')
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get_many(self, digests):
+        """labels for the digests that are cached and fresh"""
+        digests = list(dict.fromkeys(digests))
+        if not digests:
+            return {}
+        now = int(time.time())
+        conn = self.connection()
+        placeholders = ','.join('?' * len(digests))
+        rows = conn.execute(
+            f'SELECT digest, label FROM recognitions WHERE digest IN ({placeholders}) AND created_at > ?',
+            (*digests, now - self.ttl)
+        ).fetchall()
+        if rows:
+            with conn:
+                conn.execute(
+                    f'UPDATE recognitions SET last_used = ? WHERE digest IN ({",".join("?" * len(rows))})',
+                    (now, *(digest for digest, _ in rows))
+                )
+        return dict(rows)
+
+    def get(self, digest):
+        return self.get_many([digest]).get(digest)
+
+    def put(self, digest, label):
+        now = int(time.time())
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO recognitions (digest, label, created_at, last_used) VALUES (?, ?, ?, ?)',
+                (digest, label, now, now)
+            )
+        self.puts += 1
+        if self.puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """drop expired entries and the least recently used beyond max_entries"""
+        conn = self.connection()
+        with conn:
+            conn.execute('DELETE FROM recognitions WHERE created_at <= ?', (int(time.time()) - self.ttl,))
+            conn.execute(
+                'DELETE FROM recognitions WHERE digest NOT IN '
+                '(SELECT digest FROM recognitions ORDER BY last_used DESC LIMIT ?)',
+                (self.max_entries,)
+            )
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.label = None
+
+
+class Recognizer:
+    """one upstream completion call per content digest
+
+    Results are cached persistently; concurrent requests for a digest that
+    is already being recognized in this process wait for that call instead
+    of issuing their own.
+    """
+
+    def __init__(self, cache, api_url, model=None, timeout=15, concurrency=4):
+        self.cache = cache
+        self.api_url = api_url
+        self.model = model
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.jobs = {}
+        self.executor = None
+        self.pid = None
+
+    def submit(self, digest, locate):
+        """recognize in this worker's background pool, returns a future
+
+        ``locate()`` gives the image path and runs in the pool too. A digest
+        queued or running already shares its future, and a job that outlives
+        the request that started it still lands in the cache.
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                #recreated in forked workers
+                from concurrent.futures import ThreadPoolExecutor
+
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='recognize')
+                self.jobs = {}
+                self.pid = os.getpid()
+            future = self.jobs.get(digest)
+            if future is not None:
+                return future
+            future = self.jobs[digest] = self.executor.submit(lambda: self.recognize(digest, locate()))
+        future.add_done_callback(lambda _: self._finished(digest))
+        return future
+
+    def _finished(self, digest):
+        with self.lock:
+            self.jobs.pop(digest, None)
+
+    def recognize(self, digest, image_path):
+        """label for an image, returning (label, cached)"""
+        label = self.cache.get(digest)
+        if label:
+            return label, True
+
+        with self.lock:
+            entry = self.in_flight.get(digest)
+            leader = entry is None
+            if leader:
+                entry = self.in_flight[digest] = _InFlight()
+
+        if not leader:
+            entry.event.wait(self.timeout + 5)
+            return entry.label, False
+
+        try:
+            entry.label = self.call_api(image_path)
+            if entry.label:
+                self.cache.put(digest, entry.label)
+        except Exception as e:
+            logger.warning(f"Recognition failed for {digest[:12]}: {str(e)}")
+        finally:
+            with self.lock:
+                self.in_flight.pop(digest, None)
+            entry.event.set()
+        return entry.label, False
+
+    def call_api(self, image_path):
+        """ask the completion endpoint for a one-word label"""
+        with open(image_path, 'rb') as f:
+            image_url = 'data:image/jpeg;base64,' + base64.b64encode(f.read()).decode('ascii')
+
+        payload = {
+            'messages': [{
+                'role': 'user',
+                'content': [
+                    {'type': 'text', 'text': PROMPT},
+                    {'type': 'image_url', 'image_url': {'url': image_url}}
+                ]
+            }],
+            'max_tokens': 100,
+            'temperature': 0.1
+        }
+        if self.model:
+            payload['model'] = self.model
+
+        request = urllib.request.Request(
+            self.api_url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)
+        return normalize_label(data['choices'][0]['message']['content'])
+
+
+def normalize_label(text):
+    """first word of a model reply, lowercased, or None"""
+    match = LABEL_PATTERN.search(text.strip().lower())
+    return match.group(0) if match else None
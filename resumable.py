@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import secrets
+
+SESSION_DIR = 'sessions'
+CHUNK_SIZE = 64 * 1024
+SESSION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{22}')
+
+
+class UploadSessionError(Exception):
+    """a resumable upload request that cannot be honoured"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class PartsReader:
+    """file-like reader over the parts of a session, in order"""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.current = None
+
+    def read(self, size=-1):
+        while True:
+            if self.current is None:
+                if not self.paths:
+                    return b''
+                self.current = open(self.paths.pop(0), 'rb')
+            data = self.current.read(size)
+            if data:
+                return data
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+
+
+class UploadSessions:
+    """init/part/complete upload sessions stored below the upload folder
+
+    Every part lives in its own file, so parts can arrive in parallel, in any
+    order and on any worker, and a dropped connection only costs one part.
+    Sessions that are not completed within ``ttl`` seconds are swept.
+    """
+
+    def __init__(self, root, part_size, max_bytes, ttl, sweep_interval=600):
+        self.root = os.path.join(root, SESSION_DIR)
+        self.part_size = part_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.last_sweep = 0
+
+    def session_path(self, session_id):
+        if not SESSION_ID_PATTERN.fullmatch(session_id):
+            raise UploadSessionError('Upload session not found', 404)
+        return os.path.join(self.root, session_id)
+
+    def part_path(self, session_id, index):
+        return os.path.join(self.session_path(session_id), f"{index:05d}.part")
+
+    def create(self, filename, size):
+        """start a session for a file of known size"""
+        if not isinstance(size, int) or size <= 0:
+            raise UploadSessionError('Invalid file size')
+        if size > self.max_bytes:
+            raise UploadSessionError(f'File too large. Maximum size is {self.max_bytes // (1024 * 1024)}MB.', 413)
+
+        self.maybe_sweep()
+        session_id = secrets.token_urlsafe(16)
+        meta = {
+            'id': session_id,
+            'filename': filename,
+            'size': size,
+            'part_size': self.part_size,
+            'parts': -(-size // self.part_size),
+            'created_at': int(time.time()),
+        }
+        path = self.session_path(session_id)
+        os.makedirs(path, mode=0o755)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return meta
+
+    def load(self, session_id):
+        try:
+            with open(os.path.join(self.session_path(session_id), 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadSessionError('Upload session not found', 404)
+
+    def received_parts(self, session_id):
+        path = self.session_path(session_id)
+        return sorted(int(name[:-5]) for name in os.listdir(path) if name.endswith('.part'))
+
+    def write_part(self, session_id, index, stream, expected_sha256=None):
+        """store one part, checking its length and optional sha256"""
+        meta = self.load(session_id)
+        if not 0 <= index < meta['parts']:
+            raise UploadSessionError('Invalid part number')
+        expected_size = min(meta['part_size'], meta['size'] - index * meta['part_size'])
+
+        part_path = self.part_path(session_id, index)
+        tmp_path = f"{part_path}.{secrets.token_hex(4)}.tmp"
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > expected_size:
+                        raise UploadSessionError(f'Part {index} is larger than {expected_size} bytes')
+                    hasher.update(chunk)
+                    out.write(chunk)
+
+            if size != expected_size:
+                raise UploadSessionError(f'Part {index} should be {expected_size} bytes, got {size}')
+            if expected_sha256 and hasher.hexdigest() != expected_sha256.lower():
+                raise UploadSessionError(f'Checksum mismatch for part {index}')
+            os.replace(tmp_path, part_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return size
+
+    def open_assembled(self, session_id):
+        """reader over the full file once every part has arrived"""
+        meta = self.load(session_id)
+        missing = sorted(set(range(meta['parts'])) - set(self.received_parts(session_id)))
+        if missing:
+            raise UploadSessionError(f'Missing parts: {missing[:20]}', 409)
+        return meta, PartsReader(self.part_path(session_id, i) for i in range(meta['parts']))
+
+    def discard(self, session_id):
+        shutil.rmtree(self.session_path(session_id), ignore_errors=True)
+
+    def sweep(self, now=None):
+        """delete sessions older than the ttl, returning how many"""
+        now = now or time.time()
+        removed = 0
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                age = now - entry.stat(follow_symlinks=False).st_mtime
+            except FileNotFoundError:
+                continue
+            if age > self.ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def maybe_sweep(self):
+        """sweep at most once per sweep_interval in this process"""
+        now = time.time()
+        if now - self.last_sweep < self.sweep_interval:
+            return 0
+        self.last_sweep = now
+        return self.sweep(now)
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import logging
+import threading
+from thumbnails import get_pool
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+#dct hash: 32x32 grayscale, keep the lowest 8x8 frequencies
+HASH_IMAGE_SIZE = 32
+HASH_LOW_FREQUENCIES = 8
+
+
+def perceptual_hash(path):
+    """64 bit DCT hash of an image; resized or recompressed copies stay close"""
+    import numpy as np
+    from PIL import Image
+    from scipy.fft import dctn
+
+    with Image.open(path) as img:
+        #jpeg decodes straight to a reduced size, other formats ignore this
+        img.draft('L', (HASH_IMAGE_SIZE * 4, HASH_IMAGE_SIZE * 4))
+        pixels = np.asarray(
+            img.convert('L').resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), Image.LANCZOS),
+            dtype=np.float64
+        )
+    low = dctn(pixels, norm='ortho')[:HASH_LOW_FREQUENCIES, :HASH_LOW_FREQUENCIES].ravel()
+    #the DC term is overall brightness, leave it out of the threshold
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def popcount(values):
+    """set bits per uint64, vectorized"""
+    import numpy as np
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    m1 = np.uint64(0x5555555555555555)
+    m2 = np.uint64(0x3333333333333333)
+    m4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+    h01 = np.uint64(0x0101010101010101)
+    values = values - ((values >> np.uint64(1)) & m1)
+    values = (values & m2) + ((values >> np.uint64(2)) & m2)
+    values = (values + (values >> np.uint64(4))) & m4
+    return (values * h01) >> np.uint64(56)
+
+
+def to_signed(value):
+    #sqlite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class ImageHashIndex:
+    """perceptual hashes of image uploads, searched by Hamming distance
+
+    SQLite is the shared record that every worker writes the hashes it
+    computes to. Each worker mirrors it into a contiguous uint64 array,
+    pulling only rows newer than the last one it saw before each query, so
+    a lookup is one XOR and popcount over the whole array. The array (and
+    NumPy) is only set up once the first hash is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hashes = None
+        self.size = 0
+        self.filenames = []
+        self.positions = {}
+        self.last_id = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+        with self.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS image_hashes ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' filename TEXT NOT NULL UNIQUE,'
+                ' digest TEXT NOT NULL,'
+                ' hash INTEGER NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS image_hashes_digest ON image_hashes (digest)')
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def hash_for_digest(self, digest):
+        """stored hash of some upload with this content, or None"""
+        row = self.connection().execute('SELECT hash FROM image_hashes WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+        return row[0] & ((1 << 64) - 1) if row else None
+
+    def add(self, filename, digest, value):
+        conn = self.connection()
+        with conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO image_hashes (filename, digest, hash) VALUES (?, ?, ?)',
+                (filename, digest, to_signed(value))
+            )
+
+    def index_upload(self, upload_folder, filename, digest, max_workers=2):
+        """hash a new image upload, reusing the hash of identical content
+
+        Returns a future when the hash is computed in the background pool,
+        None when it was already known.
+        """
+        value = self.hash_for_digest(digest)
+        if value is not None:
+            self.add(filename, digest, value)
+            return None
+        future = get_pool(max_workers).submit(perceptual_hash, os.path.join(upload_folder, filename))
+        future.add_done_callback(self._store_result(filename, digest))
+        return future
+
+    def _store_result(self, filename, digest):
+        def callback(future):
+            error = future.exception()
+            if error is not None:
+                logger.warning(f"Perceptual hash failed for {filename}: {error}")
+                return
+            self.add(filename, digest, future.result())
+        return callback
+
+    def ensure(self, upload_folder, filename, digest):
+        """hash of an upload, computing it inline if the pool has not yet"""
+        self.refresh()
+        position = self.positions.get(filename)
+        if position is not None:
+            return int(self.hashes[position])
+        value = self.hash_for_digest(digest)
+        if value is None:
+            value = perceptual_hash(os.path.join(upload_folder, filename))
+        self.add(filename, digest, value)
+        self.refresh()
+        return value
+
+    def refresh(self):
+        """append rows other workers (or the pool) stored since the last call"""
+        rows = self.connection().execute(
+            'SELECT id, filename, hash FROM image_hashes WHERE id > ? ORDER BY id', (self.last_id,)
+        ).fetchall()
+        if not rows:
+            return 0
+        import numpy as np
+
+        with self.lock:
+            rows = [row for row in rows if row[0] > self.last_id]
+            if not rows:
+                return 0
+            needed = self.size + len(rows)
+            capacity = 0 if self.hashes is None else len(self.hashes)
+            if needed > capacity:
+                #grow geometrically so appends stay amortized O(1)
+                grown = np.empty(max(needed, capacity * 2, 1024), dtype=np.uint64)
+                if self.size:
+                    grown[:self.size] = self.hashes[:self.size]
+                self.hashes = grown
+            values = np.array([value for _, _, value in rows], dtype=np.int64).view(np.uint64)
+            self.hashes[self.size:needed] = values
+            for offset, (_, filename, _) in enumerate(rows):
+                self.positions[filename] = self.size + offset
+                self.filenames.append(filename)
+            self.size = needed
+            self.last_id = rows[-1][0]
+        return len(rows)
+
+    def query(self, value, k=10, max_distance=10, exclude=(), within=None):
+        """``(near_duplicates, similar)`` as lists of ``(filename, distance)``
+
+        Near duplicates are every hash within ``max_distance`` bits, closest
+        first; similar is the ``k`` closest regardless of distance. ``within``
+        restricts the search to those filenames.
+        """
+        self.refresh()
+        if not self.size:
+            return [], []
+        import numpy as np
+
+        with self.lock:
+            hashes = self.hashes[:self.size]
+            filenames = self.filenames[:self.size]
+            if within is not None:
+                candidates = np.fromiter(
+                    (self.positions[name] for name in within if name in self.positions),
+                    dtype=np.int64
+                )
+            else:
+                candidates = None
+            excluded = [self.positions[name] for name in exclude if name in self.positions]
+        #one XOR and popcount over the whole index
+        distances = popcount(hashes ^ np.uint64(value)).astype(np.int16)
+        if excluded:
+            distances[excluded] = HASH_BITS + 1
+        if candidates is not None:
+            masked = np.full(len(hashes), HASH_BITS + 1, dtype=np.int16)
+            masked[candidates] = distances[candidates]
+            distances = masked
+
+        eligible = int(np.count_nonzero(distances <= HASH_BITS))
+        k = min(k, eligible)
+        if k > 0:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        else:
+            nearest = np.empty(0, dtype=np.int64)
+        close = np.flatnonzero(distances <= max_distance)
+        close = close[np.argsort(distances[close], kind='stable')]
+        return (
+            [(filenames[i], int(distances[i])) for i in close],
+            [(filenames[i], int(distances[i])) for i in nearest],
+        )
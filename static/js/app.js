@@ -41,6 +41,9 @@ function initializeApp() {
     setupVoiceControl();
     setupLofiMusic();
     setupPrintButton();
+    loadSharedTierList();
+    setupLiveSession();
+    loadSavedDocument();
 }
 // theme management
 function setTheme(theme) {
@@ -86,6 +89,11 @@ function handleUploadZoneDrop(e) {
     if (draggedElement) {
         const fileId = draggedElement.dataset.fileId;
         const file = findFileById(fileId);
+        if (file && liveSession) {
+            submitSessionOp({ op: 'move', file: fileId, tier: null });
+            showNotification('Item returned to upload area', 'success');
+            return;
+        }
         if (file) {
             // Remove file from its current location (tier)
             removeFileFromCurrentLocation(fileId);
@@ -131,25 +139,34 @@ function uploadFiles(files) {
     console.log(`[DEBUG] uploadFiles called with ${files.length} files`);
     const formData = new FormData();
     
-    //validate files before upload
+    //validate files before upload; large files go through resumable sessions
+    //unless storage takes them directly
+    const directMax = Number(document.body.dataset.directUploadMax || 0);
     let validFiles = 0;
+    const smallFiles = [];
+    const largeFiles = [];
     for (let file of files) {
-        if (validateFile(file)) {
+        if (!validateFile(file)) continue;
+        if (file.size > Math.max(RESUMABLE_THRESHOLD, directMax)) {
+            largeFiles.push(file);
+        } else {
             formData.append('files', file);
+            smallFiles.push(file);
             validFiles++;
         }
     }
+    if (largeFiles.length > 0) {
+        uploadLargeFiles(largeFiles);
+    }
     if (validFiles === 0) {
-        showNotification('No valid files selected', 'error');
+        if (largeFiles.length === 0) {
+            showNotification('No valid files selected', 'error');
+        }
         return;
     }
     //show loading state
     showNotification(`Uploading ${validFiles} file(s)...`, 'info');
-    fetch('/upload', {
-        method: 'POST',
-        body: formData
-    })
-    .then(response => response.json())
+    sendFiles(smallFiles, formData, directMax)
     .then(async (data) => {
         console.log(`[DEBUG] Upload response received:`, data);
         if (data.error) {
@@ -160,6 +177,8 @@ function uploadFiles(files) {
             
             // show uploaded files immediately
             displayUploadedFiles();
+            addFilesToLiveSession(data.files);
+            warnAboutNearDuplicates(data.files);
             
             console.log(`[DEBUG] Image recognition enabled: ${imageRecognitionEnabled}`);
             console.log(`[DEBUG] Uploaded files:`, data.files);
@@ -211,22 +230,148 @@ function uploadFiles(files) {
         showNotification('Upload failed. Please try again.', 'error');
     });
 }
+async function sendFiles(files, formData, directMax) {
+    if (directMax > 0) {
+        const result = await uploadDirect(files);
+        if (result) return result;
+    }
+    const response = await fetch('/upload', {
+        method: 'POST',
+        body: formData
+    });
+    return response.json();
+}
+
+// direct uploads: the browser PUTs each file to a presigned storage URL and
+// the app only checks and records it; null means use /upload instead
+async function uploadDirect(files) {
+    const described = [];
+    for (const file of files) {
+        const sha256 = await sha256Hex(await file.arrayBuffer());
+        if (!sha256) return null; //no WebCrypto outside https
+        described.push({ name: file.name, size: file.size, sha256 });
+    }
+    const prepared = await fetch('/upload/direct', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ files: described })
+    }).then(response => response.json());
+    if (prepared.error) return prepared;
+    
+    await Promise.all(prepared.files.map(async (entry) => {
+        if (!entry.upload) return; //storage already has this content
+        const index = described.findIndex(d => d.name === entry.name && d.sha256 === entry.sha256);
+        const response = await fetch(entry.upload.url, {
+            method: entry.upload.method,
+            headers: entry.upload.headers,
+            body: files[index]
+        });
+        if (!response.ok) throw new Error(`Storage rejected ${entry.name} (${response.status})`);
+    }));
+    
+    const result = await fetch('/upload/direct/complete', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ files: prepared.files.map(entry => ({ name: entry.name, sha256: entry.sha256 })) })
+    }).then(response => response.json());
+    if (prepared.warnings) result.warnings = [...prepared.warnings, ...(result.warnings || [])];
+    return result;
+}
+
 function validateFile(file) {
     const allowedTypes = [
         'image/png', 'image/jpeg', 'image/jpg', 'image/gif',
         'audio/mpeg', 'audio/mp3', 'audio/wav', 'audio/ogg', 'audio/mp4', 'audio/aac'
     ];
-    const maxSize = 5 * 1024 * 1024; //5MB
     if (!allowedTypes.includes(file.type)) {
         showNotification(`Invalid file type: ${file.name}`, 'error');
         return false;
     }
-    if (file.size > maxSize) {
-        showNotification(`File too large: ${file.name} (max 5MB)`, 'error');
+    if (file.size > RESUMABLE_MAX_SIZE) {
+        showNotification(`File too large: ${file.name} (max 50MB)`, 'error');
         return false;
     }
     return true;
 }
+
+// resumable uploads: init a session, PUT parts in parallel, then complete
+const RESUMABLE_THRESHOLD = 4 * 1024 * 1024; //4MB
+const RESUMABLE_MAX_SIZE = 50 * 1024 * 1024; //50MB
+const RESUMABLE_CONCURRENCY = 3;
+const RESUMABLE_RETRIES = 3;
+
+async function sha256Hex(buffer) {
+    if (!window.crypto || !window.crypto.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadPart(sessionId, index, blob) {
+    const buffer = await blob.arrayBuffer();
+    const checksum = await sha256Hex(buffer);
+    const headers = { 'Content-Type': 'application/octet-stream' };
+    if (checksum) headers['X-Part-SHA256'] = checksum;
+    
+    for (let attempt = 1; attempt <= RESUMABLE_RETRIES; attempt++) {
+        try {
+            const response = await fetch(`/upload/sessions/${sessionId}/parts/${index}`, {
+                method: 'PUT',
+                headers,
+                body: buffer
+            });
+            if (response.ok) return;
+            if (response.status < 500 && response.status !== 429) {
+                throw new Error((await response.json()).error || `Part ${index} rejected`);
+            }
+        } catch (error) {
+            if (attempt === RESUMABLE_RETRIES) throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+    }
+    throw new Error(`Part ${index} failed`);
+}
+
+async function uploadResumable(file) {
+    const session = await fetch('/upload/sessions', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    }).then(response => response.json());
+    if (session.error) throw new Error(session.error);
+    
+    //workers pull the next part number until every part is sent
+    let nextPart = 0;
+    const worker = async () => {
+        while (nextPart < session.parts) {
+            const index = nextPart++;
+            const start = index * session.part_size;
+            await uploadPart(session.session_id, index, file.slice(start, start + session.part_size));
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(RESUMABLE_CONCURRENCY, session.parts) }, worker));
+    
+    const result = await fetch(`/upload/sessions/${session.session_id}/complete`, {
+        method: 'POST'
+    }).then(response => response.json());
+    if (result.error) throw new Error(result.error);
+    return result.files;
+}
+
+async function uploadLargeFiles(files) {
+    for (const file of files) {
+        showNotification(`Uploading ${file.name} in parts...`, 'info');
+        try {
+            const uploaded = await uploadResumable(file);
+            uploadedFiles = [...uploadedFiles, ...uploaded];
+            displayUploadedFiles();
+            addFilesToLiveSession(uploaded);
+            showNotification(`Successfully uploaded ${file.name}!`, 'success');
+        } catch (error) {
+            console.error('Resumable upload error:', error);
+            showNotification(`Upload failed for ${file.name}: ${error.message}`, 'error');
+        }
+    }
+}
 function displayUploadedFiles() {
     const preview = document.getElementById('upload-preview');
     preview.innerHTML = '';
@@ -247,6 +392,7 @@ function displayUploadedFiles() {
         const fileElement = createDraggableFile(file);
         preview.appendChild(fileElement);
     });
+    drawWaveforms(preview);
 }
 function createDraggableFile(file) {
     const container = document.createElement('div');
@@ -259,8 +405,9 @@ function createDraggableFile(file) {
             <div class="w-full h-20 bg-base-300 rounded border-2 border-base-300 group-hover:border-primary flex flex-col items-center justify-center p-2">
                 <div class="text-2xl">🎵</div>
                 <div class="text-xs text-center truncate w-full">${file.original_name}</div>
-                <audio controls class="w-full mt-1" style="height: 20px;">
-                    <source src="${file.url}" type="audio/mpeg">
+                <canvas class="w-full" height="20" data-waveform="${file.url}/waveform?format=json"></canvas>
+                <audio controls preload="none" class="w-full mt-1" style="height: 20px;">
+                    <source src="${file.url}?size=preview" type="audio/mpeg">
                     Your browser does not support the audio element.
                 </audio>
             </div>
@@ -272,7 +419,7 @@ function createDraggableFile(file) {
         `;
     } else {
         container.innerHTML = `
-            <img src="${file.url}" alt="${file.original_name}" 
+            <img src="${file.url}?size=thumb" alt="${file.original_name}" loading="lazy"
                  class="max-w-full max-h-32 object-contain rounded border-2 border-base-300 group-hover:border-primary">
             <div class="absolute inset-0 bg-black bg-opacity-0 group-hover:bg-opacity-20 rounded transition-all"></div>
             <div class="absolute top-1 right-1 opacity-0 group-hover:opacity-100 transition-opacity">
@@ -294,6 +441,10 @@ function createDraggableFile(file) {
     return container;
 }
 function removeFile(filename) {
+    if (liveSession) {
+        submitSessionOp({ op: 'remove', file: filename });
+        return;
+    }
     uploadedFiles = uploadedFiles.filter(file => file.filename !== filename);
     //remove from tiers as well
     tierData.forEach(tier => {
@@ -307,20 +458,24 @@ function setupTierControls() {
     const slider = document.getElementById('tier-slider');
     const countDisplay = document.getElementById('tier-count-display');
     const saveBtn = document.getElementById('save-btn');
+    const exportBtn = document.getElementById('export-btn');
+    const shareBtn = document.getElementById('share-btn');
     const importBtn = document.getElementById('import-btn');
     const importInput = document.getElementById('import-input');
+    const exportImageBtn = document.getElementById('export-image-btn');
     const imageRecognitionBtn = document.getElementById('image-recognition-btn');
-    const printBtn = document.getElementById('print-btn');
     slider.addEventListener('input', (e) => {
         const count = parseInt(e.target.value);
         countDisplay.textContent = count;
         updateTierCount(count);
     });
     
-    saveBtn.addEventListener('click', saveTierList);
+    saveBtn.addEventListener('click', () => saveTierList());
+    exportBtn.addEventListener('click', exportTierList);
+    exportImageBtn.addEventListener('click', exportTierListImage);
+    shareBtn.addEventListener('click', shareTierList);
     importBtn.addEventListener('click', () => importInput.click());
     importInput.addEventListener('change', handleImportFile);
-    printBtn.addEventListener('click', printTierList);
 
     if (imageRecognitionBtn) {
         imageRecognitionBtn.addEventListener('click', toggleImageRecognition);
@@ -339,6 +494,10 @@ function generateDefaultTiers() {
     renderTiers();
 }
 function updateTierCount(newCount) {
+    if (liveSession) {
+        submitSessionOp({ op: 'tiers', count: newCount });
+        return;
+    }
     const currentCount = tierData.length;
     if (newCount > currentCount) {
         //add new tiers
@@ -366,6 +525,46 @@ function renderTiers() {
         const tierElement = createTierElement(tier, index);
         container.appendChild(tierElement);
     });
+    drawWaveforms(container);
+}
+//waveform peaks are a few KB of precomputed min/max pairs, fetched once per file
+const waveformCache = new Map();
+async function loadWaveform(url, attempts = 5) {
+    const response = await fetch(url);
+    if (response.status === 503 && attempts > 1) {
+        //still being computed on the server
+        const delay = (parseInt(response.headers.get('Retry-After'), 10) || 5) * 1000;
+        await new Promise(resolve => setTimeout(resolve, delay));
+        return loadWaveform(url, attempts - 1);
+    }
+    return response.ok ? response.json() : null;
+}
+function fetchWaveform(url) {
+    if (!waveformCache.has(url)) {
+        waveformCache.set(url, loadWaveform(url).catch(() => null));
+    }
+    return waveformCache.get(url);
+}
+function drawWaveforms(root) {
+    root.querySelectorAll('canvas[data-waveform]').forEach(canvas => {
+        fetchWaveform(canvas.dataset.waveform).then(waveform => {
+            if (!waveform || !canvas.isConnected) {
+                return;
+            }
+            const context = canvas.getContext('2d');
+            canvas.width = canvas.clientWidth || waveform.length;
+            const middle = canvas.height / 2;
+            const scale = middle / 128;
+            const binsPerPixel = waveform.length / canvas.width;
+            context.fillStyle = getComputedStyle(canvas).color;
+            for (let x = 0; x < canvas.width; x++) {
+                const bin = Math.floor(x * binsPerPixel);
+                const min = waveform.data[bin * 2];
+                const max = waveform.data[bin * 2 + 1];
+                context.fillRect(x, middle - max * scale, 1, Math.max(1, (max - min) * scale));
+            }
+        });
+    });
 }
 function createTierElement(tier, index) {
     const tierDiv = document.createElement('div');
@@ -404,8 +603,9 @@ function createTierFileHTML(file) {
                 <div class="w-16 h-16 bg-base-300 rounded border border-base-300 flex flex-col items-center justify-center p-1">
                     <div class="text-lg">🎵</div>
                     <div class="text-xs text-center truncate w-full">${file.original_name.substring(0, 8)}...</div>
-                    <audio controls class="w-full mt-1" style="height: 16px; transform: scale(0.8);">
-                        <source src="${file.url}" type="audio/mpeg">
+                    <canvas class="w-full" height="12" data-waveform="${file.url}/waveform?format=json"></canvas>
+                    <audio controls preload="none" class="w-full mt-1" style="height: 16px; transform: scale(0.8);">
+                        <source src="${file.url}?size=preview" type="audio/mpeg">
                     </audio>
                 </div>
                 <!-- Delete button -->
@@ -429,7 +629,7 @@ function createTierFileHTML(file) {
                  data-file-id="${file.filename}"
                  onmousedown="handleFileDragStart(event)"
                  onmouseup="handleFileDragEnd(event)">
-                <img src="${file.url}" alt="${file.original_name}" 
+                <img src="${file.url}?size=thumb" alt="${file.original_name}" loading="lazy"
                      class="h-16 w-auto object-contain rounded border border-base-300">
                 ${recognitionOverlay}
                 <!-- Delete button -->
@@ -447,6 +647,10 @@ function editTierLabel(tierIndex) {
     const newLabel = prompt('Enter new tier label:', currentLabel);
     
     if (newLabel !== null && newLabel.trim() !== '') {
+        if (liveSession) {
+            submitSessionOp({ op: 'label', tier: tierIndex, label: newLabel.trim() });
+            return;
+        }
         tierData[tierIndex].label = newLabel.trim();
         renderTiers();
     }
@@ -483,6 +687,10 @@ function handleTierDrop(e, tierIndex) {
     const fileId = draggedElement.dataset.fileId;
     const file = findFileById(fileId);
     if (!file) return;
+    if (liveSession) {
+        submitSessionOp({ op: 'move', file: fileId, tier: tierIndex });
+        return;
+    }
     //remove file from its current location
     removeFileFromCurrentLocation(fileId);
     //add to new tier
@@ -505,9 +713,8 @@ function removeFileFromCurrentLocation(fileId) {
 }
 
 // save functionality
-function saveTierList() {
-    const tierListData = {
-        timestamp: new Date().toISOString(),
+function buildTierListData() {
+    return {
         tiers: tierData.map(tier => ({
             label: tier.label,
             files: tier.files.map(file => ({
@@ -517,13 +724,520 @@ function saveTierList() {
             }))
         }))
     };
+}
+function exportTierList() {
+    const tierListData = {
+        timestamp: new Date().toISOString(),
+        ...buildTierListData()
+    };
     const dataStr = JSON.stringify(tierListData, null, 2);
     const dataBlob = new Blob([dataStr], {type: 'application/json'});
     const link = document.createElement('a');
     link.href = URL.createObjectURL(dataBlob);
     link.download = `tierlist-${new Date().toISOString().slice(0, 10)}.json`;
     link.click();
-    showNotification('Tier list saved successfully!', 'success');
+    showNotification('Tier list exported successfully!', 'success');
+}
+
+// versioned saves: the first save stores the whole list, later ones only a
+// JSON patch against the saved version (see tierlist_history.py); the saved
+// version is kept in localStorage so reloading fetches just what changed
+let savedDocument = null;
+const SAVED_DOCUMENT_PREFIX = 'tierlist-document:';
+
+function cloneJson(value) {
+    return JSON.parse(JSON.stringify(value));
+}
+function rememberSavedDocument(id, version, documentData) {
+    savedDocument = { id, version, document: documentData };
+    try {
+        localStorage.setItem(SAVED_DOCUMENT_PREFIX + id, JSON.stringify({ version, document: documentData }));
+    } catch (error) {
+        //storage full: the next load fetches the whole list
+    }
+}
+async function saveTierList(retried = false) {
+    const current = buildTierListData();
+    try {
+        if (!savedDocument) {
+            const response = await fetch('/documents', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(current)
+            });
+            const data = await response.json();
+            if (data.error) {
+                showNotification(data.error, 'error');
+                return;
+            }
+            rememberSavedDocument(data.id, data.version, current);
+            history.replaceState(null, '', data.url);
+            showNotification(`Tier list saved: ${window.location.origin}${data.url}`, 'success');
+            return;
+        }
+        
+        const patch = diffTierList(savedDocument.document, current);
+        if (patch.length === 0) {
+            showNotification('No changes to save', 'info');
+            return;
+        }
+        const response = await fetch(`/documents/${encodeURIComponent(savedDocument.id)}`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ base: savedDocument.version, patch })
+        });
+        const data = await response.json();
+        if (response.status === 409 && !retried) {
+            //saved elsewhere meanwhile: replay our change on the latest version
+            const merged = await rebaseSavedDocument(patch);
+            if (merged) {
+                showSavedDocument(merged);
+                return saveTierList(true);
+            }
+        }
+        if (data.error) {
+            showNotification(data.error, response.status === 409 ? 'warning' : 'error');
+            return;
+        }
+        rememberSavedDocument(savedDocument.id, data.version, current);
+        showNotification(`Tier list saved (version ${data.version})`, 'success');
+    } catch (error) {
+        console.error('Save error:', error);
+        showNotification('Saving failed. Please try again.', 'error');
+    }
+}
+async function rebaseSavedDocument(patch) {
+    const { id, version, document: base } = savedDocument;
+    const data = await fetch(`/documents/${encodeURIComponent(id)}?since=${version}`).then(response => response.json());
+    if (data.error) return null;
+    const head = data.patch ? applyJsonPatch(cloneJson(base), data.patch) : data.document;
+    try {
+        //the test operations in our patch fail if the same entries changed
+        const merged = applyJsonPatch(cloneJson(head), patch);
+        rememberSavedDocument(id, data.version, head);
+        return merged;
+    } catch (error) {
+        return null;
+    }
+}
+function loadSavedDocument(useCache = true) {
+    const documentId = document.body.dataset.savedDocument;
+    if (!documentId) return;
+    let cached = null;
+    if (useCache) {
+        try {
+            cached = JSON.parse(localStorage.getItem(SAVED_DOCUMENT_PREFIX + documentId));
+        } catch (error) {
+            cached = null;
+        }
+    }
+    const query = cached ? `?since=${cached.version}` : '';
+    fetch(`/documents/${encodeURIComponent(documentId)}${query}`)
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showNotification(data.error, 'error');
+            return;
+        }
+        const documentData = data.patch ? applyJsonPatch(cached.document, data.patch) : data.document;
+        rememberSavedDocument(documentId, data.version, documentData);
+        showSavedDocument(cloneJson(documentData));
+    })
+    .catch(error => {
+        console.error('Saved tier list error:', error);
+        if (cached) {
+            loadSavedDocument(false);
+        } else {
+            showNotification('Could not load saved tier list.', 'error');
+        }
+    });
+}
+function showSavedDocument(documentData) {
+    //entries were checked when they were saved, urls follow from the names
+    const files = documentData.tiers.flatMap(tier => tier.files || []).map(file => ({
+        ...file,
+        url: `/uploads/${encodeURIComponent(file.filename)}`
+    }));
+    importTierList({ tierlist: documentData, available_files: files, missing_files: [] });
+}
+function sameFileEntry(a, b) {
+    return a.filename === b.filename && a.original_name === b.original_name && a.is_audio === b.is_audio;
+}
+// edits between the common prefix and suffix of two file lists
+function diffFileList(path, before, after) {
+    let start = 0;
+    while (start < before.length && start < after.length && sameFileEntry(before[start], after[start])) {
+        start++;
+    }
+    let end = 0;
+    while (end < before.length - start && end < after.length - start &&
+           sameFileEntry(before[before.length - 1 - end], after[after.length - 1 - end])) {
+        end++;
+    }
+    const patch = [];
+    for (let i = before.length - end - 1; i >= start; i--) {
+        patch.push({ op: 'test', path: `${path}/${i}/filename`, value: before[i].filename });
+        patch.push({ op: 'remove', path: `${path}/${i}` });
+    }
+    for (let i = start; i < after.length - end; i++) {
+        patch.push({ op: 'add', path: `${path}/${i}`, value: after[i] });
+    }
+    return patch;
+}
+function diffTierList(before, after) {
+    const patch = [];
+    for (let i = before.tiers.length - 1; i >= after.tiers.length; i--) {
+        patch.push({ op: 'remove', path: `/tiers/${i}` });
+    }
+    after.tiers.forEach((tier, i) => {
+        const old = before.tiers[i];
+        if (!old) {
+            patch.push({ op: 'add', path: '/tiers/-', value: tier });
+            return;
+        }
+        if (old.label !== tier.label) {
+            patch.push({ op: 'add', path: `/tiers/${i}/label`, value: tier.label });
+        }
+        patch.push(...diffFileList(`/tiers/${i}/files`, old.files || [], tier.files));
+    });
+    return patch;
+}
+// JSON patch (RFC 6902), as applied by tierlist_history.apply_patch
+function applyJsonPatch(target, patch) {
+    const parse = (path) => path.slice(1).split('/').map(token => token.replace(/~1/g, '/').replace(/~0/g, '~'));
+    const child = (node, token) => {
+        if (Array.isArray(node)) {
+            const index = Number(token);
+            if (/^(0|[1-9][0-9]*)$/.test(token) && index < node.length) return node[index];
+        } else if (node && typeof node === 'object' && Object.prototype.hasOwnProperty.call(node, token)) {
+            return node[token];
+        }
+        throw new Error(`Patch path not found: ${token}`);
+    };
+    const resolve = (tokens) => tokens.reduce(child, target);
+    const add = (tokens, value) => {
+        const parent = resolve(tokens.slice(0, -1));
+        const last = tokens[tokens.length - 1];
+        if (Array.isArray(parent)) {
+            const index = last === '-' ? parent.length : Number(last);
+            if (!(index >= 0 && index <= parent.length)) throw new Error(`Patch index out of range: ${last}`);
+            parent.splice(index, 0, value);
+        } else if (parent && typeof parent === 'object') {
+            parent[last] = value;
+        } else {
+            throw new Error('Patch cannot add to a scalar');
+        }
+    };
+    const remove = (tokens) => {
+        const parent = resolve(tokens.slice(0, -1));
+        const last = tokens[tokens.length - 1];
+        child(parent, last);
+        if (Array.isArray(parent)) return parent.splice(Number(last), 1)[0];
+        const value = parent[last];
+        delete parent[last];
+        return value;
+    };
+    patch.forEach(operation => {
+        const tokens = parse(operation.path);
+        if (operation.op === 'add') {
+            add(tokens, cloneJson(operation.value));
+        } else if (operation.op === 'remove') {
+            remove(tokens);
+        } else if (operation.op === 'replace') {
+            remove(tokens);
+            add(tokens, cloneJson(operation.value));
+        } else if (operation.op === 'move') {
+            add(tokens, remove(parse(operation.from)));
+        } else if (operation.op === 'copy') {
+            add(tokens, cloneJson(resolve(parse(operation.from))));
+        } else if (operation.op === 'test') {
+            if (JSON.stringify(resolve(tokens)) !== JSON.stringify(operation.value)) {
+                throw new Error(`Patch test failed at ${operation.path}`);
+            }
+        } else {
+            throw new Error(`Unknown patch operation: ${operation.op}`);
+        }
+    });
+    return target;
+}
+
+// share functionality: store the list server-side and copy its link
+function shareTierList() {
+    fetch('/tierlists', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(buildTierListData())
+    })
+    .then(response => response.json())
+    .then(async (data) => {
+        if (data.error) {
+            showNotification(data.error, 'error');
+            return;
+        }
+        const shareUrl = `${window.location.origin}${data.url}`;
+        try {
+            await navigator.clipboard.writeText(shareUrl);
+            showNotification(`Share link copied: ${shareUrl}`, 'success');
+        } catch (error) {
+            showNotification(`Share link: ${shareUrl}`, 'success');
+        }
+    })
+    .catch(error => {
+        console.error('Share error:', error);
+        showNotification('Sharing failed. Please try again.', 'error');
+    });
+}
+function loadSharedTierList() {
+    const sharedId = document.body.dataset.sharedTierlist;
+    if (!sharedId) return;
+    
+    fetch(`/t/${encodeURIComponent(sharedId)}`, { headers: { 'Accept': 'application/json' } })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showNotification(data.error, 'error');
+        } else {
+            importTierList(data);
+        }
+    })
+    .catch(error => {
+        console.error('Shared tier list error:', error);
+        showNotification('Could not load shared tier list.', 'error');
+    });
+}
+
+// live sessions: edits are sent as small operations, and every client
+// applies the server's ordered log of them on top of the last snapshot
+// (see collab.py). Own edits show at once and are replayed on top of the
+// confirmed state until the server echoes them back.
+let liveSession = null;
+const MAX_SESSION_OPS_PER_REQUEST = 50;
+
+function setupLiveSession() {
+    const liveBtn = document.getElementById('live-btn');
+    if (liveBtn) {
+        liveBtn.addEventListener('click', startLiveSession);
+    }
+    const sessionId = document.body.dataset.liveSession;
+    if (sessionId) {
+        joinLiveSession(sessionId);
+    }
+}
+function startLiveSession() {
+    if (liveSession) {
+        copySessionLink();
+        return;
+    }
+    const tiered = new Set(tierData.flatMap(tier => tier.files.map(file => file.filename)));
+    fetch('/sessions', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            ...buildTierListData(),
+            pool: uploadedFiles.filter(file => !tiered.has(file.filename)).map(file => ({
+                filename: file.filename,
+                original_name: file.original_name,
+                is_audio: file.is_audio
+            }))
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            showNotification(data.error, 'error');
+            return;
+        }
+        history.replaceState(null, '', data.url);
+        joinLiveSession(data.id);
+        copySessionLink();
+    })
+    .catch(error => {
+        console.error('Live session error:', error);
+        showNotification('Could not start a live session.', 'error');
+    });
+}
+async function copySessionLink() {
+    const sessionUrl = `${window.location.origin}/s/${liveSession.id}`;
+    try {
+        await navigator.clipboard.writeText(sessionUrl);
+        showNotification(`Live session link copied: ${sessionUrl}`, 'success');
+    } catch (error) {
+        showNotification(`Live session link: ${sessionUrl}`, 'success');
+    }
+}
+function joinLiveSession(sessionId) {
+    const clientId = window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    const session = {
+        id: sessionId,
+        clientId,
+        seq: 0,
+        version: 0,
+        confirmed: null,
+        pending: [],
+        unsent: [],
+        sending: false,
+        renderScheduled: false,
+        source: null
+    };
+    liveSession = session;
+    //EventSource reconnects on its own and resumes from the last event id;
+    //a server with no stream to spare answers 'busy' and the retry delay
+    const source = new EventSource(`/sessions/${encodeURIComponent(sessionId)}/events`);
+    session.source = source;
+    source.addEventListener('snapshot', (e) => {
+        const data = JSON.parse(e.data);
+        session.confirmed = data.state;
+        session.version = data.version;
+        //own edits the snapshot already contains
+        session.pending = session.pending.filter(op => op.version === undefined || op.version > data.version);
+        scheduleSessionRender();
+    });
+    source.addEventListener('op', (e) => {
+        if (!session.confirmed) return;
+        const op = JSON.parse(e.data);
+        applySessionOp(session.confirmed, op);
+        session.version = Number(e.lastEventId);
+        if (op.client === session.clientId) {
+            session.pending = session.pending.filter(pending => pending.seq !== op.seq);
+        }
+        scheduleSessionRender();
+    });
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED && liveSession === session) {
+            leaveLiveSession();
+            showNotification('The live session has ended', 'warning');
+        }
+    };
+}
+function leaveLiveSession() {
+    if (!liveSession) return;
+    liveSession.source.close();
+    liveSession = null;
+}
+function submitSessionOp(op) {
+    const session = liveSession;
+    op.client = session.clientId;
+    op.seq = session.seq++;
+    session.pending.push(op);
+    session.unsent.push(op);
+    scheduleSessionRender();
+    flushSessionOps();
+}
+function addFilesToLiveSession(files) {
+    if (!liveSession || files.length === 0) return;
+    submitSessionOp({ op: 'add', files });
+}
+// one request in flight per client; edits made meanwhile go in the next batch
+async function flushSessionOps() {
+    const session = liveSession;
+    if (!session || session.sending || session.unsent.length === 0) return;
+    const ops = session.unsent.splice(0, MAX_SESSION_OPS_PER_REQUEST);
+    session.sending = true;
+    try {
+        const response = await fetch(`/sessions/${encodeURIComponent(session.id)}/ops`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ops })
+        });
+        const data = await response.json();
+        if (data.error) throw new Error(data.error);
+        ops.forEach((op, index) => { op.version = data.versions[index]; });
+    } catch (error) {
+        //undo the edits locally, the server never logged them
+        session.pending = session.pending.filter(op => !ops.includes(op));
+        scheduleSessionRender();
+        showNotification(`Live edit failed: ${error.message}`, 'error');
+    } finally {
+        session.sending = false;
+        if (liveSession === session) {
+            flushSessionOps();
+        }
+    }
+}
+// must match apply_op in collab.py
+function applySessionOp(state, op) {
+    const has = (name) => Object.prototype.hasOwnProperty.call(state.files, name);
+    const detach = (name) => {
+        state.pool = state.pool.filter(other => other !== name);
+        state.tiers.forEach(tier => {
+            tier.files = tier.files.filter(other => other !== name);
+        });
+    };
+    if (op.op === 'move') {
+        if (!has(op.file)) return;
+        detach(op.file);
+        const toPool = op.tier === null || op.tier === undefined || op.tier >= state.tiers.length;
+        const target = toPool ? state.pool : state.tiers[op.tier].files;
+        if (op.index === undefined || op.index === null || op.index >= target.length) {
+            target.push(op.file);
+        } else {
+            target.splice(op.index, 0, op.file);
+        }
+    } else if (op.op === 'remove') {
+        detach(op.file);
+        delete state.files[op.file];
+    } else if (op.op === 'label') {
+        if (op.tier < state.tiers.length) {
+            state.tiers[op.tier].label = op.label;
+        }
+    } else if (op.op === 'tiers') {
+        while (state.tiers.length < op.count) {
+            const index = state.tiers.length;
+            state.tiers.push({ label: DEFAULT_TIER_LABELS[index] || `T${index + 1}`, files: [] });
+        }
+        state.tiers.splice(op.count).forEach(tier => state.pool.push(...tier.files));
+    } else if (op.op === 'add') {
+        op.files.forEach(file => {
+            if (!has(file.filename)) {
+                state.files[file.filename] = file;
+                state.pool.push(file.filename);
+            }
+        });
+    }
+}
+// bursts of operations are drawn once per frame
+function scheduleSessionRender() {
+    if (!liveSession || liveSession.renderScheduled) return;
+    liveSession.renderScheduled = true;
+    requestAnimationFrame(renderSessionState);
+}
+function renderSessionState() {
+    const session = liveSession;
+    if (!session) return;
+    session.renderScheduled = false;
+    if (!session.confirmed) return;
+    
+    const { confirmed } = session;
+    const state = {
+        tiers: confirmed.tiers.map(tier => ({ label: tier.label, files: [...tier.files] })),
+        pool: [...confirmed.pool],
+        files: { ...confirmed.files }
+    };
+    session.pending.forEach(op => applySessionOp(state, op));
+    
+    //recognition labels are only known to this browser
+    const previous = new Map([...uploadedFiles, ...tierData.flatMap(tier => tier.files)].map(file => [file.filename, file]));
+    const fileFor = (name) => {
+        const file = state.files[name];
+        const known = previous.get(name);
+        if (known && known.recognition && !file.recognition) {
+            file.recognition = known.recognition;
+        }
+        return file;
+    };
+    tierData = state.tiers.map((tier, index) => ({
+        id: `tier-${index}`,
+        label: tier.label,
+        files: tier.files.map(fileFor)
+    }));
+    uploadedFiles = state.pool.map(fileFor);
+    
+    document.getElementById('tier-slider').value = tierData.length;
+    document.getElementById('tier-count-display').textContent = tierData.length;
+    displayUploadedFiles();
+    renderTiers();
 }
 
 // import functionality
@@ -534,11 +1248,13 @@ function handleImportFile(e) {
     const formData = new FormData();
     formData.append('file', file);
     showNotification('Importing tier list...', 'info');
-    fetch('/import', {
+    fetch('/import?stream=1', {
         method: 'POST',
         body: formData
     })
-    .then(response => response.json())
+    .then(response => (response.headers.get('Content-Type') || '').startsWith('application/x-ndjson')
+        ? readStreamedImport(response)
+        : response.json())
     .then(data => {
         if (data.error) {
             showNotification(data.error, 'error');
@@ -556,8 +1272,53 @@ function handleImportFile(e) {
     });
 }
 
+// rebuild the /import response from streamed NDJSON lines
+async function readStreamedImport(response) {
+    const data = { tierlist: { tiers: [] }, available_files: [], missing_files: [] };
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    
+    const handleLine = (line) => {
+        if (!line.trim()) return;
+        const message = JSON.parse(line);
+        if (message.type === 'error') {
+            data.error = message.error;
+        } else if (message.type === 'field') {
+            data.tierlist[message.key] = message.value;
+        } else if (message.type === 'files') {
+            const tier = data.tierlist.tiers[message.tier] || (data.tierlist.tiers[message.tier] = { files: [] });
+            tier.files.push(...message.files);
+            data.available_files.push(...message.available_files);
+            data.missing_files.push(...message.missing_files);
+        } else if (message.type === 'tier') {
+            const tier = data.tierlist.tiers[message.index] || { files: [] };
+            data.tierlist.tiers[message.index] = { ...message.tier, files: tier.files };
+        }
+    };
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffered + decoder.decode());
+    
+    //skipped (non-object) tiers leave holes in the sparse array
+    data.tierlist.tiers = data.tierlist.tiers.filter(Boolean);
+    return data;
+}
+
 function importTierList(data) {
     const { tierlist, available_files, missing_files } = data;
+    //an imported list replaces the board, it is no longer the session's
+    if (liveSession) {
+        leaveLiveSession();
+        showNotification('Left the live session', 'info');
+    }
     
     //show warning for missing files
     if (missing_files.length > 0) {
@@ -573,13 +1334,14 @@ function importTierList(data) {
     uploadedFiles = [...available_files];
     
     //reconstruct tier data
+    const availableByName = new Map(available_files.map(f => [f.filename, f]));
     tierlist.tiers.forEach((tier, index) => {
         const tierFiles = [];
         
         //support both new 'files' format and legacy 'images' format
         const mediaItems = tier.files || tier.images || [];
         mediaItems.forEach(fileData => {
-            const availableFile = available_files.find(f => f.filename === fileData.filename);
+            const availableFile = availableByName.get(fileData.filename);
             if (availableFile) {
                 tierFiles.push(availableFile);
             }
@@ -1092,8 +1854,8 @@ async function processVoiceCommand(transcript) {
     showNotification('Processing voice command...', 'info');
 
     try {
-        // use AI to parse the voice command --> triggers when Annyang isn't used
-        const command = await parseVoiceCommandWithAI(transcript);
+        // parse the voice command server-side --> triggers when Annyang isn't used
+        const command = await parseVoiceCommandOnServer(transcript);
         
         if (command) {
             await executeVoiceCommand(command);
@@ -1108,121 +1870,40 @@ async function processVoiceCommand(transcript) {
     }
 }
 
-async function parseVoiceCommandWithAI(transcript) {
-    const MAX_RETRIES = 2;
+async function parseVoiceCommandOnServer(transcript) {
+    // grammar + fuzzy match on the server; the AI model is only asked on a miss
+    const allFiles = [...uploadedFiles, ...tierData.flatMap(t => t.files)];
+    const items = allFiles.map(f => ({
+        id: f.filename,
+        names: f.recognition ? [f.recognition, f.original_name] : [f.original_name]
+    }));
     
-    for (let attempt = 1; attempt <= MAX_RETRIES; attempt++) {
-        try {
-            // get current tier labels and uploaded files for context
-            const tierLabels = tierData.map(t => t.label);
-            const allFiles = [...uploadedFiles, ...tierData.flatMap(t => t.files)];
-            
-            // create a list of file identifiers prioritizing recognition labels
-            const fileIdentifiers = allFiles.map(f => {
-                if (f.recognition) {
-                    return `"${f.recognition}" (AI-identified as ${f.recognition}, filename: ${f.original_name})`;
-                } else {
-                    return `"${f.original_name}" (filename: ${f.original_name})`;
-                }
-            });
-
-            const prompt = `You are a voice command parser for a tier list application. Parse the following voice command and extract the action, item name, and target tier.
-
-Available tier labels: ${tierLabels.join(', ')}
-Available files and their identifiers: ${fileIdentifiers.join(', ')}
-
-Voice command: "${transcript}"
-
-IMPORTANT: Users can refer to files by their AI-identified labels (like "nature", "person", "food") OR by their original filenames. Always prefer the AI-identified labels when available.
-
-Please respond with a JSON object in this exact format:
-{
-  "action": "move", 
-  "itemName": "the identifier the user referred to (recognition label or filename)",
-  "targetTier": "exact tier label from available tiers"
-}
-
-Only respond if the command is clearly asking to move an item to a tier. Common patterns:
-- "Move [item] to [tier] tier"
-- "Put [item] in [tier] tier" 
-- "Let's move [item] into [tier] tier"
-- "[item] should go to [tier] tier"
-Examples:
-- If user says "Move nature to S tier" and there's a file identified as "nature", use itemName: "nature"
-- If user says "Move cat photo to A tier" and there's a file identified as "animal", use itemName: "animal"
-- If user says "Move document.pdf to B tier", use itemName: "document.pdf"
-
-For fuzzy matching:
-- If the user says "cat", match files like "cat_photo.jpg" or "cute_cat.png"
-- If the user says "song", match files like "my_song.mp3" or "favorite_song.wav"
-
-If the command is not clear or doesn't match these patterns, respond with: {"action": "unknown"}`;
-
-            const controller = new AbortController();
-            const timeoutId = setTimeout(() => controller.abort(), 10000); // 10 second timeout
-            // Hack Club AI API call
-            const response = await fetch('https://ai.hackclub.com/chat/completions', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    messages: [
-                        {
-                            role: 'user',
-                            content: prompt
-                        }
-                    ],
-                    max_tokens: 1000,
-                    temperature: 0.1 
-                }),
-                signal: controller.signal
-            });
-
-            clearTimeout(timeoutId);
-
-            if (!response.ok) {
-                throw new Error(`AI API request failed: ${response.status} ${response.statusText}`);
-            }
-
-            const data = await response.json();
-            
-            if (!data.choices || !data.choices[0] || !data.choices[0].message) {
-                throw new Error('Invalid response format from AI API');
-            }
-            
-            const aiResponse = data.choices[0].message.content.trim();
-            // clean up response 
-            const cleanResponse = aiResponse.replace(/```json\n?|\n?```/g, '').trim();
-            
-            // parse the JSON response
-            const command = JSON.parse(cleanResponse);
-            
-            console.log(`AI parsed command (attempt ${attempt}):`, command);
-            if (command.action === 'unknown') {
-                return null;
-            }
-            
-            // validate the response structure
-            if (!command.action || !command.itemName || !command.targetTier) {
-                throw new Error('Invalid command structure returned by AI');
-            }
-            
-            return command;
-            
-        } catch (error) {
-            console.error(`Error parsing voice command with AI (attempt ${attempt}):`, error);
-            
-            if (attempt === MAX_RETRIES) {
-                return parseVoiceCommandSimple(transcript);
-            }
-            
-            //  rate limit handling
-            await new Promise(resolve => setTimeout(resolve, 1000));
+    try {
+        const controller = new AbortController();
+        const timeoutId = setTimeout(() => controller.abort(), 15000); // 15 second timeout
+        const response = await fetch('/commands/parse', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                transcripts: [transcript],
+                tiers: tierData.map(t => t.label),
+                items: items
+            }),
+            signal: controller.signal
+        });
+        clearTimeout(timeoutId);
+        
+        if (!response.ok) {
+            throw new Error(`Command parse request failed: ${response.status}`);
         }
+        const data = await response.json();
+        const command = data.commands[0];
+        console.log(`Parsed command (${command.source}):`, command);
+        return command.action === 'move' ? command : null;
+    } catch (error) {
+        console.error('Error parsing voice command on server:', error);
+        return parseVoiceCommandSimple(transcript);
     }
-    
-    return null;
 }
 
 function parseVoiceCommandSimple(transcript) {
@@ -1261,7 +1942,7 @@ function parseVoiceCommandSimple(transcript) {
 }
 
 async function executeVoiceCommand(command) {
-    const { action, itemName, targetTier } = command;
+    const { action, itemId, itemName, targetTier } = command;
     
     if (action !== 'move') {
         showNotification('Only move commands are supported', 'warning');
@@ -1269,7 +1950,7 @@ async function executeVoiceCommand(command) {
     }
 
     const allFiles = [...uploadedFiles, ...tierData.flatMap(t => t.files)];
-    const file = findFileByName(allFiles, itemName);
+    const file = itemId ? findFileById(itemId) : findFileByName(allFiles, itemName);
     if (!file) {
         showNotification(`Could not find file: ${itemName}`, 'error');
         return;
@@ -1341,6 +2022,10 @@ function findFileByName(files, searchName) {
 function moveItemToTier(fileId, targetTierIndex) {
     const file = findFileById(fileId);
     if (!file) return;
+    if (liveSession) {
+        submitSessionOp({ op: 'move', file: fileId, tier: targetTierIndex });
+        return;
+    }
     
     removeFileFromCurrentLocation(fileId);
     
@@ -1382,10 +2067,10 @@ async function analyzeImage(imageUrl, filename) {
         console.log(`[DEBUG] Starting AI analysis for: ${filename}`);
         console.log(`[DEBUG] Image URL: ${imageUrl}`);
         // try multiple approaches for image analysis
-        let recognition = await tryHackClubAPI(imageUrl, filename);
+        let recognition = await fetchServerRecognition(filename);
         
         if (!recognition) {
-            console.log(`[DEBUG] Hack Club API failed, trying filename-based fallback...`);
+            console.log(`[DEBUG] Server recognition failed, trying filename-based fallback...`);
             recognition = getFilenameBasedLabel(filename);
         }
         return recognition;
@@ -1404,123 +2089,94 @@ async function analyzeImage(imageUrl, filename) {
     }
 }
 
-async function tryHackClubAPI(imageUrl, filename) {
-    try {
-        // convert image to base64 for AI API
-        console.log(`[DEBUG] Converting image to base64...`);
-        const base64Image = await imageToBase64(imageUrl);
-        console.log(`[DEBUG] Base64 conversion complete, length: ${base64Image.length}`);
-        const prompt = `Analyze this image and provide a single word that best describes what it shows. Examples:
-- If it's a store/shop: "shop"
-- If it's a street/road: "street" 
-- If it's a person: "person"
-- If it's food: "food"
-- If it's an animal: "animal"
-- If it's a vehicle: "vehicle"
-- If it's text/document: "document"
-- If it's art/drawing: "art"
-
-Respond with only ONE word, no explanations or additional text.`;
+const RECOGNITION_POLL_MS = 3000;
+const RECOGNITION_POLLS = 5;
 
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 15000); // 15 second timeout
-
-        const formats = [
-            {
-                model: "gpt-4-vision-preview",
-                messages: [
-                    {
-                        role: 'user',
-                        content: [
-                            {
-                                type: 'text',
-                                text: prompt
-                            },
-                            {
-                                type: 'image_url',
-                                image_url: {
-                                    url: base64Image
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens: 100,
-                temperature: 0.1
-            },
-            {
-                model: "gpt-4-vision-preview",
-                messages: [
-                    {
-                        role: 'user',
-                        content: `${prompt}\n\nImage data: ${base64Image}`
-                    }
-                ],
-                max_tokens: 100,
-                temperature: 0.1
-            },
-            {
-                messages: [
-                    {
-                        role: 'user',
-                        content: `Analyze the filename "${filename}" and provide a single word that best describes what type of image it might be. Examples: shop, street, person, food, animal, building, nature, vehicle, document, art. Respond with only ONE word.`
-                    }
-                ],
-                max_tokens: 100,
-                temperature: 0.1
+async function fetchServerRecognition(filename) {
+    // the server labels its own 512px derivative and caches by content hash
+    try {
+        let data = null;
+        for (let poll = 0; poll <= RECOGNITION_POLLS; poll++) {
+            if (poll > 0) {
+                // still running upstream, it lands in the server cache
+                await new Promise(resolve => setTimeout(resolve, RECOGNITION_POLL_MS));
             }
-        ];
-
-        for (let i = 0; i < formats.length; i++) {
-            console.log(`[DEBUG] Trying API format ${i + 1}...`);
-            
-            try {
-                const response = await fetch('https://ai.hackclub.com/chat/completions', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify(formats[i]),
-                    signal: controller.signal
-                });
-
-                console.log(`[DEBUG] AI API response status (format ${i + 1}): ${response.status}`);
-                
-                if (response.ok) {
-                    const data = await response.json();
-                    if (data.choices && data.choices[0] && data.choices[0].message) {
-                        const recognition = data.choices[0].message.content.trim().toLowerCase();
-                        console.log(`[DEBUG] Image recognition successful for ${filename}: "${recognition}" (using format ${i + 1})`);
-                        clearTimeout(timeoutId);
-                        return recognition;
-                    } else {
-                        console.log(`[DEBUG] Format ${i + 1} returned invalid response structure`);
-                    }
-                } else {
-                    const errorText = await response.text().catch(() => 'Unknown error');
-                    console.log(`[DEBUG] Format ${i + 1} failed with status ${response.status}: ${errorText.substring(0, 100)}`);
-                    if (i < formats.length - 1) {
-                        console.log(`[DEBUG] Trying next format...`);
-                        continue;
-                    }
-                }
-            } catch (formatError) {
-                console.log(`[DEBUG] Format ${i + 1} threw error:`, formatError.message);
-                if (i < formats.length - 1) {
-                    console.log(`[DEBUG] Trying next format...`);
-                    continue;
-                }
+            const response = await fetch(`/recognize/${encodeURIComponent(filename)}`);
+            if (!response.ok) {
+                console.log(`[DEBUG] Recognition request failed with status ${response.status} for ${filename}`);
+                return null;
+            }
+            data = await response.json();
+            if (!data.pending) {
+                break;
             }
         }
+        console.log(`[DEBUG] Image recognition for ${filename}: "${data.label}" (cached: ${data.cached})`);
+        return data.label;
+    } catch (error) {
+        console.error(`[DEBUG] fetchServerRecognition error for ${filename}:`, error);
+        return null;
+    }
+}
 
-        clearTimeout(timeoutId);
+async function fetchServerRecognitions(filenames) {
+    // one request for many images; cached labels come back without an AI call,
+    // the ones still running upstream are asked for again
+    const labels = {};
+    let remaining = filenames;
+    for (let poll = 0; poll <= RECOGNITION_POLLS && remaining.length > 0; poll++) {
+        if (poll > 0) {
+            await new Promise(resolve => setTimeout(resolve, RECOGNITION_POLL_MS));
+        }
+        const response = await fetch('/recognize', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filenames: remaining })
+        });
+        if (!response.ok) {
+            throw new Error(`Recognition request failed with status ${response.status}`);
+        }
+        const data = await response.json();
+        remaining = [];
+        for (const [filename, result] of Object.entries(data.results)) {
+            labels[filename] = result ? result.label : null;
+            if (result && result.pending) {
+                remaining.push(filename);
+            }
+        }
+    }
+    return labels;
+}
 
-        console.log(`[DEBUG] All API formats failed for ${filename}`);
-        return null;
-        
+async function warnAboutNearDuplicates(files) {
+    // perceptual hash lookup, limited to items already on this board
+    const images = files.filter(file => !file.is_audio).map(file => file.filename);
+    if (images.length === 0) {
+        return;
+    }
+    const onBoard = [...uploadedFiles, ...tierData.flatMap(tier => tier.files)].map(file => file.filename);
+    try {
+        const response = await fetch('/similar', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filenames: images, within: onBoard, k: 1 })
+        });
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        const reported = new Set();
+        for (const [filename, result] of Object.entries(data.results)) {
+            const match = result && result.near_duplicates[0];
+            const pair = match && [filename, match.filename].sort().join('|');
+            if (match && !reported.has(pair)) {
+                reported.add(pair);
+                const file = files.find(f => f.filename === filename);
+                showNotification(`"${file.original_name}" looks like a near-duplicate of ${match.filename}`, 'warning');
+            }
+        }
     } catch (error) {
-        console.error(`[DEBUG] tryHackClubAPI error for ${filename}:`, error);
-        return null;
+        console.error('Near-duplicate check failed:', error);
     }
 }
 
@@ -1554,43 +2210,6 @@ function getFilenameBasedLabel(filename) {
     return randomLabel;
 }
 
-async function imageToBase64(imageUrl) {
-    return new Promise((resolve, reject) => {
-        const img = new Image();
-        img.crossOrigin = 'anonymous';
-        img.onload = function() {
-            const canvas = document.createElement('canvas');
-            const ctx = canvas.getContext('2d');
-            
-            const maxSize = 512;
-            let { width, height } = img;
-            
-            if (width > height) {
-                if (width > maxSize) {
-                    height = (height * maxSize) / width;
-                    width = maxSize;
-                }
-            } else {
-                if (height > maxSize) {
-                    width = (width * maxSize) / height;
-                    height = maxSize;
-                }
-            }
-            
-            canvas.width = width;
-            canvas.height = height;
-            
-            ctx.drawImage(img, 0, 0, width, height);
-            
-            const base64 = canvas.toDataURL('image/jpeg', 0.8);
-            resolve(base64);
-        };
-        
-        img.onerror = () => reject(new Error('Failed to load image'));
-        img.src = imageUrl;
-    });
-}
-
 function addImageRecognitionOverlay(container, recognition) {
     if (!recognition) {
         console.log('[DEBUG] No recognition data provided to addImageRecognitionOverlay');
@@ -1630,11 +2249,20 @@ function toggleImageRecognition() {
         if (imageFiles.length > 0) {
             showNotification(`Analyzing ${imageFiles.length} existing image(s)...`, 'info');
             
-            // process images sequentially
+            // one batched request, in chunks the server accepts
             (async () => {
+                const labels = {};
+                const filenames = [...new Set(imageFiles.map(file => file.filename))];
+                for (let i = 0; i < filenames.length; i += 50) {
+                    try {
+                        Object.assign(labels, await fetchServerRecognitions(filenames.slice(i, i + 50)));
+                    } catch (error) {
+                        console.error('Batch recognition failed:', error);
+                    }
+                }
                 for (const file of imageFiles) {
                     try {
-                        const recognition = await analyzeImage(file.url, file.filename);
+                        const recognition = labels[file.filename] || getFilenameBasedLabel(file.filename);
                         if (recognition) {
                             file.recognition = recognition;
                             // update the same file in uploadedFiles if it exists there
@@ -1744,104 +2372,55 @@ function setupLofiMusic() {
 
 //print functionality
 function setupPrintButton() {
-    const printBtn = document.getElementById('print-btn');
-    if (!printBtn) {
+    //one in the navbar, one with the list controls
+    const printBtns = document.querySelectorAll('#print-btn');
+    if (!printBtns.length) {
         console.error('Print button not found in DOM');
         return;
     }
-    printBtn.addEventListener('click', printTierList);
+    printBtns.forEach(button => button.addEventListener('click', printTierList));
+}
+//exports are composed on the server from thumbnails (see tierlist_render.py)
+//and cached by content, so the page never loads the full-size originals
+async function renderTierList(format, download) {
+    //opened before the request so popup blockers allow it
+    const exportWindow = download ? null : window.open('', '_blank');
+    showNotification('Rendering tier list...', 'info');
+    try {
+        const response = await fetch(`/render?format=${format}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(buildTierListData())
+        });
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            if (exportWindow) exportWindow.close();
+            showNotification(data.error || 'Rendering failed. Please try again.', 'error');
+            return;
+        }
+        const url = URL.createObjectURL(await response.blob());
+        if (exportWindow) {
+            exportWindow.location.href = url;
+        } else {
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = `tierlist-${new Date().toISOString().slice(0, 10)}.${format}`;
+            link.click();
+            showNotification('Tier list image exported!', 'success');
+        }
+        setTimeout(() => URL.revokeObjectURL(url), 60000);
+    } catch (error) {
+        console.error('Render error:', error);
+        if (exportWindow) exportWindow.close();
+        showNotification('Rendering failed. Please try again.', 'error');
+    }
 }
 function printTierList() {
-    //create print-friendly version
-    const printWindow = window.open('', '_blank');
-    
-    const printContent = generatePrintableHTML();
-    
-    printWindow.document.write(printContent);
-    printWindow.document.close();
-    
-    //wait for images to load then print
-    printWindow.onload = function() {
-        setTimeout(() => {
-            printWindow.print();
-            printWindow.close();
-        }, 500);
-    };
-    
-    showNotification('Opening print dialog...', 'info');
+    //the browser's PDF viewer does the printing
+    renderTierList('pdf', false);
 }
-
-function generatePrintableHTML() {
-    const timestamp = new Date().toLocaleString();
-    
-    let tierHTML = '';
-    tierData.forEach(tier => {
-        tierHTML += `
-            <div style="page-break-inside: avoid; margin-bottom: 20px; border: 2px solid #333; border-radius: 8px;">
-                <div style="display: flex; align-items: center; min-height: 80px;">
-                    <div style="background: #333; color: white; padding: 20px; font-size: 24px; font-weight: bold; min-width: 80px; text-align: center;">
-                        ${tier.label}
-                    </div>
-                    <div style="flex: 1; padding: 10px; display: flex; flex-wrap: wrap; gap: 10px; align-items: center;">
-                        ${tier.files.map(file => {
-                            if (file.is_audio) {
-                                return `
-                                    <div style="width: 60px; height: 60px; border: 1px solid #ccc; display: flex; flex-direction: column; align-items: center; justify-content: center; font-size: 12px; text-align: center;">
-                                        <div style="font-size: 20px;">🎵</div>
-                                        <div style="font-size: 8px; overflow: hidden; text-overflow: ellipsis;">${file.original_name.substring(0, 10)}</div>
-                                    </div>
-                                `;
-                            } else {
-                                return `<img src="${file.url}" style="height: 60px; width: auto; object-fit: contain; border: 1px solid #ccc;">`;
-                            }
-                        }).join('')}
-                    </div>
-                </div>
-            </div>
-        `;
-    });
-
-    return `
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Tier List - ${timestamp}</title>
-            <style>
-                body { 
-                    font-family: Arial, sans-serif; 
-                    margin: 20px; 
-                    color: #333;
-                }
-                .header { 
-                    text-align: center; 
-                    margin-bottom: 30px; 
-                    border-bottom: 2px solid #333; 
-                    padding-bottom: 20px;
-                }
-                .header h1 { 
-                    margin: 0; 
-                    font-size: 28px; 
-                }
-                .header .timestamp { 
-                    margin: 10px 0 0 0; 
-                    color: #666; 
-                    font-size: 14px; 
-                }
-                @media print {
-                    body { margin: 0; }
-                    .header { page-break-after: avoid; }
-                }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>🏆 Tier List</h1>
-                <p class="timestamp">Generated on ${timestamp}</p>
-            </div>
-            ${tierHTML}
-        </body>
-                 </html>
-     `;
+function exportTierListImage() {
+    renderTierList('png', true);
 }
 
 
@@ -0,0 +1,158 @@
+import os
+import hashlib
+import secrets
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 64 * 1024
+BLOB_DIR = 'blobs'
+
+
+class ContentStore:
+    """content-addressed upload store
+
+    Blobs are written once under their sha256 digest in a sharded layout
+    (``blobs/ab/cd/<digest><ext>``). Each upload name in the upload folder is
+    a relative symlink to its blob, which is the name -> digest mapping, so
+    ``/uploads/<filename>`` and existence checks keep working unchanged.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blob_root = os.path.join(root, BLOB_DIR)
+
+    def blob_key(self, digest, ext=''):
+        """sharded path of a digest's blob relative to the upload folder"""
+        return os.path.join(BLOB_DIR, digest[:2], digest[2:4], f"{digest}{ext.lower()}")
+
+    def blob_path(self, digest, ext=''):
+        """sharded on-disk path for a digest"""
+        return os.path.join(self.root, self.blob_key(digest, ext))
+
+    def upload_name(self, original_filename, digest):
+        """deterministic public name for an upload of given content"""
+        secured = secure_filename(original_filename)
+        name, ext = os.path.splitext(secured)
+        return f"{name}_{digest[:12]}{ext.lower()}"
+
+    def writer(self, original_filename):
+        """incremental writer for one upload, see BlobWriter"""
+        return BlobWriter(self, original_filename)
+
+    def save(self, stream, original_filename):
+        """hash the stream while spooling it to disk and store it once
+
+        Returns ``(filename, digest, size, deduplicated)``. When the blob and
+        the name link already exist nothing is kept on disk.
+        """
+        writer = self.writer(original_filename)
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+            writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.filename, writer.digest, writer.size, writer.deduplicated
+
+    def link(self, filename, blob):
+        """point an upload name at a blob, unless it already does"""
+        link_path = os.path.join(self.root, filename)
+        target = os.path.relpath(blob, self.root)
+        if os.path.islink(link_path) and os.readlink(link_path) == target:
+            os.utime(link_path, follow_symlinks=False)
+            return
+        tmp_link = f"{link_path}.{secrets.token_hex(4)}.tmp"
+        os.symlink(target, tmp_link)
+        os.replace(tmp_link, link_path)
+
+    def resolve(self, filename):
+        """return the digest an upload name points to, or None"""
+        link_path = os.path.join(self.root, filename)
+        if not os.path.islink(link_path):
+            return None
+        return os.path.splitext(os.path.basename(os.readlink(link_path)))[0]
+
+    def digest(self, filename):
+        """content digest of an upload, hashing legacy (non-linked) files"""
+        digest = self.resolve(filename)
+        if digest:
+            return digest
+        hasher = hashlib.sha256()
+        with open(os.path.join(self.root, filename), 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def touch(self, filenames):
+        """mark upload names as in use, which keeps them from the upload GC"""
+        for filename in filenames:
+            try:
+                os.utime(os.path.join(self.root, filename), follow_symlinks=False)
+            except FileNotFoundError:
+                pass
+
+    def exists(self, filename):
+        """check an upload name resolves to a file (blob or legacy upload)"""
+        return os.path.isfile(os.path.join(self.root, filename))
+
+
+class BlobWriter:
+    """one upload written chunk by chunk, hashed on the way
+
+    Data goes to a temp file beside the blob tree and is renamed into its
+    sharded blob path on ``commit``, so every byte is written to disk once
+    and readers never see a partial blob. ``abort`` drops the temp file.
+    """
+
+    def __init__(self, store, original_filename):
+        self.store = store
+        self.original_filename = original_filename
+        tmp_dir = os.path.join(store.blob_root, 'tmp')
+        os.makedirs(tmp_dir, mode=0o755, exist_ok=True)
+        self.tmp_path = os.path.join(tmp_dir, secrets.token_hex(16))
+        self.out = open(self.tmp_path, 'wb')
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.filename = self.digest = self.blob = None
+        self.deduplicated = False
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.out.write(data)
+        self.size += len(data)
+
+    def commit(self, link=True):
+        """move the data into its blob, linking the upload name unless told not to"""
+        self.out.close()
+        self.digest = self.hasher.hexdigest()
+        self.filename = self.store.upload_name(self.original_filename, self.digest)
+        self.blob = self.store.blob_path(self.digest, os.path.splitext(self.filename)[1])
+
+        self.deduplicated = os.path.exists(self.blob)
+        if self.deduplicated:
+            os.unlink(self.tmp_path)
+            #an existing blob may be old enough for the upload GC, mark it used
+            os.utime(self.blob)
+        else:
+            os.makedirs(os.path.dirname(self.blob), mode=0o755, exist_ok=True)
+            os.chmod(self.tmp_path, 0o644)
+            os.replace(self.tmp_path, self.blob)
+        if link:
+            self.store.link(self.filename, self.blob)
+        return self.filename
+
+    def abort(self):
+        self.out.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+    def discard(self):
+        """undo a commit whose name was never linked, keeping blobs that existed before"""
+        if self.blob is not None and not self.deduplicated:
+            try:
+                os.unlink(self.blob)
+            except FileNotFoundError:
+                pass
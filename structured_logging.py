@@ -0,0 +1,177 @@
+import os
+import re
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context, request
+
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}')
+#attributes every LogRecord has; anything else came in through extra=
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message'}
+
+
+class JSONFormatter(logging.Formatter):
+    """one JSON object per line, with any extra= fields at the top level"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """attach request id and route to records while still on the request thread"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """keep a fraction of requests' info logs; warnings and errors always pass
+
+    The decision is made once per request so a sampled request keeps all of
+    its lines.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        if has_request_context():
+            return g.get('log_sampled', True)
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """hand records to the listener thread without ever waiting on it
+
+    Messages and tracebacks are rendered here, since the listener has no
+    access to the request or to live exception objects. When the queue is
+    full the record is dropped and counted instead of blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """queue handler on the root logger plus one listener thread per process"""
+
+    def __init__(self, handlers, level, sample_rate, queue_size):
+        self.handlers = handlers
+        self.queue = queue.Queue(queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.setLevel(level)
+        self.handler.addFilter(RequestContextFilter())
+        self.handler.addFilter(SamplingFilter(sample_rate))
+        self.listener = None
+
+    def start(self):
+        #the listener thread does not survive a fork (gunicorn preload)
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.handler.queue = self.queue
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+
+def configure_logging(app):
+    """route app and module logs through a per-worker queue listener"""
+    level = getattr(logging, app.config['LOG_LEVEL'].upper(), logging.INFO)
+    formatter = JSONFormatter()
+
+    log_dir = os.path.dirname(app.config['LOG_FILE'])
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    file_handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=10240000, backupCount=10)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    pipeline = LogPipeline(
+        [file_handler, stream_handler],
+        level=level,
+        sample_rate=app.config['LOG_SAMPLE_RATE'],
+        queue_size=app.config['LOG_QUEUE_SIZE']
+    )
+    pipeline.start()
+    os.register_at_fork(after_in_child=pipeline.start)
+    atexit.register(pipeline.stop)
+
+    root = logging.getLogger()
+    root.addHandler(pipeline.handler)
+    root.setLevel(level)
+    #app.logger propagates to root instead of writing to stderr itself
+    from flask.logging import default_handler
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(level)
+    return pipeline
+
+
+def init_request_logging(app):
+    """request ids, per-request sampling and one access record per request"""
+    sample_rate = app.config['LOG_SAMPLE_RATE']
+    access_logger = logging.getLogger('tierlist.access')
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get('X-Request-ID', '')
+        g.request_id = incoming if REQUEST_ID_PATTERN.fullmatch(incoming) else uuid.uuid4().hex
+        g.log_sampled = sample_rate >= 1 or random.random() < sample_rate
+
+    @app.after_request
+    def log_request(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        started = g.get('request_started')
+        #successes are sampled (info), everything else is always kept
+        level = logging.INFO if response.status_code < 400 else logging.WARNING
+        access_logger.log(level, 'request', extra={
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 2) if started else None,
+            'bytes': response.content_length,
+            'remote_addr': request.remote_addr,
+        })
+        return response
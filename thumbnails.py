@@ -0,0 +1,113 @@
+import os
+import secrets
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = 'derived'
+
+# size name -> longest edge in pixels
+DERIVATIVE_SIZES = {
+    'thumb': 256,   # tier tiles and upload preview
+    'medium': 512,  # image recognition input
+}
+DERIVATIVE_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', 'image/jpeg'),
+    'webp': ('WEBP', '.webp', 'image/webp'),
+}
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+_pool = None
+_pool_pid = None
+
+
+def is_image_file(filename):
+    """check if file is an image we can derive thumbnails from"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_relpath(key, size, fmt):
+    """path of a derivative relative to the upload folder"""
+    ext = DERIVATIVE_FORMATS[fmt][1]
+    return os.path.join(DERIVED_DIR, key[:2], f"{key}_{size}{ext}")
+
+
+def render_derivative(source_path, dest_path, size, fmt):
+    """downscale one image into a derivative file, written atomically"""
+    from PIL import Image
+
+    pil_format = DERIVATIVE_FORMATS[fmt][0]
+    max_edge = DERIVATIVE_SIZES[size]
+
+    with Image.open(source_path) as img:
+        img.seek(0)  # first frame of animated gifs
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        img = img.convert('RGBA')
+        if pil_format == 'JPEG':
+            #jpeg has no alpha, flatten onto white
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+
+        os.makedirs(os.path.dirname(dest_path), mode=0o755, exist_ok=True)
+        tmp_path = f"{dest_path}.{secrets.token_hex(4)}.tmp"
+        try:
+            img.save(tmp_path, pil_format, quality=80, optimize=True)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    return dest_path
+
+
+def render_all_derivatives(upload_folder, filename, key):
+    """create every size/format derivative for an upload that is missing"""
+    source_path = os.path.join(upload_folder, filename)
+    created = []
+    for size in DERIVATIVE_SIZES:
+        for fmt in DERIVATIVE_FORMATS:
+            dest_path = os.path.join(upload_folder, derivative_relpath(key, size, fmt))
+            if os.path.exists(dest_path):
+                continue
+            created.append(render_derivative(source_path, dest_path, size, fmt))
+    return created
+
+
+def get_pool(max_workers):
+    """process pool for derivative rendering, created lazily per process
+
+    Created on first use so gunicorn workers forked from a preloaded app
+    each get their own pool instead of sharing the parent's.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=max_workers)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def queue_derivatives(upload_folder, filename, key, max_workers=2):
+    """render derivatives for an upload in the background pool"""
+    future = get_pool(max_workers).submit(render_all_derivatives, upload_folder, filename, key)
+    future.add_done_callback(log_failure(filename))
+    return future
+
+
+def log_failure(filename):
+    def callback(future):
+        error = future.exception()
+        if error is not None:
+            logger.warning(f"Derivative rendering failed for {filename}: {error}")
+    return callback
+
+
+def ensure_derivative(upload_folder, filename, key, size, fmt):
+    """return the derivative path, rendering it inline if it is missing"""
+    relpath = derivative_relpath(key, size, fmt)
+    dest_path = os.path.join(upload_folder, relpath)
+    if not os.path.exists(dest_path):
+        render_derivative(os.path.join(upload_folder, filename), dest_path, size, fmt)
+    return relpath
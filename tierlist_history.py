@@ -0,0 +1,323 @@
+import copy
+import json
+import secrets
+import threading
+from collections import OrderedDict
+
+DOCUMENT_ID_BYTES = 12
+FILE_FIELDS = ('original_name', 'is_audio')
+
+
+class PatchError(ValueError):
+    """a patch that is malformed, not allowed, or does not apply"""
+
+
+class RevisionConflict(Exception):
+    """the patch was made against a version that is no longer the head"""
+
+    def __init__(self, version):
+        super().__init__(f"head is at version {version}")
+        self.version = version
+
+
+def parse_pointer(path):
+    """JSON pointer (RFC 6901) to a list of tokens"""
+    if not isinstance(path, str) or not path.startswith('/'):
+        raise PatchError(f"invalid path {path!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in path[1:].split('/')]
+
+
+def _index(token, length, allow_end=False):
+    if token == '-' and allow_end:
+        return length
+    if not token.isdigit() or (len(token) > 1 and token[0] == '0'):
+        raise PatchError(f"invalid array index {token!r}")
+    index = int(token)
+    if index > length or (index == length and not allow_end):
+        raise PatchError(f"array index {index} out of range")
+    return index
+
+
+def _resolve(document, tokens):
+    node = document
+    for token in tokens:
+        if isinstance(node, dict):
+            if token not in node:
+                raise PatchError(f"missing member {token!r}")
+            node = node[token]
+        elif isinstance(node, list):
+            node = node[_index(token, len(node))]
+        else:
+            raise PatchError(f"cannot descend into {token!r}")
+    return node
+
+
+def _add(document, tokens, value):
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, list):
+        parent.insert(_index(tokens[-1], len(parent), allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    else:
+        raise PatchError('cannot add to a scalar')
+
+
+def _remove(document, tokens):
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, list):
+        return parent.pop(_index(tokens[-1], len(parent)))
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise PatchError(f"missing member {tokens[-1]!r}")
+        return parent.pop(tokens[-1])
+    raise PatchError('cannot remove from a scalar')
+
+
+def apply_patch(document, patch):
+    """apply a JSON patch (RFC 6902) in place
+
+    On a PatchError the document may be partly patched.
+    """
+    for operation in patch:
+        op = operation['op']
+        tokens = parse_pointer(operation['path'])
+        if op == 'add':
+            _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, tokens)
+        elif op == 'replace':
+            _remove(document, tokens)
+            _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            source = parse_pointer(operation['from'])
+            if op == 'move':
+                if tokens[:len(source)] == source and tokens != source:
+                    raise PatchError('cannot move a value into itself')
+                value = _remove(document, source)
+            else:
+                value = copy.deepcopy(_resolve(document, source))
+            _add(document, tokens, value)
+        elif op == 'test':
+            if _resolve(document, tokens) != operation['value']:
+                raise PatchError(f"test failed at {operation['path']}")
+        else:
+            raise PatchError(f"unknown operation {op!r}")
+    return document
+
+
+def _check_entry(value, filenames):
+    if not isinstance(value, dict) or not isinstance(value.get('filename'), str):
+        raise PatchError('file entries need a filename')
+    filenames.append(value['filename'])
+
+
+def _check_tier(value, filenames):
+    if not isinstance(value, dict):
+        raise PatchError('tiers must be objects')
+    if 'label' in value and not isinstance(value['label'], str):
+        raise PatchError('tier labels must be strings')
+    files = value.get('files', [])
+    if not isinstance(files, list):
+        raise PatchError('tier files must be a list')
+    if any(isinstance(field, (dict, list)) for key, field in value.items() if key != 'files'):
+        raise PatchError('tier fields other than files must be scalars')
+    for entry in files:
+        _check_entry(entry, filenames)
+
+
+def _is_position(tokens, depth):
+    #/tiers/<i> (depth 2) or /tiers/<i>/files/<j> (depth 4)
+    return len(tokens) == depth and tokens[0] == 'tiers' and (depth == 2 or tokens[2] == 'files')
+
+
+def check_patch(patch, max_ops):
+    """check that a patch only makes tierlist-shaped changes
+
+    Only the operations and the values they bring in are looked at, never
+    the document. Returns the filenames the patch adds, which the caller
+    checks against the uploads.
+    """
+    if not isinstance(patch, list):
+        raise PatchError('a patch is a list of operations')
+    if len(patch) > max_ops:
+        raise PatchError(f"too many operations (max {max_ops})")
+    filenames = []
+    for operation in patch:
+        if not isinstance(operation, dict):
+            raise PatchError('operations must be objects')
+        op = operation.get('op')
+        tokens = parse_pointer(operation.get('path'))
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise PatchError(f"{op} needs a value")
+        if op == 'test':
+            continue
+        value = operation.get('value')
+
+        if tokens[0] != 'tiers':
+            #top-level fields other than tiers (title, timestamp, ...)
+            if len(tokens) != 1 or op not in ('add', 'replace', 'remove'):
+                raise PatchError(f"{op} not allowed at {operation['path']}")
+        elif len(tokens) == 1:
+            raise PatchError('the tiers list cannot be replaced')
+        elif _is_position(tokens, 2):
+            if op == 'move':
+                if not _is_position(parse_pointer(operation.get('from')), 2):
+                    raise PatchError('tiers can only move between tier positions')
+            elif op in ('add', 'replace'):
+                _check_tier(value, filenames)
+            elif op != 'remove':
+                raise PatchError(f"{op} not allowed at {operation['path']}")
+        elif len(tokens) == 3 and tokens[2] == 'files':
+            if op != 'replace' or not isinstance(value, list):
+                raise PatchError('tier files can only be replaced with a list')
+            for entry in value:
+                _check_entry(entry, filenames)
+        elif len(tokens) == 3:
+            if op not in ('add', 'replace', 'remove'):
+                raise PatchError(f"{op} not allowed at {operation['path']}")
+            if op != 'remove' and ((tokens[2] == 'label' and not isinstance(value, str)) or isinstance(value, (dict, list))):
+                raise PatchError(f"invalid value for tier field {tokens[2]!r}")
+        elif _is_position(tokens, 4):
+            if op == 'move':
+                if not _is_position(parse_pointer(operation.get('from')), 4):
+                    raise PatchError('files can only move between file positions')
+            elif op in ('add', 'replace'):
+                _check_entry(value, filenames)
+            elif op != 'remove':
+                raise PatchError(f"{op} not allowed at {operation['path']}")
+        elif len(tokens) == 5 and tokens[2] == 'files' and tokens[4] in FILE_FIELDS:
+            if op not in ('add', 'replace') or isinstance(value, (dict, list)):
+                raise PatchError(f"invalid change to {tokens[4]!r}")
+        else:
+            raise PatchError(f"{op} not allowed at {operation['path']}")
+    return filenames
+
+
+def join_patches(patch_jsons):
+    """concatenate stored patches into one, without parsing them"""
+    bodies = [patch_json[1:-1] for patch_json in patch_jsons if patch_json != '[]']
+    return '[' + ','.join(bodies) + ']'
+
+
+class TierlistHistory:
+    """versioned tierlists stored as a chain of JSON patches
+
+    Version 1 and every ``snapshot_interval``-th version also keep the full
+    document. Head documents are cached per worker; a head that another
+    worker moved on is brought up to date with just the patches since.
+    Cached documents are never changed once handed out: new versions are
+    patched onto a copy that then replaces the cached one.
+    """
+
+    def __init__(self, store, snapshot_interval=50, cache_size=256, max_tiers=20, max_ops=1000):
+        self.store = store
+        self.snapshot_interval = snapshot_interval
+        self.cache_size = cache_size
+        self.max_tiers = max_tiers
+        self.max_ops = max_ops
+        self.heads = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, document):
+        document_id = secrets.token_urlsafe(DOCUMENT_ID_BYTES)
+        self.store.add_revision(document_id, 1, None, json.dumps(document, separators=(',', ':')))
+        self.remember(document_id, 1, document)
+        return document_id
+
+    def remember(self, document_id, version, document):
+        self.heads[document_id] = (version, document)
+        self.heads.move_to_end(document_id)
+        while len(self.heads) > self.cache_size:
+            self.heads.popitem(last=False)
+
+    def head(self, document_id):
+        """``(version, document)`` of the latest revision, or None
+
+        The returned document is the cached one and stays as it is while
+        other requests save new versions; callers must not change it.
+        """
+        with self.lock:
+            return self._head(document_id)
+
+    def _head(self, document_id):
+        version = self.store.head_version(document_id)
+        if version is None:
+            return None
+        cached = self.heads.get(document_id)
+        if cached is not None and cached[0] == version:
+            self.heads.move_to_end(document_id)
+            return cached
+        if cached is not None and cached[0] < version:
+            document = copy.deepcopy(cached[1])
+            patches = self.store.patches_since(document_id, cached[0])
+        else:
+            base_version, snapshot_json = self.store.latest_snapshot(document_id, version)
+            document = json.loads(snapshot_json)
+            patches = self.store.patches_since(document_id, base_version)
+        try:
+            for patch_version, patch_json in patches:
+                #another worker may have saved more since head_version
+                if patch_version > version:
+                    break
+                apply_patch(document, json.loads(patch_json))
+        except PatchError:
+            self.heads.pop(document_id, None)
+            raise
+        self.remember(document_id, version, document)
+        return version, document
+
+    def commit(self, document_id, base_version, patch):
+        """store a checked patch against base_version, returns the new version
+
+        Raises RevisionConflict if base_version is not the head and
+        PatchError if the patch does not apply; returns None for an
+        unknown document.
+        """
+        with self.lock:
+            head = self._head(document_id)
+            if head is None:
+                return None
+            version, document = head
+            if base_version != version:
+                raise RevisionConflict(version)
+            if not patch:
+                return version
+            document = copy.deepcopy(document)
+            apply_patch(document, patch)
+            if len(document.get('tiers', [])) > self.max_tiers:
+                raise PatchError(f"too many tiers (max {self.max_tiers})")
+            new_version = version + 1
+            snapshot = None
+            if new_version % self.snapshot_interval == 0:
+                snapshot = json.dumps(document, separators=(',', ':'))
+            if not self.store.add_revision(document_id, new_version, json.dumps(patch, separators=(',', ':')), snapshot):
+                #another worker stored this version first
+                self.heads.pop(document_id, None)
+                raise RevisionConflict(self.store.head_version(document_id))
+            self.remember(document_id, new_version, document)
+            return new_version
+
+    def changes(self, document_id, since):
+        """what a client at version ``since`` needs to reach the head
+
+        Returns ``(version, patch_json, None)`` when the joined patches are
+        smaller than the document, ``(version, None, document_json)``
+        otherwise, or None for an unknown document.
+        """
+        version = self.store.head_version(document_id)
+        if version is None:
+            return None
+        if since is not None and 0 < since <= version:
+            #only up to the version reported, whatever was saved meanwhile
+            patches = [
+                patch_json for patch_version, patch_json in self.store.patches_since(document_id, since)
+                if patch_version <= version
+            ]
+            patch_json = join_patches(patches)
+            #stored snapshots bound the size a diff is worth
+            if len(patch_json) < self.store.snapshot_size(document_id):
+                return version, patch_json, None
+        head = self.head(document_id)
+        if head is None:
+            return None
+        return head[0], None, json.dumps(head[1], separators=(',', ':'))
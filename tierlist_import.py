@@ -0,0 +1,170 @@
+import json
+import codecs
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+MEDIA_KEYS = ('files', 'images')  # new 'files' format and legacy 'images' format
+
+_decoder = json.JSONDecoder()
+
+
+class TierlistFormatError(ValueError):
+    """the document is valid JSON but not a tierlist"""
+
+
+class ImportTooLargeError(ValueError):
+    """the document is larger than the allowed import size"""
+
+    def __init__(self, max_bytes):
+        super().__init__(f"import larger than {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class StreamReader:
+    """incremental JSON reader over a binary stream
+
+    Only the container structure (objects/arrays) of the tierlist is walked
+    by hand; every leaf value is decoded with ``raw_decode`` from a buffer
+    that holds at most the value being read plus one chunk.
+    """
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """drop consumed text and append the next chunk, False at end of stream"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(CHUNK_SIZE)
+        if chunk:
+            self.bytes_read += len(chunk)
+            if self.bytes_read > self.max_bytes:
+                raise ImportTooLargeError(self.max_bytes)
+            text = self.text_decoder.decode(chunk)
+        else:
+            self.eof = True
+            text = self.text_decoder.decode(b'', final=True)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """next non-whitespace character without consuming it, '' at end"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """decode one complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            if end == len(self.buf) and self.fill():
+                continue  # a number may continue in the next chunk
+            self.pos = end
+            return value
+
+    def object_keys(self):
+        """yield the keys of an object; the caller consumes each value"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError('Expecting property name', self.buf, self.pos)
+            self.expect(':')
+            yield key
+            if self.peek() == '}':
+                self.pos += 1
+                return
+            self.expect(',')
+
+    def array_items(self):
+        """yield the index of each array element; the caller consumes it"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self.expect(',')
+
+
+def iter_tierlist_events(stream, max_bytes, max_tiers):
+    """parse a tierlist document incrementally, yielding events as it goes
+
+    Events are tuples:
+      ('field', key, value)               top-level key other than tiers
+      ('tier_start', index)
+      ('tier_field', index, key, value)   tier key other than files/images
+      ('item', index, key, file_data)     one media entry of a tier
+      ('tier_end', index)
+
+    Raises TierlistFormatError, ImportTooLargeError, json.JSONDecodeError or
+    UnicodeDecodeError, possibly after some events were already yielded.
+    """
+    reader = StreamReader(stream, max_bytes)
+    if reader.peek() != '{':
+        raise TierlistFormatError('missing tiers data')
+
+    seen_tiers = False
+    for key in reader.object_keys():
+        if key != 'tiers':
+            yield ('field', key, reader.value())
+            continue
+        if seen_tiers or reader.peek() != '[':
+            raise TierlistFormatError('invalid tiers structure')
+        seen_tiers = True
+        yield from _iter_tiers(reader, max_tiers)
+
+    if reader.peek() != '':
+        raise json.JSONDecodeError('Extra data', reader.buf, reader.pos)
+    if not seen_tiers:
+        raise TierlistFormatError('missing tiers data')
+
+
+def _iter_tiers(reader, max_tiers):
+    for index in reader.array_items():
+        if index >= max_tiers:
+            raise TierlistFormatError('invalid tiers structure')
+        if reader.peek() != '{':
+            reader.value()  # non-object tiers are ignored
+            continue
+
+        yield ('tier_start', index)
+        for key in reader.object_keys():
+            if key in MEDIA_KEYS and reader.peek() == '[':
+                for _ in reader.array_items():
+                    file_data = reader.value()
+                    if isinstance(file_data, dict):
+                        yield ('item', index, key, file_data)
+            else:
+                yield ('tier_field', index, key, reader.value())
+        yield ('tier_end', index)
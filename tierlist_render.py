@@ -0,0 +1,235 @@
+import os
+import json
+import hashlib
+import secrets
+import threading
+from thumbnails import ensure_derivative, get_pool
+
+RENDER_DIR = 'rendered'
+RENDER_FORMATS = {
+    'png': ('PNG', '.png', 'image/png'),
+    'webp': ('WEBP', '.webp', 'image/webp'),
+    'pdf': ('PDF', '.pdf', 'application/pdf'),
+}
+#bump when the drawing changes so older cached renders are not served
+RENDER_VERSION = 1
+
+CANVAS_WIDTH = 1200
+LABEL_WIDTH = 120
+TILE = 96
+GAP = 8
+HEADER_HEIGHT = 80
+#A4 proportions at the canvas width
+PAGE_HEIGHT = 1697
+WEBP_MAX_EDGE = 16383
+LABEL_COLOR = (51, 51, 51)
+TILE_BORDER = (204, 204, 204)
+
+
+def render_key(layout, fmt):
+    """content hash of what a render shows: labels, order and file contents
+
+    Uploads are identified by content digest, so the same list made from
+    re-uploaded files hits the same cache entry. Names only matter for
+    audio tiles, which show them.
+    """
+    canonical = {
+        'title': layout['title'],
+        'tiers': [
+            {
+                'label': tier['label'],
+                'items': [[item['key'], item['audio'], item['name'] if item['audio'] else ''] for item in tier['items']],
+            }
+            for tier in layout['tiers']
+        ],
+    }
+    payload = json.dumps([RENDER_VERSION, fmt, canonical], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_relpath(key, fmt):
+    """path of a cached render relative to the upload folder"""
+    return os.path.join(RENDER_DIR, key[:2], f"{key}{RENDER_FORMATS[fmt][1]}")
+
+
+def load_font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype('DejaVuSans-Bold.ttf', size)
+    except OSError:
+        #Pillow's bundled font, scalable when built with FreeType
+        return ImageFont.load_default(size=size)
+
+
+def fit_text(draw, text, font, width):
+    """text shortened with an ellipsis until it fits width"""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+def tier_heights(layout):
+    per_row = (CANVAS_WIDTH - LABEL_WIDTH - GAP) // (TILE + GAP)
+    rows = [max(1, -(-len(tier['items']) // per_row)) for tier in layout['tiers']]
+    return per_row, [count * (TILE + GAP) + GAP for count in rows]
+
+
+def page_breaks(bounds, page_height):
+    """page tops, starting pages at tier boundaries where possible"""
+    breaks = [0]
+    for top, bottom in bounds:
+        while bottom - breaks[-1] > page_height:
+            #a tier taller than a page is cut at the page edge
+            breaks.append(top if top > breaks[-1] else breaks[-1] + page_height)
+    return breaks
+
+
+def draw_tile(canvas, draw, upload_folder, item, x, y, small_font):
+    from PIL import Image
+
+    box = (x, y, x + TILE - 1, y + TILE - 1)
+    if not item['audio']:
+        try:
+            relpath = ensure_derivative(upload_folder, item['file'], item['key'], 'thumb', 'webp')
+            with Image.open(os.path.join(upload_folder, relpath)) as img:
+                img.thumbnail((TILE, TILE), Image.LANCZOS)
+                img = img.convert('RGBA')
+                left, top = x + (TILE - img.width) // 2, y + (TILE - img.height) // 2
+                canvas.paste(img, (left, top), img)
+                draw.rectangle((left - 1, top - 1, left + img.width, top + img.height), outline=TILE_BORDER)
+            return
+        except (OSError, ValueError):
+            #undecodable image: an empty tile keeps the layout
+            pass
+    draw.rectangle(box, fill=(243, 243, 243), outline=TILE_BORDER)
+    if item['audio']:
+        draw.text((x + TILE // 2, y + TILE // 2 - 10), 'AUDIO', fill=LABEL_COLOR, font=small_font, anchor='mm')
+        name = fit_text(draw, item['name'], small_font, TILE - 8)
+        draw.text((x + TILE // 2, y + TILE // 2 + 10), name, fill=LABEL_COLOR, font=small_font, anchor='mm')
+
+
+def compose(upload_folder, layout, dest_path, fmt):
+    """draw a tierlist from thumbnails into dest_path, written atomically
+
+    Runs in the derivative process pool; missing thumbnails are rendered on
+    the way and stay cached for the tiles in the browser.
+    """
+    from PIL import Image, ImageDraw
+
+    per_row, heights = tier_heights(layout)
+    height = HEADER_HEIGHT + sum(heights) + GAP * len(heights)
+    if fmt == 'webp' and height > WEBP_MAX_EDGE:
+        raise ValueError('tierlist is too long for a WebP image, use PNG or PDF')
+
+    canvas = Image.new('RGB', (CANVAS_WIDTH, height), (255, 255, 255))
+    draw = ImageDraw.Draw(canvas)
+    title_font = load_font(32)
+    label_font = load_font(36)
+    small_font = load_font(12)
+    title = fit_text(draw, layout['title'], title_font, CANVAS_WIDTH - 2 * GAP)
+    draw.text((CANVAS_WIDTH // 2, HEADER_HEIGHT // 2), title, fill=LABEL_COLOR, font=title_font, anchor='mm')
+    draw.line((GAP, HEADER_HEIGHT - 4, CANVAS_WIDTH - GAP, HEADER_HEIGHT - 4), fill=LABEL_COLOR, width=2)
+
+    y = HEADER_HEIGHT
+    bounds = []
+    for tier, tier_height in zip(layout['tiers'], heights):
+        draw.rectangle((0, y, CANVAS_WIDTH - 1, y + tier_height - 1), outline=LABEL_COLOR, width=2)
+        draw.rectangle((0, y, LABEL_WIDTH - 1, y + tier_height - 1), fill=LABEL_COLOR)
+        label = fit_text(draw, tier['label'], label_font, LABEL_WIDTH - 2 * GAP)
+        draw.text((LABEL_WIDTH // 2, y + min(tier_height, TILE + 2 * GAP) // 2), label, fill=(255, 255, 255), font=label_font, anchor='mm')
+        for index, item in enumerate(tier['items']):
+            x = LABEL_WIDTH + GAP + (index % per_row) * (TILE + GAP)
+            draw_tile(canvas, draw, upload_folder, item, x, y + GAP + (index // per_row) * (TILE + GAP), small_font)
+        bounds.append((y, y + tier_height + GAP))
+        y += tier_height + GAP
+
+    pil_format = RENDER_FORMATS[fmt][0]
+    os.makedirs(os.path.dirname(dest_path), mode=0o755, exist_ok=True)
+    tmp_path = f"{dest_path}.{secrets.token_hex(4)}.tmp"
+    try:
+        if fmt == 'pdf':
+            breaks = page_breaks(bounds, PAGE_HEIGHT) + [height]
+            pages = [canvas.crop((0, top, CANVAS_WIDTH, bottom)) for top, bottom in zip(breaks, breaks[1:]) if bottom > top]
+            pages[0].save(tmp_path, pil_format, save_all=True, append_images=pages[1:], resolution=150)
+        elif fmt == 'png':
+            canvas.save(tmp_path, pil_format, optimize=True)
+        else:
+            canvas.save(tmp_path, pil_format, quality=85)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return dest_path
+
+
+class TierlistRenderer:
+    """tierlist exports rendered in the background pool, cached on disk
+
+    A render is stored under its ``render_key``, so exporting a list that
+    was exported before (by anyone) is a stat and a file send. Requests in
+    one worker that miss on the same key wait on a single render.
+    """
+
+    def __init__(self, upload_folder, max_workers=2, timeout=20):
+        self.upload_folder = upload_folder
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+
+    def render(self, layout, fmt, prepare=None):
+        """``(key, relpath, cached)`` of the rendered file
+
+        ``prepare(layout)`` runs before a render, not on a cache hit. Raises
+        concurrent.futures.TimeoutError when preparing and rendering take
+        longer than ``timeout`` seconds; the render finishes into the cache
+        regardless.
+        """
+        key = render_key(layout, fmt)
+        relpath = render_relpath(key, fmt)
+        dest_path = os.path.join(self.upload_folder, relpath)
+        try:
+            #recently served renders survive the cache cleanup
+            os.utime(dest_path)
+            return key, relpath, True
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            executor = self._executor()
+            future = self.pending.get(key)
+            started = future is None
+            if started:
+                future = executor.submit(self._render, layout, dest_path, fmt, prepare)
+                self.pending[key] = future
+        if started:
+            future.add_done_callback(lambda _: self._finished(key))
+        future.result(timeout=self.timeout)
+        return key, relpath, False
+
+    def _executor(self):
+        #threads that fetch sources and wait on the process pool, so the
+        #request's timeout covers both; recreated in forked workers
+        if self.pid != os.getpid():
+            from concurrent.futures import ThreadPoolExecutor
+
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='render')
+            self.pending = {}
+            self.pid = os.getpid()
+        return self.executor
+
+    def _render(self, layout, dest_path, fmt, prepare):
+        if prepare is not None:
+            prepare(layout)
+        return get_pool(self.max_workers).submit(compose, self.upload_folder, layout, dest_path, fmt).result()
+
+    def _finished(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
@@ -0,0 +1,227 @@
+import os
+import time
+import base64
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+ID_LENGTH = 10
+
+
+def tierlist_id(document_json, length=ID_LENGTH):
+    """short url-safe id derived from the canonical document"""
+    digest = hashlib.sha256(document_json.encode('utf-8')).digest()
+    return base64.urlsafe_b64encode(digest).decode('ascii').rstrip('=')[:length]
+
+
+class TierlistRecord:
+    """a stored tierlist with its precomputed /t/<id> response body"""
+
+    def __init__(self, tierlist_id, document, response, etag, created_at):
+        self.id = tierlist_id
+        self.document = document
+        self.response = response
+        self.etag = etag
+        self.created_at = created_at
+
+
+class TierlistStore(ABC):
+    """storage backend interface for shared tierlists
+
+    ``save`` is idempotent: the same canonical document always gets the same
+    id, so re-sharing an unchanged list writes nothing.
+    """
+
+    @abstractmethod
+    def save(self, document_json, response_json):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, tierlist_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_documents(self):
+        """yield (id, document_json) for every stored tierlist
+
+        Revisions of versioned tierlists are included, each snapshot and
+        patch as a document of its own.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_shared(self):
+        """yield (id, document_json) for every shared tierlist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_versioned_ids(self):
+        """yield the id of every versioned tierlist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_revision(self, document_id, version, patch_json, snapshot_json=None):
+        """store one revision of a versioned tierlist, False if it exists"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def head_version(self, document_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def latest_snapshot(self, document_id, version):
+        """``(version, snapshot_json)`` of the newest snapshot up to version"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def patches_since(self, document_id, version):
+        """``[(version, patch_json), ...]`` of the revisions after version"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def snapshot_size(self, document_id):
+        raise NotImplementedError
+
+
+class SQLiteTierlistStore(TierlistStore):
+    """tierlists in a single SQLite file, one connection per thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o755, exist_ok=True)
+        with self.connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tierlists ('
+                ' id TEXT PRIMARY KEY,'
+                ' document TEXT NOT NULL,'
+                ' response TEXT NOT NULL,'
+                ' etag TEXT NOT NULL,'
+                ' created_at INTEGER NOT NULL)'
+            )
+            #versioned tierlists: a patch per revision, snapshots now and then
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tierlist_revisions ('
+                ' id TEXT NOT NULL,'
+                ' version INTEGER NOT NULL,'
+                ' patch TEXT,'
+                ' snapshot TEXT,'
+                ' created_at INTEGER NOT NULL,'
+                ' PRIMARY KEY (id, version))'
+            )
+
+    def connection(self):
+        #connections must not cross a fork (gunicorn preload)
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def save(self, document_json, response_json):
+        etag = hashlib.sha256(response_json.encode('utf-8')).hexdigest()
+        conn = self.connection()
+        #lengthen the id in the (unlikely) case of a prefix collision
+        for length in range(ID_LENGTH, 44):
+            new_id = tierlist_id(document_json, length)
+            with conn:
+                conn.execute(
+                    'INSERT OR IGNORE INTO tierlists (id, document, response, etag, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (new_id, document_json, response_json, etag, int(time.time()))
+                )
+                row = conn.execute('SELECT document FROM tierlists WHERE id = ?', (new_id,)).fetchone()
+            if row[0] == document_json:
+                return new_id
+        raise RuntimeError('could not allocate a tierlist id')
+
+    def get(self, tierlist_id):
+        row = self.connection().execute(
+            'SELECT id, document, response, etag, created_at FROM tierlists WHERE id = ?',
+            (tierlist_id,)
+        ).fetchone()
+        return TierlistRecord(*row) if row else None
+
+    def iter_documents(self):
+        cursor = self.connection().execute(
+            'SELECT id, document FROM tierlists'
+            ' UNION ALL SELECT id, patch FROM tierlist_revisions WHERE patch IS NOT NULL'
+            ' UNION ALL SELECT id, snapshot FROM tierlist_revisions WHERE snapshot IS NOT NULL'
+        )
+        yield from cursor
+
+    def iter_shared(self):
+        yield from self.connection().execute('SELECT id, document FROM tierlists')
+
+    def iter_versioned_ids(self):
+        for row in self.connection().execute('SELECT DISTINCT id FROM tierlist_revisions'):
+            yield row[0]
+
+    def add_revision(self, document_id, version, patch_json, snapshot_json=None):
+        conn = self.connection()
+        try:
+            with conn:
+                #the primary key makes concurrent saves of one version fail
+                conn.execute(
+                    'INSERT INTO tierlist_revisions (id, version, patch, snapshot, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (document_id, version, patch_json, snapshot_json, int(time.time()))
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def head_version(self, document_id):
+        row = self.connection().execute(
+            'SELECT MAX(version) FROM tierlist_revisions WHERE id = ?', (document_id,)
+        ).fetchone()
+        return row[0]
+
+    def latest_snapshot(self, document_id, version):
+        return self.connection().execute(
+            'SELECT version, snapshot FROM tierlist_revisions'
+            ' WHERE id = ? AND version <= ? AND snapshot IS NOT NULL ORDER BY version DESC LIMIT 1',
+            (document_id, version)
+        ).fetchone()
+
+    def patches_since(self, document_id, version):
+        return self.connection().execute(
+            'SELECT version, patch FROM tierlist_revisions WHERE id = ? AND version > ? ORDER BY version',
+            (document_id, version)
+        ).fetchall()
+
+    def snapshot_size(self, document_id):
+        row = self.connection().execute(
+            'SELECT LENGTH(snapshot) FROM tierlist_revisions'
+            ' WHERE id = ? AND snapshot IS NOT NULL ORDER BY version DESC LIMIT 1',
+            (document_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+
+def sqlite_store_from_url(url):
+    #sqlite:///relative.db and sqlite:////absolute/path.db, as in SQLAlchemy
+    return SQLiteTierlistStore(url.path[1:])
+
+
+BACKENDS = {
+    'sqlite': sqlite_store_from_url,
+}
+
+
+def register_backend(scheme, factory):
+    """make another storage backend available under a URL scheme"""
+    BACKENDS[scheme] = factory
+
+
+def create_tierlist_store(store_url):
+    """create the backend for a URL like ``sqlite:///data/tierlists.db``"""
+    url = urlparse(store_url)
+    if url.scheme not in BACKENDS:
+        raise ValueError(f"Unsupported tierlist store: {url.scheme}")
+    return BACKENDS[url.scheme](url)
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Upload garbage collector
+
+Upload names are referenced by shared tierlists (the tierlist store) and,
+for lists that only live in browsers or exported files, by recent activity:
+uploading, re-uploading or importing a file refreshes the mtime of its name
+link. A name that no stored tierlist mentions and that has not been touched
+within the grace period is an orphan. Only links into the blob tree and
+legacy media files count as names; dotfiles and anything else an operator
+keeps in the folder are never touched. A blob that no remaining name links
+to (including blobs committed for uploads that were then rejected) is
+collected once it is older than the grace period too, together with its
+derivatives. With remote media storage the upload folder is only this
+node's cache: a sweep drops stale local copies, while the names stay in the
+bucket and in the upload index.
+
+Sweeps run in a background thread (``UPLOAD_GC_INTERVAL``), at most one at a
+time across workers, and pace their filesystem operations. Run this file
+for a one-off sweep; ``--dry-run`` only reports what would be removed.
+
+Usage: python upload_gc.py [--dry-run] [--grace-days N] [--json]
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import random
+import logging
+import threading
+from thumbnails import DERIVED_DIR, is_image_file
+from audio import is_audio_file
+from tierlist_render import RENDER_DIR
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'gc.lock'
+TMP_DIR = 'tmp'
+REPORT_SAMPLE = 100
+#directory entries read per throttle tick while scanning
+SCAN_BATCH = 500
+
+
+class Throttle:
+    """pace filesystem operations to at most ``rate`` per second"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    def tick(self):
+        self.count += 1
+        if self.rate <= 0:
+            return
+        ahead = self.count / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class UsageRecorder:
+    """marks upload names as in use from a background thread
+
+    ``mark`` only queues names. The thread refreshes their name links'
+    mtime, which the sweep compares with the grace period, and each worker
+    skips names it marked within ``refresh_interval``, so a list in steady
+    use costs one utime per upload per interval instead of one per request.
+    """
+
+    def __init__(self, store, refresh_interval=86400):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.marked = {}
+        self.pending = set()
+        self.condition = threading.Condition()
+        self.pid = None
+
+    def mark(self, filenames):
+        now = time.monotonic()
+        with self.condition:
+            if self.pid != os.getpid():
+                #first use in this process (gunicorn forks after preload)
+                self.pid = os.getpid()
+                self.marked = {}
+                self.pending = set()
+                threading.Thread(target=self._run, name='upload-usage', daemon=True).start()
+            fresh = [name for name in filenames if now - self.marked.get(name, -self.refresh_interval) >= self.refresh_interval]
+            if not fresh:
+                return
+            for name in fresh:
+                self.marked[name] = now
+            self.pending.update(fresh)
+            self.condition.notify()
+
+    def _run(self):
+        pruned_at = time.monotonic()
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                batch, self.pending = self.pending, set()
+                now = time.monotonic()
+                if now - pruned_at > self.refresh_interval:
+                    self.marked = {name: at for name, at in self.marked.items() if now - at < self.refresh_interval}
+                    pruned_at = now
+            try:
+                self.store.touch(batch)
+            except OSError as e:
+                logger.warning(f"Upload usage could not be recorded: {str(e)}")
+
+
+def collect_filenames(node, names):
+    """every ``filename`` string anywhere in a tierlist document"""
+    if isinstance(node, dict):
+        filename = node.get('filename')
+        if isinstance(filename, str):
+            names.add(filename)
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                collect_filenames(value, names)
+    elif isinstance(node, list):
+        for value in node:
+            collect_filenames(value, names)
+    return names
+
+
+def referenced_filenames(tierlist_store):
+    """upload names used by any stored tierlist"""
+    names = set()
+    for tierlist_id, document_json in tierlist_store.iter_documents():
+        try:
+            collect_filenames(json.loads(document_json), names)
+        except ValueError:
+            logger.warning(f"Upload GC skipped unreadable tierlist {tierlist_id}")
+    return names
+
+
+class UploadCollector:
+    """finds and removes unreferenced upload names, blobs and derivatives"""
+
+    def __init__(self, store, tierlist_store, upload_index=None, grace_period=30 * 86400,
+                 tmp_grace_period=86400, render_cache_period=7 * 86400, ops_per_second=50, remote_media=False):
+        self.store = store
+        self.tierlist_store = tierlist_store
+        self.upload_index = upload_index
+        self.remote_media = remote_media
+        self.grace_period = grace_period
+        self.tmp_grace_period = tmp_grace_period
+        self.render_cache_period = render_cache_period
+        self.ops_per_second = ops_per_second
+        self.lock_path = os.path.join(store.blob_root, LOCK_NAME)
+        self.thread = None
+        self.interval = None
+        self.dry_run = False
+
+    def sweep(self, dry_run=False, min_interval=0):
+        """run one sweep unless another process is running one
+
+        With ``min_interval`` the sweep is also skipped when any process
+        finished one less than that many seconds ago. Returns the report,
+        or None when skipped.
+        """
+        os.makedirs(self.store.blob_root, mode=0o755, exist_ok=True)
+        with open(self.lock_path, 'a+') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            try:
+                if min_interval and time.time() - os.fstat(lock.fileno()).st_mtime < min_interval:
+                    return None
+                report = self.collect(dry_run)
+                if not dry_run:
+                    os.utime(self.lock_path)
+                return report
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def collect(self, dry_run=False):
+        started = time.monotonic()
+        now = time.time()
+        throttle = Throttle(self.ops_per_second)
+        report = {
+            'dry_run': dry_run,
+            'names_scanned': 0,
+            'names_referenced': 0,
+            'names_recent': 0,
+            'orphan_names': [],
+            'names_removed': 0,
+            'blobs_scanned': 0,
+            'orphan_blobs': 0,
+            'blobs_removed': 0,
+            'derivatives_removed': 0,
+            'tmp_removed': 0,
+            'renders_removed': 0,
+            'bytes_freed': 0,
+        }
+
+        referenced = referenced_filenames(self.tierlist_store)
+        live_blobs = set()
+        orphans = []
+        for entry in self.scan_dir(self.store.root, throttle):
+            if entry.name.endswith('.tmp') or entry.is_dir(follow_symlinks=False):
+                continue
+            target = self.link_target(entry)
+            if not self.is_upload(entry, target):
+                continue
+            report['names_scanned'] += 1
+            if entry.name in referenced:
+                report['names_referenced'] += 1
+            elif now - entry.stat(follow_symlinks=False).st_mtime < self.grace_period:
+                report['names_recent'] += 1
+            else:
+                orphans.append((entry, target))
+                continue
+            if target:
+                live_blobs.add(target)
+
+        for entry, target in orphans:
+            if len(report['orphan_names']) < REPORT_SAMPLE:
+                report['orphan_names'].append(entry.name)
+            if dry_run:
+                continue
+            throttle.tick()
+            if self.remove_name(entry, now):
+                report['names_removed'] += 1
+                if not target:
+                    #legacy upload: the file is the content, derivatives are keyed by name
+                    report['derivatives_removed'] += self.remove_derivatives(entry.name, throttle)
+            elif target:
+                #touched since the scan, keep its blob
+                live_blobs.add(target)
+        report['orphan_name_count'] = len(orphans)
+
+        for path, st in self.scan_blobs(throttle):
+            report['blobs_scanned'] += 1
+            if path in live_blobs or now - st.st_mtime < self.grace_period:
+                continue
+            report['orphan_blobs'] += 1
+            if dry_run:
+                report['bytes_freed'] += st.st_size
+                continue
+            throttle.tick()
+            if self.remove_blob(path, now):
+                report['blobs_removed'] += 1
+                report['bytes_freed'] += st.st_size
+                digest = os.path.splitext(os.path.basename(path))[0]
+                report['derivatives_removed'] += self.remove_derivatives(digest, throttle)
+
+        tmp_dir = os.path.join(self.store.blob_root, TMP_DIR)
+        for entry in self.scan_dir(tmp_dir, throttle):
+            #writers that crashed before commit or abort
+            if entry.is_file(follow_symlinks=False) and now - entry.stat().st_mtime > self.tmp_grace_period:
+                if not dry_run:
+                    throttle.tick()
+                    self.unlink(entry.path)
+                report['tmp_removed'] += 1
+
+        #cached tierlist renders are touched whenever they are served
+        for shard in self.scan_dir(os.path.join(self.store.root, RENDER_DIR), throttle):
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for entry in self.scan_dir(shard.path, throttle):
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if now - st.st_mtime < self.render_cache_period:
+                    continue
+                if not dry_run:
+                    throttle.tick()
+                    if not self.unlink(entry.path):
+                        continue
+                report['renders_removed'] += 1
+                report['bytes_freed'] += st.st_size
+
+        report['seconds'] = round(time.monotonic() - started, 3)
+        return report
+
+    def scan_dir(self, path, throttle):
+        try:
+            with os.scandir(path) as entries:
+                for count, entry in enumerate(entries, 1):
+                    if count % SCAN_BATCH == 0:
+                        throttle.tick()
+                    yield entry
+        except FileNotFoundError:
+            return
+
+    def scan_blobs(self, throttle):
+        """(path, stat) of every blob in the sharded tree"""
+        for shard in self.scan_dir(self.store.blob_root, throttle):
+            if len(shard.name) != 2 or not shard.is_dir(follow_symlinks=False):
+                continue
+            for subshard in self.scan_dir(shard.path, throttle):
+                if not subshard.is_dir(follow_symlinks=False):
+                    continue
+                for entry in self.scan_dir(subshard.path, throttle):
+                    if entry.is_file(follow_symlinks=False):
+                        yield entry.path, entry.stat(follow_symlinks=False)
+
+    def link_target(self, entry):
+        """absolute blob path a name links to, None for legacy files"""
+        if not entry.is_symlink():
+            return None
+        return os.path.normpath(os.path.join(self.store.root, os.readlink(entry.path)))
+
+    def is_upload(self, entry, target):
+        """a link into the blob tree or a legacy media file; dotfiles and other files are left alone"""
+        if entry.name.startswith('.'):
+            return False
+        if entry.is_symlink():
+            blob_root = os.path.normpath(self.store.blob_root)
+            return target is not None and os.path.commonpath([blob_root, target]) == blob_root
+        return entry.is_file(follow_symlinks=False) and (is_image_file(entry.name) or is_audio_file(entry.name))
+
+    def remove_name(self, entry, now):
+        #re-check: an upload or import may have touched it since the scan
+        try:
+            if now - os.lstat(entry.path).st_mtime < self.grace_period:
+                return False
+        except FileNotFoundError:
+            return False
+        if not self.unlink(entry.path):
+            return False
+        #a remote upload outlives this node's copy, other nodes still resolve it
+        if self.upload_index is not None and not self.remote_media:
+            self.upload_index.discard(entry.name)
+        return True
+
+    def remove_blob(self, path, now):
+        #dedup re-uploads touch the blob before linking to it
+        try:
+            if now - os.stat(path).st_mtime < self.grace_period:
+                return False
+        except FileNotFoundError:
+            return False
+        return self.unlink(path)
+
+    def remove_derivatives(self, key, throttle):
+        removed = 0
+        shard = os.path.join(self.store.root, DERIVED_DIR, key[:2])
+        prefix = f"{key}_"
+        for entry in self.scan_dir(shard, throttle):
+            if entry.name.startswith(prefix):
+                throttle.tick()
+                removed += self.unlink(entry.path)
+        return removed
+
+    def unlink(self, path):
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def start_background(self, interval, dry_run=False):
+        """sweep every ``interval`` seconds in a daemon thread of each process
+
+        The lock file keeps it to one sweep per interval across workers; the
+        thread is restarted in forked workers (gunicorn preload).
+        """
+        self.interval = interval
+        self.dry_run = dry_run
+        self._start_thread()
+        os.register_at_fork(after_in_child=self._start_thread)
+
+    def _start_thread(self):
+        self.thread = threading.Thread(target=self._run, name='upload-gc', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            #spread workers out so they do not all contend for the lock
+            time.sleep(self.interval * random.uniform(0.5, 1.0))
+            try:
+                report = self.sweep(self.dry_run, min_interval=self.interval)
+            except Exception as e:
+                logger.error(f"Upload GC sweep failed: {str(e)}")
+                continue
+            if report is not None:
+                report.pop('orphan_names')
+                logger.info(f"Upload GC sweep: {json.dumps(report)}")
+
+
+def format_report(report):
+    lines = [
+        f"{'Would remove' if report['dry_run'] else 'Removed'}: "
+        f"{report['orphan_name_count'] if report['dry_run'] else report['names_removed']} names, "
+        f"{report['orphan_blobs'] if report['dry_run'] else report['blobs_removed']} blobs, "
+        f"{report['tmp_removed']} temp files, {report['renders_removed']} cached renders, "
+        f"{report['bytes_freed'] / 1048576:.1f} MB",
+        f"Scanned {report['names_scanned']} names ({report['names_referenced']} in shared tierlists, "
+        f"{report['names_recent']} within the grace period) and {report['blobs_scanned']} blobs "
+        f"in {report['seconds']}s",
+    ]
+    if report['dry_run']:
+        lines.extend(f"  {name}" for name in report['orphan_names'])
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+    from config import config
+    from storage import ContentStore
+    from upload_index import UploadIndex
+    from object_storage import create_storage_backend
+    from tierlist_store import create_tierlist_store
+
+    settings = config[os.environ.get('FLASK_ENV', 'development')]
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='report orphans without deleting anything')
+    parser.add_argument('--grace-days', type=float, default=settings.UPLOAD_GC_GRACE_DAYS)
+    parser.add_argument('--ops-per-second', type=int, default=settings.UPLOAD_GC_OPS_PER_SECOND)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    backend = create_storage_backend(
+        settings.MEDIA_STORAGE_URL, settings.UPLOAD_FOLDER, settings.SECRET_KEY,
+        access_key=settings.MEDIA_STORAGE_ACCESS_KEY, secret_key=settings.MEDIA_STORAGE_SECRET_KEY
+    )
+    collector = UploadCollector(
+        ContentStore(settings.UPLOAD_FOLDER),
+        create_tierlist_store(settings.TIERLIST_STORE_URL),
+        upload_index=UploadIndex(settings.UPLOAD_FOLDER, redis_url=settings.UPLOAD_INDEX_REDIS_URL),
+        grace_period=args.grace_days * 86400,
+        render_cache_period=settings.RENDER_CACHE_DAYS * 86400,
+        ops_per_second=args.ops_per_second,
+        remote_media=backend.remote
+    )
+    report = collector.sweep(dry_run=args.dry_run)
+    if report is None:
+        print('Another sweep is running', file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY = 'tierlist:uploads'
+SADD_BATCH = 1000
+
+
+class UploadIndex:
+    """set of known upload filenames for batch existence checks
+
+    Built from a single ``os.scandir`` of the upload folder instead of one
+    stat per lookup. With a Redis URL the set is shared by all gunicorn
+    workers (one SMISMEMBER per batch); otherwise each worker keeps a local
+    set, confirms misses on disk and rescans once it is older than
+    ``refresh_interval`` seconds.
+    """
+
+    def __init__(self, root, redis_url=None, refresh_interval=60):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.names = set()
+        self.built_at = 0
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=2)
+
+    def scan(self):
+        """list upload names in the folder without stat'ing each entry"""
+        names = set()
+        try:
+            with os.scandir(self.root) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    #symlinks point at content-addressed blobs
+                    if entry.is_symlink() or entry.is_file(follow_symlinks=False):
+                        names.add(entry.name)
+        except FileNotFoundError:
+            pass
+        return names
+
+    def build(self):
+        """rebuild the local set (and seed the shared one) from disk"""
+        self.names = self.scan()
+        self.built_at = time.monotonic()
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                batch = list(self.names)
+                for i in range(0, len(batch), SADD_BATCH):
+                    pipe.sadd(REDIS_KEY, *batch[i:i + SADD_BATCH])
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Upload index could not seed Redis: {str(e)}")
+        return len(self.names)
+
+    def add(self, filename):
+        """record a new upload"""
+        self.names.add(filename)
+        if self.redis is not None:
+            try:
+                self.redis.sadd(REDIS_KEY, filename)
+            except Exception as e:
+                logger.warning(f"Upload index could not add {filename} to Redis: {str(e)}")
+
+    def discard(self, filename):
+        """forget a deleted upload"""
+        self.names.discard(filename)
+        if self.redis is not None:
+            try:
+                self.redis.srem(REDIS_KEY, filename)
+            except Exception as e:
+                logger.warning(f"Upload index could not remove {filename} from Redis: {str(e)}")
+
+    def contains_many(self, filenames):
+        """return the subset of filenames that exist, in one batch"""
+        filenames = list(dict.fromkeys(filenames))
+        if not filenames:
+            return set()
+
+        if self.redis is not None:
+            try:
+                flags = self.redis.smismember(REDIS_KEY, filenames)
+                return {name for name, flag in zip(filenames, flags) if flag}
+            except Exception as e:
+                logger.warning(f"Upload index Redis lookup failed, using local index: {str(e)}")
+
+        if time.monotonic() - self.built_at > self.refresh_interval:
+            self.names = self.scan()
+            self.built_at = time.monotonic()
+
+        present = {name for name in filenames if name in self.names}
+        #uploads from other workers since the last scan
+        for name in filenames:
+            if name not in present and os.path.isfile(os.path.join(self.root, name)):
+                self.names.add(name)
+                present.add(name)
+        return present
+
+    def __contains__(self, filename):
+        return filename in self.contains_many([filename])
@@ -0,0 +1,201 @@
+from itertools import chain
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 16
+
+#formats each allowed extension may actually contain
+EXTENSION_FORMATS = {
+    'png': {'png'},
+    'jpg': {'jpeg'},
+    'jpeg': {'jpeg'},
+    'gif': {'gif'},
+    'mp3': {'mp3'},
+    'wav': {'wav'},
+    'ogg': {'ogg'},
+    'm4a': {'mp4'},
+    'aac': {'aac', 'mp4'},
+}
+
+
+class UploadRejected(Exception):
+    """an upload request refused as a whole"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def sniff_media_type(head):
+    """media format from the first bytes of a file, or None"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head.startswith(b'OggS'):
+        return 'ogg'
+    if head[4:8] == b'ftyp':
+        return 'mp4'
+    if head.startswith(b'ID3'):
+        return 'mp3'
+    if len(head) >= 2 and head[0] == 0xFF:
+        #ADTS (aac) sets layer bits 00, MPEG audio frames (mp3) do not
+        if head[1] & 0xF6 == 0xF0:
+            return 'aac'
+        if head[1] & 0xE0 == 0xE0:
+            return 'mp3'
+    if head.startswith(b'ADIF'):
+        return 'aac'
+    return None
+
+
+def signature_matches(filename, head):
+    """whether a file's first bytes fit the type its extension claims"""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    return sniff_media_type(head) in EXTENSION_FORMATS.get(ext, ())
+
+
+class FilePart:
+    """one incoming file: sniffed from its first bytes, then streamed to a store
+
+    Nothing touches the disk until the first SNIFF_BYTES bytes have passed
+    the signature check.
+    """
+
+    def __init__(self, store, filename):
+        self.store = store
+        self.filename = filename
+        self.head = b''
+        self.writer = None
+
+    def start(self):
+        if not signature_matches(self.filename, self.head):
+            return False
+        self.writer = self.store.writer(self.filename)
+        self.writer.write(self.head)
+        return True
+
+    def feed(self, data):
+        """take the next chunk; False once the content is known to be wrong"""
+        if self.writer is not None:
+            self.writer.write(data)
+            return True
+        self.head += data
+        return len(self.head) < SNIFF_BYTES or self.start()
+
+    def finish(self):
+        """commit the blob (not yet linked) and return its writer, or None"""
+        if self.writer is None and not self.start():
+            return None
+        self.writer.commit(link=False)
+        return self.writer
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+
+
+def content_mismatch(filename):
+    return f"File content does not match its type: {filename}"
+
+
+def ingest_stream(stream, filename, store):
+    """check and store a single raw stream, returning the committed writer"""
+    part = FilePart(store, filename)
+    try:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            if not part.feed(chunk):
+                raise UploadRejected(content_mismatch(filename))
+        writer = part.finish()
+    except BaseException:
+        part.abort()
+        raise
+    if writer is None:
+        raise UploadRejected(content_mismatch(filename))
+    return writer
+
+
+def discard_all(writers):
+    for writer in writers:
+        writer.discard()
+
+
+def ingest_multipart(stream, content_type, store, field_name, max_files, max_total_bytes, validate_filename):
+    """parse a multipart body in one pass, storing files as they stream in
+
+    Each file is checked by name as soon as its headers arrive and by its
+    magic bytes as soon as its first bytes do; rejected files are skipped
+    without being written. Once the files together exceed
+    ``max_total_bytes`` the rest of the body is not read.
+
+    Returns ``(writers, errors)``. Writers are committed blobs whose upload
+    names are not linked yet. When the request is refused part way (too
+    many files, a malformed body), the blobs it added are removed again.
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise UploadRejected('No files uploaded')
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=4 * CHUNK_SIZE, max_parts=max_files + 16)
+    writers = []
+    errors = []
+    total_size = 0
+    files_seen = 0
+    part = None
+    try:
+        for chunk in chain(iter(lambda: stream.read(CHUNK_SIZE), b''), [None]):
+            decoder.receive_data(chunk)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    part = None
+                    if event.name == field_name and event.filename:
+                        files_seen += 1
+                        if files_seen > max_files:
+                            raise UploadRejected(f'Too many files. Maximum {max_files} allowed per request')
+                        is_valid, message = validate_filename(event.filename)
+                        if is_valid:
+                            part = FilePart(store, event.filename)
+                        else:
+                            errors.append(message)
+                elif isinstance(event, Field):
+                    part = None
+                elif isinstance(event, Data) and part is not None:
+                    total_size += len(event.data)
+                    if total_size > max_total_bytes:
+                        part.abort()
+                        errors.append('Total upload size too large')
+                        return writers, errors
+                    if not part.feed(event.data):
+                        errors.append(content_mismatch(part.filename))
+                        part = None
+                    elif not event.more_data:
+                        writer = part.finish()
+                        if writer is None:
+                            errors.append(content_mismatch(part.filename))
+                        else:
+                            writers.append(writer)
+                        part = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue):
+                break
+    except ValueError:
+        if part is not None:
+            part.abort()
+        discard_all(writers)
+        raise UploadRejected('Malformed upload request')
+    except BaseException:
+        if part is not None:
+            part.abort()
+        discard_all(writers)
+        raise
+    if files_seen == 0:
+        raise UploadRejected('No files uploaded')
+    return writers, errors
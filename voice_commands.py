@@ -0,0 +1,289 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+import urllib.request
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+#"move the cat photo to s tier", "put cat in the a tier", "cat should go to b"
+COMMAND_GRAMMAR = re.compile(
+    r'^(?:(?:please|now|lets|let us|ok|okay)\s+)*'
+    r'(?:'
+    r'(?:move|put|place|drag|send|drop|throw|rank|stick)\s+(?P<item>.+?)\s+'
+    r'(?:to|in|into|onto|on|at)\s+(?:the\s+)?(?:tier\s+(?P<tier_pre>\S+)|(?P<tier>\S+)(?:\s+tier)?)'
+    r'|'
+    r'(?P<item2>.+?)\s+(?:goes|go|should go|belongs|should be|is)\s+'
+    r'(?:to|in|into|on)?\s*(?:the\s+)?(?:tier\s+(?P<tier2_pre>\S+)|(?P<tier2>\S+)(?:\s+tier)?)'
+    r')$'
+)
+
+#what speech recognition makes of single letter tier names
+TIER_HOMOPHONES = {
+    'es': 's', 'ess': 's', 'is': 's',
+    'ay': 'a', 'eh': 'a',
+    'be': 'b', 'bee': 'b',
+    'see': 'c', 'sea': 'c', 'si': 'c',
+    'dee': 'd', 'de': 'd',
+    'ee': 'e',
+    'ef': 'f', 'eff': 'f',
+}
+
+FILE_EXTENSION = re.compile(r'\.[A-Za-z0-9]{2,4}$')
+ARTICLES = re.compile(r'^(?:the|a|an|my|that|this)\s+')
+MATCH_THRESHOLD = 0.35
+
+PROMPT = """You are a voice command parser for a tier list application. Parse the following voice command and extract the item name and target tier.
+
+Available tier labels: {tiers}
+Available items: {items}
+
+Voice command: "{transcript}"
+
+Respond with a JSON object in this exact format:
+{{"action": "move", "itemName": "one of the available items", "targetTier": "exact tier label from available tiers"}}
+
+If the command is not clearly asking to move an item to a tier, respond with: {{"action": "unknown"}}"""
+
+
+def normalize_transcript(text):
+    """lowercase, drop punctuation and collapse whitespace"""
+    text = re.sub(r"[^\w+-]|_", ' ', text.lower().replace("'", ''))
+    return ' '.join(text.split())
+
+
+def normalize_name(name):
+    """item names are mostly filenames: drop the extension, then normalize"""
+    return normalize_transcript(FILE_EXTENSION.sub('', name.strip()))
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ItemIndex:
+    """trigram index over the names of a tierlist's items
+
+    Every item can be known by several names (recognition label first, then
+    original filename); earlier names win ties so recognition labels keep
+    priority, as in the client's old matcher.
+    """
+
+    def __init__(self, items):
+        self.ids = []
+        self.names = []
+        self.exact = {}
+        self.postings = {}
+        for item in items:
+            for rank, name in enumerate(item['names']):
+                name = normalize_name(name)
+                if not name:
+                    continue
+                position = len(self.names)
+                self.ids.append(item['id'])
+                self.names.append((name, rank, len(trigrams(name))))
+                self.exact.setdefault(name, item['id'])
+                for gram in trigrams(name):
+                    self.postings.setdefault(gram, []).append(position)
+
+    def match(self, query):
+        """best (item_id, name, score) for a spoken item name, or None"""
+        query = ARTICLES.sub('', normalize_name(query))
+        if not query:
+            return None
+        if query in self.exact:
+            return self.exact[query], query, 1.0
+
+        query_grams = trigrams(query)
+        overlap = Counter()
+        for gram in query_grams:
+            overlap.update(self.postings.get(gram, ()))
+
+        best = None
+        for position, shared in overlap.items():
+            name, rank, size = self.names[position]
+            score = shared / (len(query_grams) + size - shared)
+            if query in name.split() or name in query.split():
+                score = max(score, 0.6)
+            key = (score, -rank)
+            if best is None or key > best[0]:
+                best = (key, position)
+        if best is None or best[0][0] < MATCH_THRESHOLD:
+            return None
+        position = best[1]
+        return self.ids[position], self.names[position][0], best[0][0]
+
+
+class LRU:
+    """small thread-safe least recently used mapping"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                return None
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+
+class CommandParser:
+    """transcript -> move command, cheapest strategy first
+
+    1. the compiled grammar plus the trigram item index (microseconds)
+    2. memoized earlier answers for the same transcript and tierlist
+    3. the completion endpoint, whose answer is resolved through the index
+
+    Indexes are built once per distinct item set and kept in an LRU. The
+    completion calls of a batch run concurrently and share one deadline.
+    """
+
+    def __init__(self, api_url, model=None, timeout=10, cache_size=2048, index_cache_size=64,
+                 concurrency=4, batch_timeout=20):
+        self.api_url = api_url
+        self.model = model
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.batch_timeout = batch_timeout
+        self.results = LRU(cache_size)
+        self.indexes = LRU(index_cache_size)
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+
+    def index_for(self, items):
+        fingerprint = hashlib.sha256(json.dumps(items, sort_keys=True).encode('utf-8')).hexdigest()
+        index = self.indexes.get(fingerprint)
+        if index is None:
+            index = ItemIndex(items)
+            self.indexes.put(fingerprint, index)
+        return fingerprint, index
+
+    def parse_many(self, transcripts, tiers, items):
+        """commands in transcript order
+
+        Transcripts still waiting on the completion endpoint after
+        ``batch_timeout`` seconds come back unknown; their answers are
+        memoized when they arrive.
+        """
+        deadline = time.monotonic() + self.batch_timeout
+        fingerprint, index = self.index_for(items)
+        tier_lookup = {normalize_transcript(tier): tier for tier in tiers}
+        commands = [self.parse(transcript, tier_lookup, fingerprint, index) for transcript in transcripts]
+        fallbacks = {}
+        for position, command in enumerate(commands):
+            if command is None:
+                text = normalize_transcript(transcripts[position])
+                if text not in fallbacks:
+                    fallbacks[text] = self._executor().submit(self.parse_fallback, text, tier_lookup, fingerprint, index, deadline)
+        if fallbacks:
+            wait(fallbacks.values(), timeout=max(0, deadline - time.monotonic()))
+        for position, command in enumerate(commands):
+            if command is None:
+                future = fallbacks[normalize_transcript(transcripts[position])]
+                commands[position] = future.result() if future.done() else {'action': 'unknown', 'source': 'ai'}
+        return commands
+
+    def parse(self, transcript, tier_lookup, fingerprint, index):
+        """a command from the grammar or the memo, None if it needs the endpoint"""
+        text = normalize_transcript(transcript)
+        command = self.parse_grammar(text, tier_lookup, index)
+        if command:
+            return command
+
+        cached = self.results.get(self.memo_key(text, tier_lookup, fingerprint))
+        if cached is not None:
+            return dict(cached, source='cache')
+        return None
+
+    def memo_key(self, text, tier_lookup, fingerprint):
+        return (text, fingerprint, tuple(sorted(tier_lookup)))
+
+    def parse_fallback(self, text, tier_lookup, fingerprint, index, deadline):
+        try:
+            command = self.parse_ai(text, tier_lookup, index, timeout=max(1, min(self.timeout, deadline - time.monotonic())))
+        except Exception as e:
+            logger.warning(f"Command parsing fallback failed: {str(e)}")
+            return {'action': 'unknown', 'source': 'ai'}
+        self.results.put(self.memo_key(text, tier_lookup, fingerprint), command)
+        return command
+
+    def _executor(self):
+        with self.lock:
+            #recreated in forked workers
+            if self.pid != os.getpid():
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='command-parse')
+                self.pid = os.getpid()
+            return self.executor
+
+    def resolve(self, item_name, tier_name, tier_lookup, index, source):
+        tier_name = normalize_transcript(tier_name)
+        tier = tier_lookup.get(tier_name) or tier_lookup.get(TIER_HOMOPHONES.get(tier_name, ''))
+        match = index.match(item_name) if tier else None
+        if not match:
+            return None
+        item_id, matched_name, score = match
+        return {
+            'action': 'move',
+            'itemId': item_id,
+            'itemName': matched_name,
+            'targetTier': tier,
+            'score': round(score, 3),
+            'source': source,
+        }
+
+    def parse_grammar(self, text, tier_lookup, index):
+        match = COMMAND_GRAMMAR.match(text)
+        if not match:
+            return None
+        item = match.group('item') or match.group('item2')
+        tier = next(group for group in match.group('tier_pre', 'tier', 'tier2_pre', 'tier2') if group)
+        return self.resolve(item, tier, tier_lookup, index, 'grammar')
+
+    def parse_ai(self, text, tier_lookup, index, timeout=None):
+        names = sorted({name for name, _, _ in index.names})
+        prompt = PROMPT.format(
+            tiers=', '.join(tier_lookup.values()),
+            items=', '.join(f'"{name}"' for name in names),
+            transcript=text
+        )
+        payload = {
+            'messages': [{'role': 'user', 'content': prompt}],
+            'max_tokens': 200,
+            'temperature': 0.1
+        }
+        if self.model:
+            payload['model'] = self.model
+
+        request = urllib.request.Request(
+            self.api_url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+            data = json.load(response)
+        reply = data['choices'][0]['message']['content']
+        reply = re.sub(r'```(?:json)?', '', reply).strip()
+        parsed = json.loads(reply[reply.find('{'):reply.rfind('}') + 1])
+
+        if parsed.get('action') != 'move':
+            return {'action': 'unknown', 'source': 'ai'}
+        command = self.resolve(str(parsed.get('itemName', '')), str(parsed.get('targetTier', '')), tier_lookup, index, 'ai')
+        return command or {'action': 'unknown', 'source': 'ai'}
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Preload warmup and worker memory report
+
+With gunicorn's ``preload_app`` the master imports the app once and forks
+every worker from it, including the replacements for workers recycled by
+``max_requests``. Anything the master builds before forking is shared
+copy-on-write, so ``preload()`` does the remaining shared work there:
+compiling templates, loading MIME types and image plugins, and importing
+the numeric modules that are otherwise only imported on first use. Then
+``gc.freeze()`` moves everything into the permanent generation, so garbage
+collections in the workers do not write to (and un-share) those pages.
+
+Run this file against a running server to see each process's startup
+time and its shared and private memory, and how many more workers fit:
+
+Usage: python warmup.py [--pidfile /tmp/gunicorn.pid] [--json]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import logging
+import importlib
+import mimetypes
+
+logger = logging.getLogger(__name__)
+
+#imported lazily by the request paths that need them
+HEAVY_MODULES = ('numpy', 'scipy.fft', 'scipy.sparse', 'PIL.Image')
+REPORT_SUFFIX = '.startup.json'
+
+
+def warm(app, heavy_imports=True):
+    """build what the workers would otherwise each build on first use
+
+    Returns the seconds spent per step.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    with app.app_context():
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+    timings['templates'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    mimetypes.init()
+    timings['mimetypes'] = time.perf_counter() - started
+
+    if heavy_imports:
+        started = time.perf_counter()
+        for name in HEAVY_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                logger.warning(f"Preload could not import {name}: {str(e)}")
+        try:
+            from PIL import Image
+            Image.init()
+        except ImportError:
+            pass
+        timings['heavy_imports'] = time.perf_counter() - started
+    return timings
+
+
+def freeze():
+    """move every object tracked so far into the permanent GC generation"""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def preload(app, process_started, heavy_imports=True):
+    """warm up and freeze in the gunicorn master, returns the startup report"""
+    warmup_started = time.time()
+    timings = warm(app, heavy_imports)
+    report = {
+        'pid': os.getpid(),
+        'import_seconds': round(warmup_started - process_started, 3),
+        'warmup_seconds': {step: round(seconds, 3) for step, seconds in timings.items()},
+        'frozen_objects': freeze(),
+    }
+    report['ready_seconds'] = round(time.time() - process_started, 3)
+    return report
+
+
+def write_report(report, pidfile):
+    """keep the master's startup report next to its pidfile"""
+    if not pidfile:
+        return
+    try:
+        with open(pidfile + REPORT_SUFFIX, 'w') as f:
+            json.dump(report, f)
+    except OSError as e:
+        logger.warning(f"Could not write startup report: {str(e)}")
+
+
+def memory(pid='self'):
+    """resident, proportional, shared and private memory of a process in MB"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        'rss_mb': round(values.get('Rss', 0), 1),
+        'pss_mb': round(values.get('Pss', 0), 1),
+        'shared_mb': round(values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0), 1),
+        'private_mb': round(values.get('Private_Clean', 0) + values.get('Private_Dirty', 0), 1),
+    }
+
+
+def process_age(pid):
+    """seconds since a process started, from /proc"""
+    with open(f'/proc/{pid}/stat') as f:
+        #the command name may contain spaces, fields follow the last ')'
+        start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+    with open('/proc/uptime') as f:
+        uptime = float(f.read().split()[0])
+    return round(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 1)
+
+
+def child_pids(parent):
+    children = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except OSError:
+            continue
+        if ppid == parent:
+            children.append(int(name))
+    return sorted(children)
+
+
+def available_mb():
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def server_report(pidfile):
+    """startup report of a running master plus memory of it and its workers"""
+    with open(pidfile) as f:
+        master = int(f.read().strip())
+    try:
+        with open(pidfile + REPORT_SUFFIX) as f:
+            startup = json.load(f)
+    except (OSError, ValueError):
+        startup = None
+    workers = [dict(pid=pid, age_seconds=process_age(pid), **(memory(pid) or {})) for pid in child_pids(master)]
+    report = {
+        'master': dict(pid=master, age_seconds=process_age(master), **(memory(master) or {})),
+        'startup': startup,
+        'workers': workers,
+        'available_mb': available_mb(),
+    }
+    private = [worker['private_mb'] for worker in workers if 'private_mb' in worker]
+    if private:
+        #a new worker shares the master's pages and costs about what the others hold privately
+        per_worker = sum(private) / len(private)
+        report['private_mb_per_worker'] = round(per_worker, 1)
+        report['shared_mb_per_worker'] = round(sum(w['shared_mb'] for w in workers) / len(workers), 1)
+        if report['available_mb'] and per_worker:
+            report['additional_workers'] = int(report['available_mb'] // per_worker)
+    return report
+
+
+def format_report(report):
+    master = report['master']
+    lines = [f"master {master['pid']}: up {master['age_seconds']}s, rss {master.get('rss_mb')} MB"]
+    startup = report['startup']
+    if startup:
+        steps = ', '.join(f"{step} {seconds}s" for step, seconds in startup['warmup_seconds'].items())
+        lines.append(
+            f"  import {startup['import_seconds']}s, warmup {steps}, ready after {startup['ready_seconds']}s, "
+            f"{startup['frozen_objects']} objects frozen"
+        )
+    for worker in report['workers']:
+        lines.append(
+            f"worker {worker['pid']}: up {worker['age_seconds']}s, rss {worker.get('rss_mb')} MB "
+            f"(shared {worker.get('shared_mb')} MB, private {worker.get('private_mb')} MB)"
+        )
+    if 'private_mb_per_worker' in report:
+        line = f"each worker adds about {report['private_mb_per_worker']} MB private memory"
+        if 'additional_workers' in report:
+            line += f"; {report['available_mb']:.0f} MB available fits about {report['additional_workers']} more"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pidfile', default='/tmp/gunicorn.pid', help='pidfile of the gunicorn master')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    try:
+        report = server_report(args.pidfile)
+    except (OSError, ValueError) as e:
+        print(f"No running server found: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
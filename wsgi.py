@@ -5,5 +5,7 @@ WSGI entry point for production deployment
 import os
 from app import app
 
+application = app
+
 if __name__ == "__main__":
     app.run() 
\ No newline at end of file
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Gevent WSGI entry point for the async deployment mode
+
+Sockets, ssl and threading are patched before the app (and Redis, SQLite
+connections etc.) is imported, so slow uploads and downloads only block
+their own greenlet. Run with:
+
+    GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py
+"""
+from gevent import monkey
+monkey.patch_all()
+
+from app import app
+
+application = app
+
+if __name__ == "__main__":
+    app.run()